@@ -1,5 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from app.api.deps import get_db
@@ -11,7 +10,28 @@ from app.schemas import (
     ProductCreate,
     InventoryCreate,
 )
-from app.cache import delete_pattern
+from app.cache import (
+    delete_pattern,
+    cache_stats,
+    invalidate_local,
+)
+from app.services.rate_card import reload_rate_card, RATE_CARD_KEY
+from app.services.warehouse_index import warehouse_index
+from app.services import (
+    entity_cache,
+    catalog_snapshot,
+    stock_mirror,
+    serviceability,
+    cache_warmer,
+)
+from app.services.bulk_ingest import (
+    ingest,
+    read_records,
+    upsert_inventory,
+    inventory_upsert,
+    insert_products,
+    insert_warehouses,
+)
 
 router = APIRouter(
     prefix="/admin",
@@ -26,6 +46,8 @@ async def add_seller(payload: SellerCreate, db: AsyncSession = Depends(get_db)):
         db.add(seller)
         await db.commit()
         await db.refresh(seller)
+        await entity_cache.sellers.invalidate(seller.id)
+        catalog_snapshot.schedule_rebuild({entity_cache.sellers.kind})
         return seller
 
     except IntegrityError:
@@ -42,8 +64,14 @@ async def add_customer(payload: CustomerCreate, db: AsyncSession = Depends(get_d
     try:
         customer = Customer(**payload.model_dump())
         db.add(customer)
+        await db.flush()
+        # Committed together: a customer never exists without its rows
+        in_range = await serviceability.add_customer(db, customer)
         await db.commit()
         await db.refresh(customer)
+        await entity_cache.customers.invalidate(customer.id)
+        await serviceability.cache_customer(customer.id, in_range)
+        catalog_snapshot.schedule_rebuild({entity_cache.customers.kind})
         return customer
 
     except IntegrityError:
@@ -60,8 +88,17 @@ async def add_warehouse(payload: WarehouseCreate, db: AsyncSession = Depends(get
     try:
         warehouse = Warehouse(**payload.model_dump())
         db.add(warehouse)
+        await db.flush()
+        # Committed together: a warehouse never exists without its rows
+        in_range = await serviceability.add_warehouses(
+            db, [(warehouse.id, warehouse.latitude, warehouse.longitude)]
+        )
         await db.commit()
         await db.refresh(warehouse)
+        warehouse_index.add(warehouse.id, warehouse.latitude, warehouse.longitude)
+        await entity_cache.warehouses.invalidate(warehouse.id)
+        await serviceability.extend_cached(in_range)
+        catalog_snapshot.schedule_rebuild({entity_cache.warehouses.kind})
         return warehouse
 
     except IntegrityError:
@@ -80,6 +117,8 @@ async def add_product(payload: ProductCreate, db: AsyncSession = Depends(get_db)
         db.add(product)
         await db.commit()
         await db.refresh(product)
+        await entity_cache.products.invalidate(product.id)
+        catalog_snapshot.schedule_rebuild({entity_cache.products.kind})
         return product
 
     except IntegrityError:
@@ -94,32 +133,175 @@ async def add_product(payload: ProductCreate, db: AsyncSession = Depends(get_db)
 @router.post("/inventory")
 async def add_inventory(payload: InventoryCreate, db: AsyncSession = Depends(get_db)):
     try:
-        existing_inventory = (
-            await db.execute(
-                select(WarehouseInventory).where(
-                    WarehouseInventory.warehouse_id == payload.warehouse_id,
-                    WarehouseInventory.product_id == payload.product_id
-                )
-            )
-        ).scalars().first()
-
-        if existing_inventory:
-            existing_inventory.available_units = payload.available_units
+        async with stock_mirror.flushes_paused():
+            # Single-statement upsert: concurrent writers cannot create duplicates
+            result = (await db.execute(
+                inventory_upsert(db)
+                .values(**payload.model_dump())
+                .returning(WarehouseInventory)
+            )).scalar_one()
             await db.commit()
-            await db.refresh(existing_inventory)
-            result = existing_inventory
-        else:
-            inventory = WarehouseInventory(**payload.model_dump())
-            db.add(inventory)
-            await db.commit()
-            await db.refresh(inventory)
-            result = inventory
 
-        await delete_pattern(f"shipping:*:{payload.product_id}:*")
-        await delete_pattern(f"combined:*:{payload.product_id}:*")
+            # The new count replaces the hot counter and any unflushed delta
+            await stock_mirror.forget([(payload.warehouse_id, payload.product_id)])
+
+        cache_warmer.schedule([payload.product_id])
 
         return result
 
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/inventory/bulk")
+async def bulk_inventory(request: Request, db: AsyncSession = Depends(get_db)):
+    """ Streams NDJSON or CSV inventory rows and upserts them in batches.
+    Each batch resets the stock counters of its pairs as soon as it
+    commits; write-behind flushes wait only while a batch is being written.
+    """
+    affected_products = set()
+
+    async def forget_batch(pairs):
+        # The new counts replace the hot counters and any unflushed deltas
+        await stock_mirror.forget(pairs)
+        affected_products.update(product_id for _, product_id in pairs)
+
+    summary = await ingest(
+        db,
+        read_records(request),
+        InventoryCreate,
+        upsert_inventory,
+        on_commit=forget_batch,
+        guard=stock_mirror.flushes_paused
+    )
+
+    cache_warmer.schedule(affected_products)
+
+    return summary
+
+
+@router.post("/product/bulk")
+async def bulk_products(request: Request, db: AsyncSession = Depends(get_db)):
+    """ Streams NDJSON or CSV product rows and inserts them in batches. """
+    created = []
+
+    summary = await ingest(
+        db,
+        read_records(request),
+        ProductCreate,
+        insert_products,
+        on_commit=created.extend
+    )
+
+    # Drops any negative entries cached for these ids before they existed
+    await entity_cache.products.invalidate_many(created)
+
+    if summary["written"]:
+        catalog_snapshot.schedule_rebuild({entity_cache.products.kind})
+
+    return summary
+
+
+@router.post("/warehouse/bulk")
+async def bulk_warehouses(request: Request, db: AsyncSession = Depends(get_db)):
+    """ Streams NDJSON or CSV warehouse rows and inserts them in batches.
+    Each batch's serviceability rows commit with it. Committed warehouses
+    are added to the spatial index as they land, and to cached
+    serviceability once at the end.
+    """
+
+    created = []
+    in_range = []
+
+    async def write_warehouses(db, items):
+        rows = await insert_warehouses(db, items)
+        return rows, await serviceability.add_warehouses(db, rows)
+
+    def index_rows(result):
+        rows, entries = result
+        for row in rows:
+            warehouse_index.add(row.id, row.latitude, row.longitude)
+            created.append(row)
+        in_range.extend(entries)
+
+    summary = await ingest(
+        db,
+        read_records(request),
+        WarehouseCreate,
+        write_warehouses,
+        on_commit=index_rows
+    )
+
+    await entity_cache.warehouses.invalidate_many(row.id for row in created)
+    await serviceability.extend_cached(in_range)
+
+    if summary["written"]:
+        catalog_snapshot.schedule_rebuild({entity_cache.warehouses.kind})
+
+    return summary
+
+
+@router.post("/serviceability/rebuild")
+async def rebuild_serviceability(db: AsyncSession = Depends(get_db)):
+    """ Recomputes customer serviceability from scratch, e.g. after
+    customers or warehouses were loaded without going through /admin.
+    """
+    try:
+        rows = await serviceability.rebuild(db)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"rows": rows}
+
+
+@router.post("/cache/purge")
+async def purge_cache(pattern: str = Query(..., min_length=1)):
+    """ One-off manual purge of every key matching a Redis glob pattern.
+    Walks the keyspace with SCAN, so it never blocks Redis the way KEYS did.
+    """
+    deleted = await delete_pattern(pattern)
+    return {"pattern": pattern, "deleted": deleted}
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """ Hit, miss and eviction counters for each cache tier of this worker,
+    plus the catalog snapshot generation it has mapped and its hottest
+    quotes.
+    """
+    snapshot = catalog_snapshot.active_snapshot()
+    return {
+        **cache_stats(),
+        "catalog": snapshot.stats() if snapshot is not None else {"enabled": False},
+        "hot": [
+            {"key": key, "count": count, "error": error}
+            for key, count, error in cache_warmer.sketch.top(10)
+        ],
+    }
+
+
+@router.post("/cache/warm")
+async def warm_cache():
+    """ Schedules a background pass over every hot quote, e.g. after a
+    manual Redis flush.
+    """
+    cache_warmer.schedule()
+    return {"scheduled": True}
+
+
+@router.post("/rate-card/reload")
+async def reload_rates():
+    """ Recompiles the rate card file and swaps it in atomically, here and
+    (via pub/sub) in every other worker. An invalid file is rejected and
+    the active card keeps serving.
+    """
+
+    try:
+        rate_card = reload_rate_card()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Rate card rejected: {e}")
+
+    await invalidate_local(RATE_CARD_KEY)
+    return {"version": rate_card.version}
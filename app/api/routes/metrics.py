@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.metrics import render_prometheus
+
+router = APIRouter(tags=["Monitoring"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """ Prometheus text exposition of this worker's pricing pipeline metrics. """
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas import ReservationCreate
+from app.services import entity_cache, stock_mirror
+from app.services.warehouse_service import reserve_nearest_warehouse
+from app.api.deps import get_db
+from app.utils.fastjson import json_response
+
+router = APIRouter(
+    prefix="/reservations",
+    tags=["Reservations"]
+)
+
+
+@router.post("")
+async def create_reservation(
+    request: ReservationCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """ Holds stock at the nearest warehouse that has enough of it.
+    Flow: 1. Validate seller and product existence (entity cache).
+    2. Reserve atomically against the hot stock counters.
+    3. Return the reservation, which is released automatically unless it
+    is confirmed before it expires.
+    """
+
+    seller = await entity_cache.sellers.get(db, request.sellerId)
+
+    if not seller:
+        raise HTTPException(status_code=404, detail="Seller not found")
+
+    product = await entity_cache.products.get(db, request.productId)
+
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    try:
+        reservation_id, warehouse, expires_at = await reserve_nearest_warehouse(
+            db,
+            seller,
+            request.productId,
+            request.quantity,
+            request.ttlSeconds
+        )
+
+        return json_response({
+            "reservationId": reservation_id,
+            "warehouseId": warehouse.id,
+            "warehouseLocation": {
+                "lat": warehouse.latitude,
+                "long": warehouse.longitude
+            },
+            "quantity": request.quantity,
+            "expiresAt": expires_at
+        }, status_code=201)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{reservation_id}/confirm")
+async def confirm_reservation(reservation_id: str):
+    """ Turns a reservation into a permanent stock deduction. """
+
+    if not await stock_mirror.confirm(reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+
+    return {"reservationId": reservation_id, "status": "confirmed"}
+
+
+@router.delete("/{reservation_id}")
+async def release_reservation(reservation_id: str):
+    """ Returns a reservation's units to its warehouse straight away. """
+
+    if not await stock_mirror.release(reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+
+    return {"reservationId": reservation_id, "status": "released"}
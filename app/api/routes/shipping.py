@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models import Warehouse, Customer, Product
-from app.schemas import ShippingRequest
-from app.services.shipping_service import calculate_shipping
+from app.schemas import ShippingRequest, BatchShippingRequest, CartShippingRequest
+from app.services.shipping_service import calculate_shipping, price_shipment
+from app.services.batch_pricing import calculate_shipping_batch
+from app.services.cart_service import calculate_cart_shipping
+from app.services import entity_cache, cache_warmer
 from app.api.deps import get_db
-from app.cache import get_cached_data, set_cached_data
 from app.utils.distance import haversine
-from app.services.transport_strategy import transport_factory
+from app.utils.fastjson import json_response
+from app.utils.etag import make_etag, etag_matches
+from app.services.rate_card import current_rate_card
+
+# Bounds how long browsers and CDNs may reuse a quote after a rate card
+# reload without revalidating
+SHIPPING_CHARGE_MAX_AGE = int(os.getenv("SHIPPING_CHARGE_MAX_AGE", "60"))
 
 router = APIRouter(
     prefix="/shipping-charge",
@@ -21,51 +29,52 @@ async def get_shipping_charge(
     productId: int = Query(...),
     quantity: int = Query(1),
     deliverySpeed: str = Query(...),
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
     """ Calculates shipping charge from a specific warehouse to a customer. 
-    Flow: 1. Check Redis cache. 
-    2. Validate warehouse, customer, and product existence. 
+    Flow: 1. Validate warehouse, customer, and product existence (entity cache). 
+    2. Answer 304 if the client's ETag still matches the inputs. 
     3. Calculate geographic distance using Haversine formula. 
     4. Select transport strategy dynamically. 
     5. Compute shipping cost. 
-    6. Cache and return response. 
+    Every cached input is quantity-independent, so quotes for different
+    quantities share the same cache entries; only the arithmetic is redone.
     """
 
-    cache_key = f"shipping:{warehouseId}:{customerId}:{productId}:{quantity}:{deliverySpeed}"
-
-    cached_response = await get_cached_data(cache_key)
-    if cached_response:
-        return cached_response
-
     try:
-        warehouse = (
-            await db.execute(
-                select(Warehouse).where(Warehouse.id == warehouseId)
-            )
-        ).scalar_one_or_none()
+        warehouse = await entity_cache.warehouses.get(db, warehouseId)
 
         if not warehouse:
             raise HTTPException(status_code=404, detail="Warehouse not found")
 
-        customer = (
-            await db.execute(
-                select(Customer).where(Customer.id == customerId)
-            )
-        ).scalar_one_or_none()
+        customer = await entity_cache.customers.get(db, customerId)
 
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
 
-        product = (
-            await db.execute(
-                select(Product).where(Product.id == productId)
-            )
-        ).scalar_one_or_none()
+        product = await entity_cache.products.get(db, productId)
 
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
+        cache_warmer.record(cache_warmer.shipping_key(warehouseId, customerId, productId))
+
+        # The records themselves are the input versions: any change to a
+        # coordinate, weight or dimension, or to the rate card's contents,
+        # changes the tag
+        rate_card = current_rate_card()
+        etag = make_etag(
+            warehouse, customer, product, quantity, deliverySpeed, rate_card.fingerprint
+        )
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"max-age={SHIPPING_CHARGE_MAX_AGE}",
+        }
+
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
         distance = haversine(
             warehouse.latitude,
             warehouse.longitude,
@@ -73,32 +82,13 @@ async def get_shipping_charge(
             customer.longitude
         )
 
-        actual_weight = product.weight * quantity
-        volumetric_weight = (
-            (product.length * product.width * product.height) / 5000
-        ) * quantity
-
-        final_weight = max(actual_weight, volumetric_weight)
-
-        strategy, _ = transport_factory(distance, deliverySpeed)
-
-        base_cost = await strategy.calculate(distance, final_weight)
-
-        courier_charge = 10
-        express_charge = 0
-
-        if deliverySpeed == "express":
-            express_charge = 1.2 * final_weight
-
-        final_cost = base_cost + courier_charge + express_charge
+        breakdown = price_shipment(distance, product, quantity, deliverySpeed, rate_card)
 
         response = {
-            "shippingCharge": round(final_cost, 2)
+            "shippingCharge": breakdown["finalCost"]
         }
 
-        await set_cached_data(cache_key, response)
-
-        return response
+        return json_response(response, headers=headers)
 
     except HTTPException:
         raise
@@ -117,16 +107,6 @@ async def calculate_combined(
     3. Returns combined structured response. Delegates core business logic to service layer. 
     """
 
-    cache_key = (
-        f"combined:{request.sellerId}:{request.customerId}:"
-        f"{request.productId}:{request.quantity}:"
-        f"{request.deliverySpeed}"
-    )
-
-    cached_response = await get_cached_data(cache_key)
-    if cached_response:
-        return cached_response
-
     try:
         result = await calculate_shipping(
             db,
@@ -137,6 +117,10 @@ async def calculate_combined(
             request.deliverySpeed
         )
 
+        cache_warmer.record(cache_warmer.combined_key(
+            request.sellerId, request.customerId, request.productId
+        ))
+
         response = {
             "shippingCharge": result["finalCost"],
             "nearestWarehouse": {
@@ -145,9 +129,51 @@ async def calculate_combined(
             }
         }
 
-        await set_cached_data(cache_key, response)
+        return json_response(response)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/batch")
+async def batch_shipping_charge(
+    request: BatchShippingRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """ Batch variant of GET /shipping-charge for checkout pages.
+    Loads all referenced entities in bulk and prices every item in one
+    vectorized pass. Per-item failures are returned inline instead of
+    failing the whole request.
+    """
+
+    results = await calculate_shipping_batch(db, request.items)
+
+    return json_response({"results": results})
+
+
+@router.post("/cart")
+async def cart_shipping_charge(
+    request: CartShippingRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """ Quotes a multi-item cart as consolidated shipments: the fewest
+    warehouses that can fill every line (exact for small carts, a greedy
+    approximation for large ones), each priced once on the combined
+    chargeable weight of the lines it carries.
+    """
+
+    try:
+        result = await calculate_cart_shipping(
+            db,
+            request.sellerId,
+            request.customerId,
+            request.items,
+            request.deliverySpeed
+        )
 
-        return response
+        return json_response(result)
 
     except HTTPException:
         raise
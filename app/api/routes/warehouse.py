@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models import Seller
+from app.services import entity_cache
 from app.services.warehouse_service import get_nearest_warehouse
 from app.api.deps import get_db
+from app.utils.fastjson import json_response
 
 router = APIRouter(
     prefix="/warehouse",
@@ -23,9 +23,7 @@ async def nearest(
     3. Return minimal structured warehouse details. 
     """
 
-    seller = (
-        await db.execute(select(Seller).where(Seller.id == sellerId))
-    ).scalar_one_or_none()
+    seller = await entity_cache.sellers.get(db, sellerId)
 
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
@@ -38,13 +36,13 @@ async def nearest(
             quantity
         )
 
-        return {
+        return json_response({
             "warehouseId": warehouse.id,
             "warehouseLocation": {
                 "lat": warehouse.latitude,
                 "long": warehouse.longitude
             }
-        }
+        })
 
     except HTTPException:
         raise
@@ -0,0 +1,306 @@
+""" Offline repricing of ShippingRequest logs.
+
+Usage:
+    python -m app.batch requests.jsonl --output priced.jsonl --workers 8
+
+Reads one ShippingRequest JSON object per line, prices each record against a
+one-time snapshot of the database and writes one JSON result per line, in
+input order. Memory stays flat for arbitrarily large inputs because only a
+bounded window of chunks is in flight at any time.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.database import DATABASE_URL
+from app.models import Seller, Customer, Warehouse, Product, WarehouseInventory
+from app.schemas import ShippingRequest
+from app.services.entity_cache import (
+    SellerRecord,
+    CustomerRecord,
+    WarehouseRecord,
+    ProductRecord,
+)
+from app.services.serviceability import MAX_SERVICE_DISTANCE
+from app.services.shipping_service import price_shipment
+from app.utils.distance import haversine
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Snapshot(NamedTuple):
+    sellers: dict
+    customers: dict
+    warehouses: dict
+    products: dict
+    stock: dict
+
+
+async def _load_records(conn, model, record_type):
+    columns = [getattr(model, field) for field in record_type._fields]
+    rows = (await conn.execute(select(*columns))).all()
+    return {row[0]: record_type(*row) for row in rows}
+
+
+async def load_snapshot(database_url=DATABASE_URL):
+    """ Reads every table the pricing path needs in one pass. """
+
+    engine = create_async_engine(database_url)
+
+    try:
+        async with engine.connect() as conn:
+            stock = defaultdict(list)
+            # Same eligibility rules as the HTTP path: unlocated warehouses
+            # and unknown counts never ship
+            rows = (await conn.execute(
+                select(
+                    WarehouseInventory.product_id,
+                    WarehouseInventory.warehouse_id,
+                    WarehouseInventory.available_units
+                )
+                .join(Warehouse, WarehouseInventory.warehouse_id == Warehouse.id)
+                .where(
+                    WarehouseInventory.available_units.is_not(None),
+                    Warehouse.latitude.is_not(None),
+                    Warehouse.longitude.is_not(None)
+                )
+            )).all()
+
+            for product_id, warehouse_id, units in rows:
+                stock[product_id].append((warehouse_id, units))
+
+            return Snapshot(
+                sellers=await _load_records(conn, Seller, SellerRecord),
+                customers=await _load_records(conn, Customer, CustomerRecord),
+                warehouses=await _load_records(conn, Warehouse, WarehouseRecord),
+                products=await _load_records(conn, Product, ProductRecord),
+                stock=dict(stock),
+            )
+    finally:
+        await engine.dispose()
+
+
+_snapshot = None
+
+
+def _init_worker(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+
+@lru_cache(maxsize=65536)
+def _candidates(seller_id, product_id):
+    """ Warehouses stocking the product, nearest to the seller first, with
+    the same (distance, id) ordering get_nearest_warehouse uses.
+    """
+
+    seller = _snapshot.sellers[seller_id]
+    ranked = []
+
+    for warehouse_id, units in _snapshot.stock.get(product_id, ()):
+        warehouse = _snapshot.warehouses.get(warehouse_id)
+        if (
+            warehouse is None
+            or units is None
+            or warehouse.latitude is None
+            or warehouse.longitude is None
+        ):
+            continue
+        distance = haversine(
+            seller.latitude,
+            seller.longitude,
+            warehouse.latitude,
+            warehouse.longitude
+        )
+        ranked.append((distance, warehouse_id, units))
+
+    ranked.sort()
+    return tuple(ranked)
+
+
+def _error(status, detail):
+    return {"error": {"status": status, "detail": detail}}
+
+
+def _price(record):
+    try:
+        request = ShippingRequest.model_validate(record)
+    except ValidationError as e:
+        return _error(422, str(e))
+
+    seller = _snapshot.sellers.get(request.sellerId)
+    if not seller:
+        return _error(400, "Seller not found")
+
+    customer = _snapshot.customers.get(request.customerId)
+    if not customer:
+        return _error(400, "Customer not found")
+
+    product = _snapshot.products.get(request.productId)
+    if not product:
+        return _error(400, "Product not found")
+
+    warehouse = next(
+        (
+            _snapshot.warehouses[warehouse_id]
+            for _, warehouse_id, units in _candidates(request.sellerId, request.productId)
+            if units >= request.quantity
+        ),
+        None
+    )
+    if warehouse is None:
+        return _error(400, "No warehouse available with sufficient stock.")
+
+    distance = haversine(
+        warehouse.latitude,
+        warehouse.longitude,
+        customer.latitude,
+        customer.longitude
+    )
+
+    if distance > MAX_SERVICE_DISTANCE:
+        return _error(400, "Delivery location not supported.")
+
+    breakdown = price_shipment(
+        distance,
+        product,
+        request.quantity,
+        request.deliverySpeed
+    )
+
+    return {
+        "warehouseId": warehouse.id,
+        "warehouseLocation": {
+            "lat": warehouse.latitude,
+            "long": warehouse.longitude
+        },
+        **breakdown
+    }
+
+
+def price_chunk(lines):
+    """ Worker entry point: prices a list of (line_number, raw_line) and
+    returns (json_line, failed) pairs.
+    """
+
+    results = []
+
+    for line_number, line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            result = _error(422, str(e))
+        else:
+            try:
+                result = _price(record)
+            except Exception as e:
+                result = _error(400, str(e))
+
+        results.append((json.dumps({"line": line_number, **result}), "error" in result))
+
+    return results
+
+
+def _chunks(stream, size):
+    numbered = (
+        (line_number, line)
+        for line_number, line in enumerate(stream, start=1)
+        if line.strip()
+    )
+
+    while True:
+        chunk = list(itertools.islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(stream, output, snapshot, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Prices every line of `stream` and writes results to `output` in
+    input order. Returns (records, errors, elapsed_seconds).
+    """
+
+    workers = workers or os.cpu_count() or 1
+    window = workers * 2
+    records = 0
+    errors = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(snapshot,)
+    ) as executor:
+        in_flight = deque()
+
+        def drain_one():
+            nonlocal records, errors
+            for line, failed in in_flight.popleft().result():
+                records += 1
+                errors += failed
+                output.write(line)
+                output.write("\n")
+
+        for chunk in _chunks(stream, chunk_size):
+            in_flight.append(executor.submit(price_chunk, chunk))
+            if len(in_flight) >= window:
+                drain_one()
+
+        while in_flight:
+            drain_one()
+
+    return records, errors, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.batch",
+        description="Reprice a JSONL file of ShippingRequest records offline."
+    )
+    parser.add_argument("input", help="JSONL input file, or - for stdin")
+    parser.add_argument("--output", "-o", default="-", help="JSONL output file (default stdout)")
+    parser.add_argument("--workers", "-w", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args(argv)
+
+    snapshot = asyncio.run(load_snapshot(args.database_url))
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    try:
+        records, errors, elapsed = run(
+            source,
+            sink,
+            snapshot,
+            workers=args.workers,
+            chunk_size=args.chunk_size
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    rate = records / elapsed if elapsed else 0.0
+    print(
+        f"priced {records} records ({errors} errors) in {elapsed:.2f}s "
+        f"- {rate:,.0f} records/s",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
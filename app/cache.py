@@ -1,24 +1,272 @@
 import redis.asyncio as redis
-import json
+import asyncio
+import fnmatch
+import logging
 import os
+import time
+from collections import OrderedDict
+from app.metrics import CACHE_OPERATION_SECONDS, CACHE_REQUESTS
+from app.utils import fastjson
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 
+# In-process tier in front of Redis; LOCAL_CACHE_SIZE=0 disables it.
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", "10000"))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+PURGE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
 r = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
 
+_MISSING = object()
+
+_REDIS_GET = CACHE_OPERATION_SECONDS.labels("get")
+_REDIS_SET = CACHE_OPERATION_SECONDS.labels("set")
+_LOCAL_HITS = CACHE_REQUESTS.labels("local", "hit")
+_LOCAL_MISSES = CACHE_REQUESTS.labels("local", "miss")
+_REDIS_HITS = CACHE_REQUESTS.labels("redis", "hit")
+_REDIS_MISSES = CACHE_REQUESTS.labels("redis", "miss")
+
+
+class LocalCache:
+    """ Bounded LRU with per-entry expiry, used as the first cache tier.
+    Entries never outlive LOCAL_CACHE_TTL, which bounds staleness even if
+    an invalidation message is lost.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+
+        expires_at, value = entry
+
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def delete_pattern(self, pattern):
+        for key in [k for k in self._entries if fnmatch.fnmatchcase(k, pattern)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+local_cache = LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL) if LOCAL_CACHE_SIZE > 0 else None
+
+# Every in-process tier that pub/sub invalidations should reach
+_local_tiers = [local_cache] if local_cache is not None else []
+_invalidation_hooks = {}
+
+
+def register_local_tier(tier):
+    _local_tiers.append(tier)
+    return tier
+
+
+def on_invalidate(key, callback):
+    """ Runs callback() in every worker whenever `key` is invalidated, for
+    in-process state that lives outside the cache tiers.
+    """
+    _invalidation_hooks.setdefault(key, []).append(callback)
+
 
 async def get_cached_data(key):
-    data = await r.get(key)
+    if local_cache is not None:
+        value = local_cache.get(key)
+        if value is not _MISSING:
+            _LOCAL_HITS.inc()
+            return value
+        _LOCAL_MISSES.inc()
+
+    with _REDIS_GET.time():
+        data = await r.get(key)
+
     if data:
-        return json.loads(data)
+        _REDIS_HITS.inc()
+        value = fastjson.loads(data)
+        if local_cache is not None:
+            local_cache.set(key, value)
+        return value
+
+    _REDIS_MISSES.inc()
     return None
 
 
+async def get_remote_data(key):
+    """ Reads Redis directly, bypassing (and then refreshing) the local tier. """
+
+    with _REDIS_GET.time():
+        data = await r.get(key)
+
+    if not data:
+        return None
+
+    value = fastjson.loads(data)
+    if local_cache is not None:
+        local_cache.set(key, value)
+    return value
+
+
 async def set_cached_data(key, data, ttl=1800):
-    await r.setex(key, ttl, json.dumps(data))
+    with _REDIS_SET.time():
+        await r.set(key, fastjson.dumps(data), ex=ttl)
+    if local_cache is not None:
+        local_cache.set(key, data, ttl)
+
+
+async def invalidate_local(key):
+    """ Drops a key from every in-process tier, here and in other workers. """
+
+    for tier in _local_tiers:
+        tier.delete(key)
+
+    await r.publish(INVALIDATION_CHANNEL, key)
+
+
+async def invalidate_local_many(keys):
+    """ invalidate_local for many keys, published in one pipelined round trip. """
+
+    keys = list(keys)
+    if not keys:
+        return
+
+    for tier in _local_tiers:
+        for key in keys:
+            tier.delete(key)
+
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.publish(INVALIDATION_CHANNEL, key)
+    await pipe.execute()
 
 
 async def delete_pattern(pattern: str):
-    keys = await r.keys(pattern)
-    if keys:
-        await r.delete(*keys)
+    """ SCAN-based purge for one-off manual cleanups. Routine invalidation
+    never walks the keyspace: cached stock ladders are keyed on their
+    mirror's version and entities are invalidated by id.
+    """
+
+    deleted = 0
+    batch = []
+
+    async for key in r.scan_iter(match=pattern, count=PURGE_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= PURGE_BATCH_SIZE:
+            deleted += await r.unlink(*batch)
+            batch = []
+
+    if batch:
+        deleted += await r.unlink(*batch)
+
+    for tier in _local_tiers:
+        tier.delete_pattern(pattern)
+
+    # Other workers drop their local copies when they see this
+    await r.publish(INVALIDATION_CHANNEL, pattern)
+    return deleted
+
+
+def cache_stats():
+    return {
+        "local": local_cache.stats() if local_cache is not None else {"enabled": False},
+        "redis": {
+            "hits": _REDIS_HITS.value,
+            "misses": _REDIS_MISSES.value,
+        },
+    }
+
+
+async def listen_for_invalidations():
+    """ Applies invalidations published by any worker to this process's
+    local tier. Messages sent while disconnected are lost, so the local tier
+    is cleared, and every hook run, after every reconnect.
+    """
+
+    while True:
+        pubsub = r.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            for tier in _local_tiers:
+                tier.clear()
+            for callbacks in _invalidation_hooks.values():
+                for callback in callbacks:
+                    callback()
+
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+
+                target = message["data"]
+                is_pattern = any(char in target for char in "*?[")
+
+                for tier in _local_tiers:
+                    if is_pattern:
+                        tier.delete_pattern(target)
+                    else:
+                        tier.delete(target)
+
+                for callback in _invalidation_hooks.get(target, ()):
+                    callback()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Cache invalidation listener disconnected: %s", e)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def start_invalidation_listener():
+    if not _local_tiers and not _invalidation_hooks:
+        return None
+    return asyncio.create_task(listen_for_invalidations())
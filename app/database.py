@@ -1,17 +1,100 @@
+import logging
 import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 
 DATABASE_URL = os.getenv(
-    "DATABASE_URL", 
+    "DATABASE_URL",
     "postgresql+asyncpg://postgres:root@db:5432/shipping"
 )
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """ Statement count and cumulative DB time for one tracked scope.
+    Nested scopes roll their totals up into the enclosing one.
+    """
+
+    __slots__ = ("count", "duration", "parent")
+
+    def __init__(self, parent=None):
+        self.count = 0
+        self.duration = 0.0
+        self.parent = parent
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+
+_query_stats: ContextVar = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    """ Counts every statement executed in the current context (including
+    tasks spawned from it) until the block exits.
+    """
+
+    parent = _query_stats.get()
+    stats = QueryStats(parent)
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+        if parent is not None:
+            parent.count += stats.count
+            parent.duration += stats.duration
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+
+def instrument_engine(engine):
+    """ Attaches query counting and slow-query logging to an engine. """
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+engine = instrument_engine(create_async_engine(DATABASE_URL, echo=True))
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
     expire_on_commit=False
 )
 
-Base = declarative_base()
\ No newline at end of file
+# Factory for work that outlives a request (background cache refreshes,
+# snapshot rebuilds); tests point it at their own engine.
+session_factory = AsyncSessionLocal
+
+
+def background_session():
+    return session_factory()
+
+
+Base = declarative_base()
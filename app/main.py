@@ -1,16 +1,66 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.api.routes import admin, shipping, warehouse
-from app.database import engine, Base
+from app.api.routes import admin, shipping, warehouse, metrics, reservations
+from app.database import engine, AsyncSessionLocal, DEBUG
+from app.migrations import migrate
+from app.services.warehouse_index import warehouse_index, WarehousePoint
+from app.services.entity_cache import WarehouseRecord
+from app.services import catalog_snapshot, stock_mirror, cache_warmer
+from app.cache import start_invalidation_listener
+from app.metrics import MetricsMiddleware, QueryStatsMiddleware
 import app.models 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create all tables in the database
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Bring the schema up to date (only one worker migrates at a time)
+    await migrate(engine)
+
+    # Map the host's catalog snapshot (building it if this is the first
+    # worker up), then build the warehouse spatial index before serving
+    # traffic, from the snapshot when there is one.
+    async with AsyncSessionLocal() as db:
+        snapshot = await catalog_snapshot.ensure_snapshot(db)
+
+        if snapshot is not None:
+            warehouse_index.build(
+                WarehousePoint(row.id, row.latitude, row.longitude)
+                for row in map(WarehouseRecord._make, snapshot.rows("warehouse"))
+                if row.latitude is not None and row.longitude is not None
+            )
+        else:
+            await warehouse_index.load(db)
+
+    # Keep this worker's local cache tier in sync with other workers
+    invalidation_listener = start_invalidation_listener()
+
+    # Expire stale reservations and write stock deltas back to Postgres
+    write_behind = stock_mirror.start_write_behind()
+
+    # Replay the quotes that were hot before this worker started
+    cache_warmer.start_warmer()
+
     yield
 
+    await cache_warmer.stop_warmer()
+
+    for task in (invalidation_listener, write_behind):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # A snapshot generation cut off mid-write would be left behind half-built
+    await catalog_snapshot.stop_rebuilds()
+
+    # Deltas from the last interval would otherwise wait for another worker
+    await stock_mirror.flush()
+
+    await engine.dispose()
+
 app = FastAPI(
     title="Async Logistics Pricing Engine",
     version="1.0.0",
@@ -19,4 +69,11 @@ app = FastAPI(
 
 app.include_router(shipping.router, prefix="/api/v1")
 app.include_router(warehouse.router, prefix="/api/v1")
-app.include_router(admin.router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(admin.router, prefix="/api/v1")
+app.include_router(reservations.router, prefix="/api/v1")
+app.include_router(metrics.router)
+
+app.add_middleware(MetricsMiddleware)
+
+if DEBUG:
+    app.add_middleware(QueryStatsMiddleware)
@@ -0,0 +1,246 @@
+import functools
+import time
+from bisect import bisect_left
+from app.database import track_queries
+
+# Seconds; tuned for sub-millisecond cache hits up to multi-second DB stalls
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Timer:
+    __slots__ = ("_series", "_started")
+
+    def __init__(self, series):
+        self._series = series
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._series.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _CounterSeries:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        _registry.append(self)
+
+    def _new_series(self):
+        raise NotImplementedError()
+
+    def labels(self, *values):
+        """ Returns the series for these label values. Call sites on hot
+        paths should bind it once at import time.
+        """
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = self._new_series()
+        return series
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, series in sorted(self._series.items()):
+            lines.extend(self._render_series(values, series))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value, *values):
+        self.labels(*values).observe(value)
+
+    def time(self, *values):
+        return self.labels(*values).time()
+
+    def _render_series(self, values, series):
+        cumulative = 0
+        for bound, count in zip(self.buckets, series.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{bound}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values, 'le="+Inf"')
+        yield f"{self.name}_bucket{labels} {series.count}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {series.sum}"
+        yield f"{self.name}_count{labels} {series.count}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, *values, amount=1):
+        self.labels(*values).inc(amount)
+
+    def value(self, *values):
+        series = self._series.get(values)
+        return series.value if series is not None else 0
+
+    def _render_series(self, values, series):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {series.value}"
+
+
+def timed(series):
+    """ Decorator recording the wall time of an async function. """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with series.time():
+                return await func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def render_prometheus():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ Pure ASGI middleware counting error responses and unhandled
+    exceptions; avoids the per-request overhead of BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] >= 400:
+                ERRORS.inc(f"http_{message['status']}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            ERRORS.inc(type(e).__name__)
+            raise
+
+
+class QueryStatsMiddleware:
+    """ Debug-only middleware adding the request's SQL statement count and
+    total DB time as X-DB-Query-Count / X-DB-Time-Ms response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-query-count", str(stats.count).encode()),
+                        (b"x-db-time-ms", f"{stats.duration_ms:.2f}".encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+CACHE_OPERATION_SECONDS = Histogram(
+    "cache_operation_duration_seconds",
+    "Redis round-trip latency by operation.",
+    ("operation",)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Quote cache lookups by tier and result.",
+    ("tier", "result")
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database latency by pricing pipeline phase.",
+    ("phase",)
+)
+PRICING_STAGE_SECONDS = Histogram(
+    "pricing_stage_duration_seconds",
+    "Latency of in-process pricing stages.",
+    ("stage",)
+)
+ERRORS = Counter(
+    "errors_total",
+    "Error responses and unhandled exceptions by type.",
+    ("type",)
+)
+CACHE_WARM_KEYS = Counter(
+    "cache_warm_keys_total",
+    "Hot quotes replayed by the cache warmer, by outcome.",
+    ("outcome",)
+)
@@ -0,0 +1,111 @@
+""" Versioned schema migrations, applied at startup in place of create_all.
+
+Each migration runs once, in version order, and is recorded in the
+schema_version table. The whole run is one transaction, serialized across
+workers by an advisory lock on PostgreSQL. The baseline builds any missing
+table from the current models, so later migrations must tolerate objects
+that already exist (IF NOT EXISTS).
+"""
+
+import logging
+from sqlalchemy import text
+from app.database import Base
+from app.models import CustomerServiceability, StockFlush
+from app.services import serviceability
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+
+# Arbitrary constant shared by every worker taking the migration lock
+MIGRATION_LOCK_KEY = 727311
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline(conn):
+    Base.metadata.create_all(conn)
+
+
+def _inventory_indexes(conn):
+    # Keep one row per (warehouse, product): the largest count, which is
+    # the one eligibility checks already honoured, then the newest row
+    conn.execute(text("""
+        DELETE FROM warehouse_inventory
+        WHERE EXISTS (
+            SELECT 1 FROM warehouse_inventory AS other
+            WHERE other.warehouse_id = warehouse_inventory.warehouse_id
+              AND other.product_id = warehouse_inventory.product_id
+              AND (
+                  COALESCE(other.available_units, -1)
+                      > COALESCE(warehouse_inventory.available_units, -1)
+                  OR (
+                      COALESCE(other.available_units, -1)
+                          = COALESCE(warehouse_inventory.available_units, -1)
+                      AND other.id > warehouse_inventory.id
+                  )
+              )
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_inventory_warehouse_product "
+        "ON warehouse_inventory (warehouse_id, product_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_inventory_product_units "
+        "ON warehouse_inventory (product_id, available_units, warehouse_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_products_seller_id ON products (seller_id)"
+    ))
+
+
+def _customer_serviceability(conn):
+    Base.metadata.create_all(conn, tables=[CustomerServiceability.__table__])
+    serviceability.backfill(conn)
+
+
+def _stock_flushes(conn):
+    Base.metadata.create_all(conn, tables=[StockFlush.__table__])
+
+
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "inventory_indexes", _inventory_indexes),
+    (3, "customer_serviceability", _customer_serviceability),
+    (4, "stock_flushes", _stock_flushes),
+]
+
+
+def _apply(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"),
+            {"key": MIGRATION_LOCK_KEY}
+        )
+
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+    applied = set(conn.execute(text("SELECT version FROM schema_version")).scalars())
+
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        logger.info("Applying schema migration %d (%s)", version, name)
+        migration(conn)
+        conn.execute(
+            text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+            {"version": version, "name": name}
+        )
+
+    return max(version for version, _, _ in MIGRATIONS)
+
+
+async def migrate(engine):
+    """ Brings the database up to the latest schema version and returns it. """
+
+    async with engine.begin() as conn:
+        return await conn.run_sync(_apply)
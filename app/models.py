@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -35,7 +35,7 @@ class Product(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True)
-    seller_id = Column(Integer, ForeignKey("sellers.id"))
+    seller_id = Column(Integer, ForeignKey("sellers.id"), index=True)
     name = Column(String)
     weight = Column(Float)
     length = Column(Float)
@@ -47,8 +47,48 @@ class Product(Base):
 
 class WarehouseInventory(Base):
     __tablename__ = "warehouse_inventory"
+    __table_args__ = (
+        # One row per pair; the target of ON CONFLICT upserts
+        Index(
+            "uq_inventory_warehouse_product",
+            "warehouse_id",
+            "product_id",
+            unique=True
+        ),
+        # Index-only answer to "which warehouses hold product X with at
+        # least N units"
+        Index(
+            "ix_inventory_product_units",
+            "product_id",
+            "available_units",
+            "warehouse_id"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
     product_id = Column(Integer, ForeignKey("products.id"))
     available_units = Column(Integer)
+
+
+class CustomerServiceability(Base):
+    """ Warehouses within the service radius of each customer, with their
+    distance; maintained by app.services.serviceability.
+    """
+
+    __tablename__ = "customer_serviceability"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    distance_km = Column(Float, nullable=False)
+
+
+class StockFlush(Base):
+    """ Id of the last stock delta batch applied by
+    app.services.stock_mirror, written in the same transaction as the
+    batch so a retried flush can tell whether it already landed.
+    """
+
+    __tablename__ = "stock_flushes"
+
+    batch_id = Column(String, primary_key=True)
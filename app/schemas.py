@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel, Field
 
 
@@ -9,6 +10,37 @@ class ShippingRequest(BaseModel):
     deliverySpeed: str
 
 
+class ShippingChargeItem(BaseModel):
+    warehouseId: int
+    customerId: int
+    productId: int
+    quantity: int = 1
+    deliverySpeed: str
+
+
+class BatchShippingRequest(BaseModel):
+    items: list[ShippingChargeItem] = Field(..., max_length=5000)
+
+
+class CartLine(BaseModel):
+    productId: int
+    quantity: int = Field(1, gt=0)
+
+
+class CartShippingRequest(BaseModel):
+    sellerId: int
+    customerId: int
+    deliverySpeed: str
+    items: list[CartLine] = Field(..., min_length=1, max_length=1000)
+
+
+class ReservationCreate(BaseModel):
+    sellerId: int
+    productId: int
+    quantity: int = Field(..., gt=0)
+    ttlSeconds: Optional[int] = Field(None, gt=0, le=86400)
+
+
 class ShippingResponse(BaseModel):
     distance: float
     transportMode: str
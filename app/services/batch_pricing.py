@@ -0,0 +1,95 @@
+import math
+import numpy as np
+from app.services import entity_cache
+from app.services.rate_card import current_rate_card
+from app.services.shipping_service import VOLUMETRIC_DIVISOR
+from app.services.transport_strategy import transport_rates
+from app.utils.distance import haversine_array
+from app.metrics import PRICING_STAGE_SECONDS
+
+# Timed per batch; a single scalar call costs less than the timer itself
+_HAVERSINE_SECONDS = PRICING_STAGE_SECONDS.labels("haversine")
+
+
+async def calculate_shipping_batch(db, items):
+    """ Prices many warehouse -> customer quotes in one pass.
+    Flow: 1. Resolve every referenced warehouse, customer and product through
+    the entity cache, with one IN (...) query per table for the misses.
+    2. Report missing entities per item, in the same order the single-item
+    route checks them.
+    3. Compute distances, chargeable weights and strategy costs as arrays.
+    Returns one result per item, either {"shippingCharge": ...} or
+    {"error": {"status": ..., "detail": ...}}.
+    """
+
+    warehouses = await entity_cache.warehouses.get_many(
+        db, {item.warehouseId for item in items}
+    )
+    customers = await entity_cache.customers.get_many(
+        db, {item.customerId for item in items}
+    )
+    products = await entity_cache.products.get_many(
+        db, {item.productId for item in items}
+    )
+
+    results = [None] * len(items)
+    priced = []
+
+    for position, item in enumerate(items):
+        if item.warehouseId not in warehouses:
+            results[position] = _error(404, "Warehouse not found")
+        elif item.customerId not in customers:
+            results[position] = _error(404, "Customer not found")
+        elif item.productId not in products:
+            results[position] = _error(404, "Product not found")
+        else:
+            priced.append(position)
+
+    if not priced:
+        return results
+
+    def column(source, attribute, field):
+        return np.array(
+            [
+                getattr(source[getattr(items[i], attribute)], field)
+                for i in priced
+            ],
+            dtype=np.float64
+        )
+
+    warehouse_lat = column(warehouses, "warehouseId", "latitude")
+    warehouse_lon = column(warehouses, "warehouseId", "longitude")
+    customer_lat = column(customers, "customerId", "latitude")
+    customer_lon = column(customers, "customerId", "longitude")
+    weight = column(products, "productId", "weight")
+    length = column(products, "productId", "length")
+    width = column(products, "productId", "width")
+    height = column(products, "productId", "height")
+
+    quantity = np.array([items[i].quantity for i in priced], dtype=np.float64)
+    speeds = np.array([items[i].deliverySpeed for i in priced])
+    express = speeds == "express"
+
+    with _HAVERSINE_SECONDS.time():
+        distance = haversine_array(warehouse_lat, warehouse_lon, customer_lat, customer_lon)
+
+    actual_weight = weight * quantity
+    volumetric_weight = ((length * width * height) / VOLUMETRIC_DIVISOR) * quantity
+    final_weight = np.maximum(actual_weight, volumetric_weight)
+
+    rate_card = current_rate_card()
+    base_cost = distance * final_weight * transport_rates(distance, speeds, rate_card)
+    express_charge = np.where(express, rate_card.express_charge_per_kg * final_weight, 0)
+    final_cost = base_cost + rate_card.courier_charge + express_charge
+
+    for position, cost in zip(priced, final_cost.tolist()):
+        if math.isfinite(cost):
+            results[position] = {"shippingCharge": round(cost, 2)}
+        else:
+            results[position] = _error(400, "Invalid shipping data")
+
+    return results
+
+
+def _error(status, detail):
+    return {"error": {"status": status, "detail": detail}}
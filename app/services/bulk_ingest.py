@@ -0,0 +1,273 @@
+import contextlib
+import csv
+import inspect
+import json
+import os
+from collections import deque
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import Warehouse, Product, WarehouseInventory
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+# Keeps the response bounded when a whole file is malformed
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(stream):
+    """ Splits a byte stream into lines. Each chunk is split on its own and
+    the pieces of a line spanning several chunks are joined once, when its
+    newline arrives, so a long line costs linear time.
+    """
+
+    pieces = []
+
+    async for chunk in stream:
+        *lines, tail = chunk.split(b"\n")
+
+        if lines:
+            pieces.append(lines[0])
+            yield b"".join(pieces)
+            for line in lines[1:]:
+                yield line
+            pieces = []
+
+        if tail:
+            pieces.append(tail)
+
+    if pieces:
+        yield b"".join(pieces)
+
+
+class _QueuedLines:
+    """ Iterator over the decoded lines queued so far, so one csv.reader
+    can parse a whole stream that arrives asynchronously. Lines are only
+    queued once they complete a record, so the reader never runs dry
+    mid-record.
+    """
+
+    def __init__(self):
+        self._lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._lines:
+            raise StopIteration
+        return self._lines.popleft()
+
+    def extend(self, lines):
+        self._lines.extend(lines)
+
+
+async def read_records(request):
+    """ Streams (line_number, record) pairs from an NDJSON or CSV body.
+    CSV is selected by a text/csv content type and must start with a header
+    row; quoted fields may span lines, and a record is numbered by its first
+    line. Anything else is read as one JSON object per line. A record that
+    cannot be decoded or parsed is yielded as an exception instead of a dict.
+    """
+
+    is_csv = "csv" in request.headers.get("content-type", "")
+    queued = _QueuedLines()
+    reader = csv.reader(queued)
+    header = None
+    record = []
+    quotes = 0
+    start = 0
+    line_number = 0
+
+    async for raw in iter_lines(request.stream()):
+        line_number += 1
+
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # Whatever record this line belonged to cannot be recovered
+            record = []
+            quotes = 0
+            yield line_number, ValueError(f"Invalid UTF-8 at byte {e.start}: {e.reason}")
+            continue
+
+        if not is_csv:
+            line = text.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, e
+            continue
+
+        if not record:
+            text = text.strip()
+            if not text:
+                continue
+            start = line_number
+
+        record.append(text.rstrip("\r") + "\n")
+        quotes += text.count('"')
+
+        # An odd number of quotes leaves a quoted field open on the next line
+        if quotes % 2:
+            continue
+
+        queued.extend(record)
+        record = []
+        quotes = 0
+
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            yield start, ValueError(str(e))
+            continue
+
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(
+                f"Expected {len(header)} columns, got {len(values)}"
+            )
+            continue
+        yield start, dict(zip(header, values))
+
+    if record:
+        yield start, ValueError("Unterminated quoted field")
+
+
+def _record_error(summary, line_number, error):
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line_number, "error": str(error)})
+
+
+async def _committed(on_commit, result):
+    if on_commit is None:
+        return
+
+    outcome = on_commit(result)
+    if inspect.isawaitable(outcome):
+        await outcome
+
+
+async def _write_batch(db, batch, writer, on_commit, summary):
+    try:
+        result = await writer(db, [item for _, item in batch])
+        await db.commit()
+    except Exception:
+        await db.rollback()
+    else:
+        summary["written"] += len(batch)
+        await _committed(on_commit, result)
+        return
+
+    # Replay row by row so the failure is pinned to the offending lines
+    for line_number, item in batch:
+        try:
+            result = await writer(db, [item])
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            _record_error(summary, line_number, e)
+            continue
+
+        summary["written"] += 1
+        await _committed(on_commit, result)
+
+
+async def ingest(
+    db, records, schema, writer, on_commit=None, batch_size=None, guard=None
+):
+    """ Validates streamed records against `schema` and hands them to
+    `writer(db, items)` in batches, committing once per batch. Whatever the
+    writer returns is passed to `on_commit`, which may be a coroutine
+    function, once that batch is durable. `guard()`, when given, is an async
+    context manager held around each batch's write, commit and on_commit.
+    Returns counts plus per-line errors for rows that were rejected.
+    """
+
+    summary = {"processed": 0, "written": 0, "failed": 0, "errors": []}
+    batch_size = batch_size or BULK_BATCH_SIZE
+    guard = guard or contextlib.nullcontext
+    batch = []
+
+    async for line_number, record in records:
+        summary["processed"] += 1
+
+        if isinstance(record, Exception):
+            _record_error(summary, line_number, record)
+            continue
+
+        try:
+            item = schema.model_validate(record)
+        except ValidationError as e:
+            _record_error(summary, line_number, e)
+            continue
+
+        batch.append((line_number, item))
+
+        if len(batch) >= batch_size:
+            async with guard():
+                await _write_batch(db, batch, writer, on_commit, summary)
+            batch = []
+
+    if batch:
+        async with guard():
+            await _write_batch(db, batch, writer, on_commit, summary)
+
+    return summary
+
+
+def inventory_upsert(db):
+    """ INSERT ... ON CONFLICT (warehouse_id, product_id) DO UPDATE for the
+    session's dialect; the new count replaces the stored one.
+    """
+
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(WarehouseInventory)
+
+    return statement.on_conflict_do_update(
+        index_elements=[WarehouseInventory.warehouse_id, WarehouseInventory.product_id],
+        set_={"available_units": statement.excluded.available_units}
+    )
+
+
+async def upsert_inventory(db, items):
+    """ Upserts inventory rows with one executemany ON CONFLICT statement.
+    Later rows for the same pair win.
+    """
+
+    latest = {
+        (item.warehouse_id, item.product_id): item.available_units
+        for item in items
+    }
+
+    await db.execute(
+        inventory_upsert(db),
+        [
+            {"warehouse_id": warehouse_id, "product_id": product_id, "available_units": units}
+            for (warehouse_id, product_id), units in latest.items()
+        ]
+    )
+
+    return latest.keys()
+
+
+async def insert_products(db, items):
+    return (await db.execute(
+        insert(Product).returning(Product.id),
+        [item.model_dump() for item in items]
+    )).scalars().all()
+
+
+async def insert_warehouses(db, items):
+    return (await db.execute(
+        insert(Warehouse).returning(
+            Warehouse.id,
+            Warehouse.latitude,
+            Warehouse.longitude
+        ),
+        [item.model_dump() for item in items]
+    )).all()
@@ -0,0 +1,285 @@
+""" Warms the caches behind the hottest quotes.
+
+Every quote request is counted in a bounded Space-Saving sketch under its
+identity, shipping:{warehouse}:{customer}:{product} for GET /shipping-charge
+or combined:{seller}:{customer}:{product} for /calculate. Workers
+periodically merge their top keys into a Redis sorted set, so a freshly
+deployed worker knows what was hot before it started.
+
+Warming replays a quote's lookups with its own session: entity records,
+serviceability and, for combined quotes, the stock counters and warehouse
+search. It runs at startup, after inventory writes (for the products they
+touched) and on demand. Keys are replayed with bounded concurrency and at a
+bounded rate, so warming never competes with live traffic for the pool.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from app import cache, database
+from app.services import entity_cache, serviceability
+from app.services.rate_card import DEFAULT_SPEED
+from app.services.shipping_service import calculate_shipping
+from app.metrics import CACHE_WARM_KEYS
+
+WARM_SKETCH_SIZE = int(os.getenv("WARM_SKETCH_SIZE", "1000"))
+WARM_TOP_KEYS = int(os.getenv("WARM_TOP_KEYS", "200"))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", "4"))
+WARM_RATE = float(os.getenv("WARM_RATE", "50"))
+WARM_PUBLISH_INTERVAL = float(os.getenv("WARM_PUBLISH_INTERVAL", "60"))
+
+HOT_KEYS = "warm:hot"
+HOT_KEYS_TTL = 86400
+
+logger = logging.getLogger(__name__)
+
+_WARMED = CACHE_WARM_KEYS.labels("ok")
+_FAILED = CACHE_WARM_KEYS.labels("error")
+
+
+class SpaceSaving:
+    """ Heavy-hitters sketch over a stream of keys in O(capacity) memory.
+    Any key seen more than N / capacity times out of N is guaranteed to be
+    tracked, and each count overestimates the true one by at most `error`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._counts = {}
+        self._errors = {}
+        # Lazily updated: stale (count, key) entries are skipped on pop
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def add(self, key, weight=1):
+        count = self._counts.get(key)
+
+        if count is None:
+            if len(self._counts) >= self.capacity:
+                floor = self._evict()
+                self._errors[key] = floor
+                count = floor
+            else:
+                self._errors[key] = 0
+                count = 0
+
+        count += weight
+        self._counts[key] = count
+        heapq.heappush(self._heap, (count, next(self._seq), key))
+
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [
+                (count, next(self._seq), key) for key, count in self._counts.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                del self._counts[key]
+                del self._errors[key]
+                return count
+
+    def top(self, n):
+        """ The n highest-count keys as (key, count, error), largest first. """
+
+        return [
+            (key, count, self._errors[key])
+            for key, count in heapq.nlargest(n, self._counts.items(), key=lambda item: item[1])
+        ]
+
+    def clear(self):
+        self._counts.clear()
+        self._errors.clear()
+        self._heap = []
+
+
+sketch = SpaceSaving(WARM_SKETCH_SIZE)
+
+_task = None
+_wake = asyncio.Event()
+_pending = set()
+_full_pass = False
+
+
+def shipping_key(warehouse_id, customer_id, product_id):
+    return f"shipping:{warehouse_id}:{customer_id}:{product_id}"
+
+
+def combined_key(seller_id, customer_id, product_id):
+    return f"combined:{seller_id}:{customer_id}:{product_id}"
+
+
+def record(key):
+    sketch.add(key)
+
+
+async def publish():
+    """ Merges this worker's top keys into the shared hot set, keeping the
+    larger count when workers disagree.
+    """
+
+    top = sketch.top(WARM_TOP_KEYS)
+    if not top:
+        return
+
+    pipe = cache.r.pipeline(transaction=True)
+    pipe.zadd(HOT_KEYS, {key: count for key, count, _ in top}, gt=True)
+    pipe.zremrangebyrank(HOT_KEYS, 0, -WARM_TOP_KEYS - 1)
+    pipe.expire(HOT_KEYS, HOT_KEYS_TTL)
+    await pipe.execute()
+
+
+async def hot_keys():
+    """ This worker's top keys followed by the shared ones it lacks. """
+
+    keys = [key for key, _, _ in sketch.top(WARM_TOP_KEYS)]
+    shared = await cache.r.zrevrange(HOT_KEYS, 0, WARM_TOP_KEYS - 1)
+    seen = set(keys)
+    return keys + [key for key in shared if key not in seen]
+
+
+async def warm_key(key):
+    kind, first_id, customer_id, product_id = key.split(":")
+    first_id, customer_id, product_id = int(first_id), int(customer_id), int(product_id)
+
+    async with database.background_session() as db:
+        if kind == "combined":
+            await calculate_shipping(
+                db, first_id, customer_id, product_id, 1, DEFAULT_SPEED
+            )
+        elif kind == "shipping":
+            await entity_cache.warehouses.get(db, first_id)
+            await entity_cache.customers.get(db, customer_id)
+            await entity_cache.products.get(db, product_id)
+            await serviceability.warehouses_in_range(db, customer_id)
+
+
+async def warm(keys, concurrency=WARM_CONCURRENCY, rate=WARM_RATE):
+    """ Replays keys with at most `concurrency` in flight, starting at most
+    `rate` per second. Failures (a product out of stock, a deleted entity)
+    are counted and skipped. Returns the number warmed successfully.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    interval = 1 / rate if rate > 0 else 0
+    warmed = 0
+
+    async def run(key):
+        nonlocal warmed
+        try:
+            await warm_key(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _FAILED.inc()
+            logger.debug("Warming %s failed: %s", key, e)
+        else:
+            _WARMED.inc()
+            warmed += 1
+        finally:
+            semaphore.release()
+
+    tasks = []
+    try:
+        for key in keys:
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(key)))
+            if interval:
+                await asyncio.sleep(interval)
+
+        await asyncio.gather(*tasks)
+    finally:
+        # Cancelled mid-pass: take the in-flight replays down with us
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return warmed
+
+
+def schedule(product_ids=None):
+    """ Requests a warming pass in the background: of every hot key, or
+    only of those for the given products (after an inventory write).
+    """
+
+    global _full_pass
+
+    if product_ids is None:
+        _full_pass = True
+    else:
+        _pending.update(product_ids)
+    _wake.set()
+
+
+async def _next_pass():
+    global _full_pass
+
+    keys = await hot_keys()
+
+    if _full_pass:
+        _full_pass = False
+        _pending.clear()
+        return keys
+
+    products = {str(product_id) for product_id in _pending}
+    _pending.clear()
+    return [key for key in keys if key.rsplit(":", 1)[1] in products]
+
+
+async def run_warmer(publish_interval=WARM_PUBLISH_INTERVAL):
+    """ Background loop: a full pass at startup, then targeted passes on
+    request, publishing this worker's hot keys between passes.
+    """
+
+    schedule()
+
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), publish_interval)
+        except asyncio.TimeoutError:
+            pass
+
+        _wake.clear()
+
+        try:
+            if _full_pass or _pending:
+                await warm(await _next_pass())
+            await publish()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Cache warming failed: %s", e)
+
+
+def start_warmer():
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.create_task(run_warmer())
+    return _task
+
+
+async def stop_warmer():
+    """ Cancels the loop and any replay in flight, then waits for them. """
+
+    global _task
+
+    task, _task = _task, None
+    if task is None:
+        return
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,246 @@
+from app.services import entity_cache, serviceability, stock_mirror
+from app.services.rate_card import current_rate_card
+from app.services.shipping_service import VOLUMETRIC_DIVISOR, price_weight
+from app.utils.distance import haversine
+from app.metrics import PRICING_STAGE_SECONDS
+
+_PLAN_SECONDS = PRICING_STAGE_SECONDS.labels("shipment_plan")
+
+# Carts with at most this many distinct products are planned exactly; the
+# search visits up to 2 ** lines coverage states per shipment added.
+EXACT_PLAN_LINES = 8
+
+
+async def get_cart_stock(db, product_ids):
+    """ Returns {warehouse_id: (latitude, longitude, {product_id: units})}
+    for every located warehouse holding any of the products. Read from the
+    hot stock counters, like single-item eligibility, so units held by
+    open reservations are never offered and unflushed changes are seen.
+    """
+
+    stock = {}
+    for product_id, held in (await stock_mirror.get_stock_many(db, product_ids)).items():
+        for warehouse_id, (latitude, longitude, units) in held.items():
+            stock.setdefault(warehouse_id, (latitude, longitude, {}))[2][product_id] = units
+
+    return stock
+
+
+def _greedy_cover(candidates, target):
+    """ Each round picks the warehouse that can ship the most still
+    uncovered lines in full, the nearest one on ties. Returns the picks as
+    [(rank, mask)] in pick order; not minimal in general.
+    """
+
+    uncovered = target
+    picks = []
+
+    while uncovered:
+        best = None
+        remaining = []
+
+        for rank, mask in candidates:
+            gain = (mask & uncovered).bit_count()
+            if not gain:
+                continue
+
+            remaining.append((rank, mask))
+            if best is None or gain > best[0] or (gain == best[0] and rank < best[1]):
+                best = (gain, rank, mask)
+
+        _, rank, mask = best
+        picks.append((rank, mask))
+        uncovered &= ~mask
+        candidates = remaining
+
+    return picks
+
+
+def _exact_cover(candidates, target):
+    """ Fewest warehouses covering `target`, then the least total distance
+    to them. Breadth-first over coverage masks, one shipment per layer,
+    keeping the best way to reach each mask. Returns the picks as
+    [(rank, mask)] nearest first.
+    """
+
+    # A warehouse that ships a subset of what a nearer one ships is never
+    # needed in the best cover
+    candidates = [
+        (rank, mask) for rank, mask in candidates
+        if not any(
+            other != mask and other & mask == mask and other_rank < rank
+            for other_rank, other in candidates
+        )
+    ]
+
+    layer = {0: (0.0, ())}
+
+    while target not in layer:
+        following = {}
+
+        for covered, (distance, picks) in layer.items():
+            for rank, mask in candidates:
+                if not mask & ~covered:
+                    continue
+
+                entry = (distance + rank[0], tuple(sorted(picks + ((rank, mask),))))
+                reached = covered | mask
+                if reached not in following or entry < following[reached]:
+                    following[reached] = entry
+
+        layer = following
+
+    return list(layer[target][1])
+
+
+def plan_shipments(latitude, longitude, demand, stock):
+    """ Covers the cart with as few warehouses as possible. Carts of up to
+    EXACT_PLAN_LINES products are searched exactly, preferring the least
+    total distance from (latitude, longitude) among the smallest covers, so
+    single-line carts land on the same warehouse as get_nearest_warehouse.
+    Larger carts fall back to greedy set cover, which may use more
+    warehouses than necessary.
+    `demand` is {product_id: quantity}. Returns (shipments, unserved) where
+    shipments is [(warehouse_id, [product_id, ...])]; each line ships from
+    the first warehouse listed that can fill it.
+    """
+
+    products = list(demand)
+    bit = {product_id: 1 << position for position, product_id in enumerate(products)}
+
+    # Warehouses that can fill exactly the same lines are interchangeable;
+    # only the nearest of each group can ever be picked.
+    candidates = {}
+    for warehouse_id, (lat, lon, held) in stock.items():
+        mask = 0
+        for product_id, units in held.items():
+            if units >= demand.get(product_id, units + 1):
+                mask |= bit[product_id]
+
+        if not mask:
+            continue
+
+        rank = (haversine(latitude, longitude, lat, lon), warehouse_id)
+        if mask not in candidates or rank < candidates[mask]:
+            candidates[mask] = rank
+
+    candidates = [(rank, mask) for mask, rank in candidates.items()]
+
+    reachable = 0
+    for _, mask in candidates:
+        reachable |= mask
+
+    if len(products) <= EXACT_PLAN_LINES:
+        picks = _exact_cover(candidates, reachable)
+    else:
+        picks = _greedy_cover(candidates, reachable)
+
+    uncovered = reachable
+    shipments = []
+
+    for (_, warehouse_id), mask in picks:
+        assigned = mask & uncovered
+        if not assigned:
+            continue
+
+        shipments.append((
+            warehouse_id,
+            [product_id for product_id in products if assigned & bit[product_id]]
+        ))
+        uncovered &= ~mask
+
+    unserved = [product_id for product_id in products if not reachable & bit[product_id]]
+
+    return shipments, unserved
+
+
+async def calculate_cart_shipping(db, seller_id, customer_id, lines, delivery_speed):
+    """ Quotes a whole cart from one seller to one customer.
+    Flow: 1. Validate seller, customer and every product (entity cache),
+    and reject customers no warehouse can serve.
+    2. Read stock for all cart products from the hot counters.
+    3. Cover the cart with as few warehouses as possible (plan_shipments;
+    exact for small carts, greedy beyond EXACT_PLAN_LINES products).
+    4. Combine each shipment's lines into one chargeable weight, the larger
+    of its total actual and total volumetric weight, and price it once.
+    """
+
+    seller = await entity_cache.sellers.get(db, seller_id)
+
+    if not seller:
+        raise Exception("Seller not found")
+
+    customer = await entity_cache.customers.get(db, customer_id)
+
+    if not customer:
+        raise Exception("Customer not found")
+
+    if not await serviceability.warehouses_in_range(db, customer_id):
+        raise Exception("Delivery location not supported.")
+
+    # Repeated products are one line: they must ship from the same place
+    demand = {}
+    for line in lines:
+        demand[line.productId] = demand.get(line.productId, 0) + line.quantity
+
+    products = await entity_cache.products.get_many(db, demand)
+
+    for product_id in demand:
+        if product_id not in products:
+            raise Exception(f"Product {product_id} not found")
+
+    stock = await get_cart_stock(db, list(demand))
+
+    with _PLAN_SECONDS.time():
+        plan, unserved = plan_shipments(seller.latitude, seller.longitude, demand, stock)
+
+    if unserved:
+        raise Exception(
+            "No warehouse available with sufficient stock for products "
+            + ", ".join(str(product_id) for product_id in unserved)
+            + "."
+        )
+
+    rate_card = current_rate_card()
+    shipments = []
+    total = 0
+
+    for warehouse_id, product_ids in plan:
+        latitude, longitude, _ = stock[warehouse_id]
+
+        distance = await serviceability.distance(db, customer_id, warehouse_id)
+
+        if distance is None:
+            raise Exception("Delivery location not supported.")
+
+        actual_weight = 0
+        volumetric_weight = 0
+        for product_id in product_ids:
+            product = products[product_id]
+            actual_weight += product.weight * demand[product_id]
+            volumetric_weight += (
+                (product.length * product.width * product.height) / VOLUMETRIC_DIVISOR
+            ) * demand[product_id]
+
+        final_weight = max(actual_weight, volumetric_weight)
+        breakdown = price_weight(distance, final_weight, delivery_speed, rate_card)
+        total += breakdown["finalCost"]
+
+        shipments.append({
+            "warehouseId": warehouse_id,
+            "warehouseLocation": {
+                "lat": latitude,
+                "long": longitude
+            },
+            "items": [
+                {"productId": product_id, "quantity": demand[product_id]}
+                for product_id in product_ids
+            ],
+            "chargeableWeight": round(final_weight, 2),
+            **breakdown
+        })
+
+    return {
+        "shippingCharge": round(total, 2),
+        "shipments": shipments
+    }
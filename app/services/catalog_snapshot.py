@@ -0,0 +1,453 @@
+""" Host-wide, read-only catalog snapshot shared by every worker.
+
+Each generation is a directory of column files (.npy, plus a UTF-8 blob for
+strings) written once and then memory-mapped read-only by every worker, so
+the page cache holds a single copy per host however many workers run.
+A CURRENT file names the active generation; writers build a new directory
+and swap CURRENT with os.replace, so readers only ever see complete
+generations. Tables that have not changed since the previous generation
+are hard-linked into the new one rather than dumped again. Lookups that
+miss the snapshot (rows created after it was written) fall through to the
+entity cache and the database.
+"""
+
+import asyncio
+import fcntl
+import logging
+import math
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+import numpy as np
+from sqlalchemy import select, Float, Integer
+from app.cache import on_invalidate, invalidate_local
+from app import database
+
+# Unset disables the snapshot; every worker on a host must use the same path
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR")
+# Admin writes landing within this window share one rebuild
+CATALOG_REBUILD_DELAY = float(os.getenv("CATALOG_REBUILD_DELAY", "1"))
+CATALOG_SNAPSHOT_KEY = "catalog-snapshot"
+KEEP_GENERATIONS = 3
+SNAPSHOT_FETCH_SIZE = 10000
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+_INT_NULL = np.iinfo(np.int64).min
+
+logger = logging.getLogger(__name__)
+
+# kind -> (model, field names), registered by the entity caches
+_tables = {}
+
+
+def register_table(kind, model, fields):
+    if "id" not in fields:
+        raise ValueError(f"{kind}: snapshot tables need an id field")
+    _tables[kind] = (model, tuple(fields))
+
+
+def _column_kind(model, field):
+    column_type = getattr(model, field).type
+    if isinstance(column_type, Float):
+        return "float"
+    if isinstance(column_type, Integer):
+        return "int"
+    return "str"
+
+
+class _ColumnWriter:
+    """ Accumulates one column a chunk of rows at a time, already in its
+    compact on-disk form, then writes its files. Both steps are blocking
+    and meant to run off the event loop.
+    """
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self._chunks = []
+
+    def add(self, values):
+        if self.kind == "float":
+            self._chunks.append(np.array(
+                [math.nan if value is None else value for value in values],
+                dtype=np.float64
+            ))
+        elif self.kind == "int":
+            self._chunks.append(np.array(
+                [_INT_NULL if value is None else value for value in values],
+                dtype=np.int64
+            ))
+        else:
+            encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+            self._chunks.append((
+                np.array([len(value) for value in encoded], dtype=np.int64),
+                np.array([value is None for value in values], dtype=bool),
+                b"".join(encoded)
+            ))
+
+    def write(self):
+        if self.kind != "str":
+            dtype = np.float64 if self.kind == "float" else np.int64
+            np.save(self.path + ".npy", np.concatenate(self._chunks or [np.zeros(0, dtype)]))
+            return
+
+        lengths = np.concatenate([c[0] for c in self._chunks] or [np.zeros(0, np.int64)])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(self.path + ".offsets.npy", offsets)
+        np.save(self.path + ".null.npy", np.concatenate(
+            [c[1] for c in self._chunks] or [np.zeros(0, bool)]
+        ))
+        with open(self.path + ".bin", "wb") as sink:
+            for _, _, blob in self._chunks:
+                sink.write(blob)
+
+
+def _add_rows(writers, rows):
+    for position, writer in enumerate(writers):
+        writer.add([row[position] for row in rows])
+
+
+def _write_columns(writers):
+    for writer in writers:
+        writer.write()
+
+
+class _Column:
+    """ Read-only view of one mapped column; value(i) returns a Python
+    scalar, or None where the source row was NULL.
+    """
+
+    def __init__(self, path, kind):
+        self.kind = kind
+        if kind == "str":
+            self.offsets = np.load(path + ".offsets.npy", mmap_mode="r")
+            self.nulls = np.load(path + ".null.npy", mmap_mode="r")
+            self.blob = (
+                np.memmap(path + ".bin", dtype=np.uint8, mode="r")
+                if self.offsets[-1] else np.zeros(0, dtype=np.uint8)
+            )
+        else:
+            self.values = np.load(path + ".npy", mmap_mode="r")
+
+    def value(self, row):
+        if self.kind == "float":
+            value = self.values.item(row)
+            return None if math.isnan(value) else value
+        if self.kind == "int":
+            value = self.values.item(row)
+            return None if value == _INT_NULL else value
+        if self.nulls.item(row):
+            return None
+        return self.blob[self.offsets.item(row):self.offsets.item(row + 1)].tobytes().decode("utf-8")
+
+
+class _Table:
+    def __init__(self, directory, kind, model, fields):
+        self.ids = np.load(os.path.join(directory, f"{kind}.id.npy"), mmap_mode="r")
+        self.columns = [
+            _Column(os.path.join(directory, f"{kind}.{field}"), _column_kind(model, field))
+            for field in fields
+        ]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, entity_id):
+        try:
+            row = int(np.searchsorted(self.ids, entity_id))
+        except OverflowError:
+            return None
+        if row < len(self.ids) and self.ids.item(row) == entity_id:
+            return row
+        return None
+
+
+class CatalogSnapshot:
+    """ One mapped generation. Rows come back as tuples in the field order
+    the table was registered with.
+    """
+
+    def __init__(self, directory, generation):
+        self.generation = generation
+        path = os.path.join(directory, generation)
+        self._tables = {
+            kind: _Table(path, kind, model, fields)
+            for kind, (model, fields) in _tables.items()
+            if os.path.exists(os.path.join(path, f"{kind}.id.npy"))
+        }
+
+    def lookup(self, kind, entity_id):
+        table = self._tables.get(kind)
+        if table is None:
+            return None
+        row = table.find(entity_id)
+        if row is None:
+            return None
+        return tuple(column.value(row) for column in table.columns)
+
+    def rows(self, kind):
+        table = self._tables.get(kind)
+        if table is None:
+            return
+        for row in range(len(table)):
+            yield tuple(column.value(row) for column in table.columns)
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "rows": {kind: len(table) for kind, table in self._tables.items()},
+        }
+
+
+_active = None
+
+
+def active_snapshot():
+    return _active
+
+
+def lookup(kind, entity_id):
+    snapshot = _active
+    if snapshot is None:
+        return None
+    return snapshot.lookup(kind, entity_id)
+
+
+def _current_generation(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as source:
+            return source.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def attach(directory=None):
+    """ Maps the generation CURRENT points at, unless it is already mapped.
+    Returns the active snapshot, or None when there is nothing to attach.
+    """
+
+    global _active
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    if not directory:
+        return None
+
+    generation = _current_generation(directory)
+    if generation is None:
+        return _active
+
+    if _active is None or _active.generation != generation:
+        _active = CatalogSnapshot(directory, generation)
+
+    return _active
+
+
+def detach():
+    global _active
+    _active = None
+
+
+@asynccontextmanager
+async def _writer_lock(directory):
+    """ Host-wide lock so workers starting together build one snapshot. """
+
+    fd = os.open(os.path.join(directory, LOCK_FILE), os.O_CREAT | os.O_RDWR)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(0.05)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _reuse(previous, staging, kind):
+    """ Hard-links one table's files from the previous generation; files
+    are never modified once written, so both generations can share them.
+    False when the previous generation does not have the table.
+    """
+
+    names = [name for name in os.listdir(previous) if name.startswith(kind + ".")]
+    if f"{kind}.id.npy" not in names:
+        return False
+
+    for name in names:
+        try:
+            os.link(os.path.join(previous, name), os.path.join(staging, name))
+        except OSError:
+            shutil.copy2(os.path.join(previous, name), os.path.join(staging, name))
+
+    return True
+
+
+def _prune(directory, keep):
+    # Workers still mapping a removed generation keep their pages until
+    # they unmap; unlinking never invalidates an existing mapping.
+    generations = sorted(
+        name for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name)) and not name.endswith(".tmp")
+    )
+    for name in generations[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _publish(directory, staging, generation):
+    os.rename(staging, os.path.join(directory, generation))
+
+    pointer = os.path.join(directory, CURRENT_FILE + ".tmp")
+    with open(pointer, "w", encoding="utf-8") as sink:
+        sink.write(generation)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    _prune(directory, KEEP_GENERATIONS)
+
+
+async def write_snapshot(db, directory=None, kinds=None):
+    """ Writes a new generation and points CURRENT at it. Only the tables
+    in `kinds` (all of them when None) are dumped from the database; the
+    rest are carried over from the current generation when it has them.
+    Rows are streamed SNAPSHOT_FETCH_SIZE at a time and encoded and written
+    in a worker thread, so the event loop keeps serving requests meanwhile.
+    Returns the generation name.
+    """
+
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    previous = _current_generation(directory)
+    generation = f"{time.time_ns():020d}-{os.getpid()}"
+    staging = os.path.join(directory, generation + ".tmp")
+    os.makedirs(staging)
+
+    try:
+        for kind, (model, fields) in _tables.items():
+            if kinds is not None and kind not in kinds and previous is not None:
+                if await asyncio.to_thread(
+                    _reuse, os.path.join(directory, previous), staging, kind
+                ):
+                    continue
+
+            writers = [
+                _ColumnWriter(
+                    os.path.join(staging, f"{kind}.{field}"),
+                    _column_kind(model, field)
+                )
+                for field in fields
+            ]
+
+            # Rows are ordered by id, so the id column doubles as the
+            # sorted index searched on lookup
+            result = await db.stream(
+                select(*(getattr(model, field) for field in fields))
+                .order_by(model.id)
+                .execution_options(yield_per=SNAPSHOT_FETCH_SIZE)
+            )
+            async for rows in result.partitions():
+                await asyncio.to_thread(_add_rows, writers, rows)
+
+            await asyncio.to_thread(_write_columns, writers)
+
+        await asyncio.to_thread(_publish, directory, staging, generation)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return generation
+
+
+async def ensure_snapshot(db, directory=None):
+    """ Startup path: attach to the host's snapshot, building it first only
+    if no worker has done so yet.
+    """
+
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    if not directory:
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+
+    if _current_generation(directory) is None:
+        async with _writer_lock(directory):
+            if _current_generation(directory) is None:
+                await write_snapshot(db, directory)
+
+    return attach(directory)
+
+
+async def rebuild(db, directory=None, kinds=None):
+    """ Writes a new generation with the tables in `kinds` refreshed, maps
+    it here and tells other workers to map it too.
+    """
+
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    async with _writer_lock(directory):
+        await write_snapshot(db, directory, kinds)
+    snapshot = attach(directory)
+    await invalidate_local(CATALOG_SNAPSHOT_KEY)
+    return snapshot
+
+
+_rebuild_task = None
+# Tables written since the last rebuild started
+_rebuild_kinds = set()
+
+
+async def _rebuild_when_idle(session_factory):
+    global _rebuild_kinds
+
+    while _rebuild_kinds:
+        await asyncio.sleep(CATALOG_REBUILD_DELAY)
+        kinds, _rebuild_kinds = _rebuild_kinds, set()
+
+        try:
+            async with session_factory() as db:
+                await rebuild(db, kinds=kinds)
+        except Exception as e:
+            # Retried with the next write to any table
+            _rebuild_kinds |= kinds
+            logger.warning("Catalog snapshot rebuild failed: %s", e)
+            break
+
+
+def schedule_rebuild(kinds, session_factory=None):
+    """ Called after admin writes to the tables in `kinds`; coalesces
+    bursts into one rebuild of the tables written.
+    """
+
+    global _rebuild_task
+
+    if not CATALOG_SNAPSHOT_DIR:
+        return None
+
+    _rebuild_kinds.update(kinds)
+
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(
+            _rebuild_when_idle(session_factory or database.background_session)
+        )
+
+    return _rebuild_task
+
+
+async def stop_rebuilds():
+    """ Shutdown path: lets a scheduled or running rebuild finish, so no
+    generation is cut off mid-write.
+    """
+
+    if _rebuild_task is not None and not _rebuild_task.done():
+        await _rebuild_task
+
+
+def _attach_from_broadcast():
+    try:
+        attach()
+    except Exception as e:
+        logger.warning("Could not map catalog snapshot: %s", e)
+
+
+on_invalidate(CATALOG_SNAPSHOT_KEY, _attach_from_broadcast)
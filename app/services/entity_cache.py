@@ -0,0 +1,185 @@
+import asyncio
+import os
+from typing import NamedTuple, Optional
+from sqlalchemy import select
+from app import database
+from app.models import Seller, Customer, Warehouse, Product
+from app.services import catalog_snapshot
+from app.cache import (
+    LocalCache,
+    register_local_tier,
+    invalidate_local,
+    invalidate_local_many,
+    _MISSING,
+)
+from app.metrics import DB_QUERY_SECONDS
+
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "100000"))
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "3600"))
+# Ids that do not exist are remembered as None for this long, so repeated
+# lookups of a bad id stop reaching the database; creating the row through
+# /admin clears the entry straight away.
+NEGATIVE_ENTITY_TTL = float(os.getenv("NEGATIVE_ENTITY_TTL", "30"))
+
+
+class SellerRecord(NamedTuple):
+    id: int
+    name: Optional[str]
+    latitude: float
+    longitude: float
+
+
+class CustomerRecord(NamedTuple):
+    id: int
+    name: Optional[str]
+    latitude: float
+    longitude: float
+
+
+class WarehouseRecord(NamedTuple):
+    id: int
+    name: Optional[str]
+    latitude: float
+    longitude: float
+    capacity: Optional[int]
+
+
+class ProductRecord(NamedTuple):
+    id: int
+    seller_id: Optional[int]
+    name: Optional[str]
+    weight: float
+    length: float
+    width: float
+    height: float
+
+
+_tier = register_local_tier(LocalCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL))
+
+_ENTITY_QUERY = DB_QUERY_SECONDS.labels("entity_lookup")
+
+
+def entity_key(kind, entity_id):
+    return f"entity:{kind}:{entity_id}"
+
+
+class EntityCache:
+    """ Read-through cache of immutable records for one model.
+    Misses that arrive in the same event-loop tick are resolved together
+    with a single IN (...) query, so a burst of cold requests costs one
+    round trip per model rather than one per request. That query runs on
+    its own session: it serves many callers and must not borrow, or
+    outlive, any one request's session.
+    """
+
+    def __init__(self, kind, model, record_type):
+        self.kind = kind
+        self.model = model
+        self.record_type = record_type
+        self._columns = [getattr(model, field) for field in record_type._fields]
+        self._queue = []
+        self._pending = {}
+        self._flush_task = None
+        catalog_snapshot.register_table(kind, model, record_type._fields)
+
+    def _lookup(self, entity_id):
+        # The host-wide snapshot is read in place rather than copied into
+        # this worker's tier, so its memory stays shared across workers.
+        row = catalog_snapshot.lookup(self.kind, entity_id)
+        if row is not None:
+            return self.record_type(*row)
+        return _tier.get(entity_key(self.kind, entity_id))
+
+    def _store(self, record):
+        _tier.set(entity_key(self.kind, record.id), record)
+
+    def _store_missing(self, entity_id):
+        _tier.set(entity_key(self.kind, entity_id), None, NEGATIVE_ENTITY_TTL)
+
+    async def get(self, db, entity_id):
+        record = self._lookup(entity_id)
+        if record is not _MISSING:
+            return record
+
+        future = self._pending.get(entity_id)
+
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[entity_id] = future
+            self._queue.append(entity_id)
+
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush())
+
+        return await asyncio.shield(future)
+
+    async def get_many(self, db, entity_ids):
+        """ Returns {id: record} for the ids that exist, with one query for
+        every id not already cached.
+        """
+
+        found = {}
+        missing = []
+
+        for entity_id in entity_ids:
+            record = self._lookup(entity_id)
+            if record is _MISSING:
+                missing.append(entity_id)
+            elif record is not None:
+                found[entity_id] = record
+
+        if missing:
+            for record in await self._fetch(db, missing):
+                self._store(record)
+                found[record.id] = record
+
+            for entity_id in missing:
+                if entity_id not in found:
+                    self._store_missing(entity_id)
+
+        return found
+
+    async def _fetch(self, db, entity_ids):
+        with _ENTITY_QUERY.time():
+            rows = (await db.execute(
+                select(*self._columns).where(self.model.id.in_(entity_ids))
+            )).all()
+
+        return [self.record_type(*row) for row in rows]
+
+    async def _flush(self):
+        # Let every caller scheduled in this tick join the batch
+        await asyncio.sleep(0)
+
+        entity_ids, self._queue = self._queue, []
+        self._flush_task = None
+
+        try:
+            async with database.background_session() as db:
+                records = {record.id: record for record in await self._fetch(db, entity_ids)}
+        except Exception as e:
+            for entity_id in entity_ids:
+                future = self._pending.pop(entity_id)
+                future.set_exception(e)
+                future.exception()
+            return
+
+        for entity_id in entity_ids:
+            record = records.get(entity_id)
+            if record is not None:
+                self._store(record)
+            else:
+                self._store_missing(entity_id)
+            self._pending.pop(entity_id).set_result(record)
+
+    async def invalidate(self, entity_id):
+        await invalidate_local(entity_key(self.kind, entity_id))
+
+    async def invalidate_many(self, entity_ids):
+        await invalidate_local_many(entity_key(self.kind, entity_id) for entity_id in entity_ids)
+
+
+sellers = EntityCache("seller", Seller, SellerRecord)
+customers = EntityCache("customer", Customer, CustomerRecord)
+warehouses = EntityCache("warehouse", Warehouse, WarehouseRecord)
+products = EntityCache("product", Product, ProductRecord)
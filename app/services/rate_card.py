@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+from bisect import bisect_left
+from typing import NamedTuple
+import numpy as np
+from app.cache import on_invalidate
+
+RATE_CARD_PATH = os.getenv(
+    "RATE_CARD_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "rate_card.json")
+)
+# Published on the invalidation channel so every worker reloads the card
+RATE_CARD_KEY = "rate-card"
+DEFAULT_SPEED = "standard"
+
+logger = logging.getLogger(__name__)
+
+
+class TransportStrategy(NamedTuple):
+    name: str
+    label: str
+    rate: float
+    eta_days: int
+
+    def calculate(self, distance, weight):
+        return distance * weight * self.rate
+
+    def eta(self):
+        return self.eta_days
+
+
+class _Bands(NamedTuple):
+    # Inclusive upper bounds in km; the final strategy has no upper bound
+    bounds: tuple
+    strategies: tuple
+    bounds_array: np.ndarray
+    rates_array: np.ndarray
+
+
+class RateCard:
+    """ Immutable, compiled form of a rate card file. Distance bands become
+    a sorted bounds list searched with bisect (or np.searchsorted for
+    arrays), so the lookup cost does not grow with the number of bands.
+    """
+
+    def __init__(self, version, courier_charge, express_charge_per_kg, bands):
+        self.version = version
+        self.courier_charge = courier_charge
+        self.express_charge_per_kg = express_charge_per_kg
+        self._bands = bands
+        # Changes whenever any figure that can reach a quote does, even if
+        # a reloaded file kept its version number
+        self.fingerprint = hashlib.blake2b(repr((
+            version,
+            courier_charge,
+            express_charge_per_kg,
+            sorted((speed, b.bounds, b.strategies) for speed, b in bands.items())
+        )).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _bands_for(self, delivery_speed):
+        return self._bands.get(delivery_speed) or self._bands[DEFAULT_SPEED]
+
+    def strategy_for(self, distance, delivery_speed):
+        bands = self._bands_for(delivery_speed)
+        return bands.strategies[bisect_left(bands.bounds, distance)]
+
+    def rates(self, distances, speeds):
+        """ Per-km/kg rate for every distance, each looked up in the bands of
+        its own delivery speed (a sequence of speed names), exactly as
+        strategy_for would. One searchsorted per distinct speed.
+        """
+
+        distances = np.asarray(distances, dtype=np.float64)
+        speeds = np.asarray(speeds)
+        result = np.empty(len(distances), dtype=np.float64)
+
+        for speed in np.unique(speeds).tolist():
+            selected = speeds == speed
+            bands = self._bands_for(speed)
+            result[selected] = bands.rates_array[
+                np.searchsorted(bands.bounds_array, distances[selected], side="left")
+            ]
+
+        return result
+
+
+def _number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"{field} must be a non-negative number")
+    return value
+
+
+def compile_rate_card(spec):
+    """ Validates a rate card spec and compiles it. Raises ValueError on any
+    inconsistency so a bad file never replaces the active card.
+    """
+
+    try:
+        strategies = {
+            name: TransportStrategy(
+                name,
+                str(mode["label"]),
+                _number(mode["rate"], f"{name}.rate"),
+                int(_number(mode["etaDays"], f"{name}.etaDays"))
+            )
+            for name, mode in spec["modes"].items()
+        }
+
+        bands = {}
+        for speed, entries in spec["bands"].items():
+            if not entries or entries[-1]["upToKm"] is not None:
+                raise ValueError(f"{speed}: the last band must have upToKm null")
+
+            bounds = tuple(
+                _number(entry["upToKm"], f"{speed}.upToKm") for entry in entries[:-1]
+            )
+            if any(low >= high for low, high in zip(bounds, bounds[1:])):
+                raise ValueError(f"{speed}: band bounds must be strictly increasing")
+
+            chosen = tuple(strategies[entry["mode"]] for entry in entries)
+            bands[speed] = _Bands(
+                bounds,
+                chosen,
+                np.array(bounds, dtype=np.float64),
+                np.array([strategy.rate for strategy in chosen], dtype=np.float64)
+            )
+
+        if DEFAULT_SPEED not in bands:
+            raise ValueError(f"rate card must define {DEFAULT_SPEED!r} bands")
+
+        return RateCard(
+            int(spec["version"]),
+            _number(spec["courierCharge"], "courierCharge"),
+            _number(spec["expressChargePerKg"], "expressChargePerKg"),
+            bands
+        )
+
+    except KeyError as e:
+        raise ValueError(f"rate card is missing {e}") from e
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"malformed rate card: {e}") from e
+
+
+def load_rate_card(path=None):
+    with open(path or RATE_CARD_PATH, encoding="utf-8") as source:
+        return compile_rate_card(json.load(source))
+
+
+_current = load_rate_card()
+
+
+def current_rate_card():
+    """ The active card. Callers read it once per quote so every figure in
+    a quote comes from the same card even if a reload lands mid-request.
+    """
+    return _current
+
+
+def reload_rate_card(path=None):
+    """ Compiles the card on disk and swaps it in with a single assignment;
+    on any error the previous card stays active.
+    """
+
+    global _current
+    _current = load_rate_card(path)
+    return _current
+
+
+def _reload_from_broadcast():
+    try:
+        reload_rate_card()
+    except (OSError, ValueError) as e:
+        logger.warning("Rate card reload failed, keeping version %s: %s", _current.version, e)
+
+
+on_invalidate(RATE_CARD_KEY, _reload_from_broadcast)
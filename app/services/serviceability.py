@@ -0,0 +1,251 @@
+""" Precomputed customer -> warehouse serviceability.
+
+customer_serviceability holds, for every customer, each warehouse within
+MAX_SERVICE_DISTANCE and its haversine distance. It is built in bulk with
+vectorized distance blocks, then extended row by row as customers and
+warehouses are added through /admin. Hot copies live in Redis as one hash
+per customer, serviceable:{customer_id} of warehouse_id -> distance_km,
+so a request can be rejected, or its distance found, with a single O(1)
+lookup.
+"""
+
+import os
+import numpy as np
+from sqlalchemy import select, insert
+from app import cache
+from app.models import Customer, Warehouse, CustomerServiceability
+from app.utils.distance import haversine_array, iter_distance_blocks
+from app.metrics import DB_QUERY_SECONDS
+
+MAX_SERVICE_DISTANCE = 2000
+
+SERVICEABLE_KEY = "serviceable:{}"
+# Present in every cached hash, so customers with no warehouse in range
+# are cached too
+LOADED_FIELD = "-"
+SERVICEABILITY_TTL = int(os.getenv("SERVICEABILITY_TTL", "86400"))
+INSERT_BATCH_SIZE = 10000
+
+# Extends a customer's hash only if it is cached; an absent hash is loaded
+# in full from Postgres on its next read.
+_EXTEND = """
+for i, key in ipairs(KEYS) do
+    if redis.call("exists", key) == 1 then
+        redis.call("hset", key, ARGV[1], ARGV[i + 1])
+    end
+end
+return 0
+"""
+
+_SERVICEABILITY_QUERY = DB_QUERY_SECONDS.labels("serviceability")
+
+
+def _pairs(row_ids, row_lat, row_lon, col_ids, col_lat, col_lon):
+    """ Yields (row_id, col_id, distance) for every pair within range,
+    one distance block at a time.
+    """
+
+    row_ids = np.asarray(row_ids)
+    col_ids = np.asarray(col_ids)
+
+    for start, stop, block in iter_distance_blocks(row_lat, row_lon, col_lat, col_lon):
+        rows, cols = np.nonzero(block <= MAX_SERVICE_DISTANCE)
+        yield from zip(
+            row_ids[rows].tolist(),
+            col_ids[cols + start].tolist(),
+            block[rows, cols].tolist()
+        )
+
+
+def _located(rows):
+    rows = [row for row in rows if row[1] is not None and row[2] is not None]
+    ids = [row[0] for row in rows]
+    latitudes = np.array([row[1] for row in rows], dtype=np.float64)
+    longitudes = np.array([row[2] for row in rows], dtype=np.float64)
+    return ids, latitudes, longitudes
+
+
+def backfill(conn):
+    """ Rebuilds the whole table from a synchronous connection (used by the
+    schema migration that introduces it, and by rebuild). Returns the number
+    of rows written.
+    """
+
+    warehouses = _located(conn.execute(
+        select(Warehouse.id, Warehouse.latitude, Warehouse.longitude)
+    ).all())
+    customers = _located(conn.execute(
+        select(Customer.id, Customer.latitude, Customer.longitude)
+    ).all())
+
+    conn.execute(CustomerServiceability.__table__.delete())
+
+    if not warehouses[0] or not customers[0]:
+        return 0
+
+    written = 0
+    batch = []
+    for warehouse_id, customer_id, distance in _pairs(*warehouses, *customers):
+        batch.append({
+            "customer_id": customer_id,
+            "warehouse_id": warehouse_id,
+            "distance_km": distance
+        })
+        if len(batch) >= INSERT_BATCH_SIZE:
+            conn.execute(insert(CustomerServiceability), batch)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        conn.execute(insert(CustomerServiceability), batch)
+        written += len(batch)
+
+    return written
+
+
+async def rebuild(db):
+    """ Recomputes the table in one transaction and drops every cached
+    hash, which reload on next read. For data loaded around /admin, e.g.
+    raw SQL imports or benchmark seeds. Returns the number of rows written.
+    """
+
+    conn = await db.connection()
+    written = await conn.run_sync(backfill)
+    await db.commit()
+
+    await cache.delete_pattern(SERVICEABLE_KEY.format("*"))
+    return written
+
+
+async def _insert(db, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        await db.execute(insert(CustomerServiceability), rows[start:start + INSERT_BATCH_SIZE])
+
+
+async def add_customer(db, customer):
+    """ Records every warehouse in range of a new customer, in the caller's
+    transaction; the customer row must already be flushed. Returns the
+    {warehouse_id: distance_km} set for cache_customer once committed.
+    """
+
+    warehouse_ids, latitudes, longitudes = _located((await db.execute(
+        select(Warehouse.id, Warehouse.latitude, Warehouse.longitude)
+    )).all())
+
+    distances = haversine_array(customer.latitude, customer.longitude, latitudes, longitudes)
+    in_range = {
+        warehouse_id: distance
+        for warehouse_id, distance in zip(warehouse_ids, distances.tolist())
+        if distance <= MAX_SERVICE_DISTANCE
+    }
+
+    await _insert(db, [
+        {"customer_id": customer.id, "warehouse_id": warehouse_id, "distance_km": distance}
+        for warehouse_id, distance in in_range.items()
+    ])
+
+    return in_range
+
+
+async def add_warehouses(db, warehouses):
+    """ Adds new warehouses, given as flushed (id, latitude, longitude)
+    rows, to the set of every customer in range, in the caller's
+    transaction. Returns the rows written, for extend_cached once committed.
+    """
+
+    warehouses = _located(warehouses)
+    if not warehouses[0]:
+        return []
+
+    customers = _located((await db.execute(
+        select(Customer.id, Customer.latitude, Customer.longitude)
+    )).all())
+    if not customers[0]:
+        return []
+
+    rows = [
+        {"customer_id": customer_id, "warehouse_id": warehouse_id, "distance_km": distance}
+        for warehouse_id, customer_id, distance in _pairs(*warehouses, *customers)
+    ]
+
+    await _insert(db, rows)
+    return rows
+
+
+async def extend_cached(rows):
+    """ Adds committed add_warehouses rows to the customers' cached hashes. """
+
+    if not rows:
+        return
+
+    by_warehouse = {}
+    for row in rows:
+        by_warehouse.setdefault(row["warehouse_id"], []).append(row)
+
+    pipe = cache.r.pipeline(transaction=False)
+    for warehouse_id, entries in by_warehouse.items():
+        for start in range(0, len(entries), INSERT_BATCH_SIZE):
+            chunk = entries[start:start + INSERT_BATCH_SIZE]
+            pipe.eval(
+                _EXTEND,
+                len(chunk),
+                *(SERVICEABLE_KEY.format(row["customer_id"]) for row in chunk),
+                warehouse_id,
+                *(row["distance_km"] for row in chunk)
+            )
+    await pipe.execute()
+
+
+async def cache_customer(customer_id, in_range):
+    key = SERVICEABLE_KEY.format(customer_id)
+
+    pipe = cache.r.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.hset(key, mapping={LOADED_FIELD: 0, **in_range})
+    pipe.expire(key, SERVICEABILITY_TTL)
+    await pipe.execute()
+
+
+async def _load(db, customer_id):
+    with _SERVICEABILITY_QUERY.time():
+        rows = (await db.execute(
+            select(
+                CustomerServiceability.warehouse_id,
+                CustomerServiceability.distance_km
+            ).where(CustomerServiceability.customer_id == customer_id)
+        )).all()
+
+    await cache_customer(customer_id, dict(rows))
+
+
+async def warehouses_in_range(db, customer_id):
+    """ Number of warehouses that can serve the customer; 0 means any
+    request for this customer is bound to fail.
+    """
+
+    key = SERVICEABLE_KEY.format(customer_id)
+    size = await cache.r.hlen(key)
+
+    if not size:
+        await _load(db, customer_id)
+        size = await cache.r.hlen(key)
+
+    return size - 1
+
+
+async def distance(db, customer_id, warehouse_id):
+    """ Stored distance in km from the warehouse to the customer, or None
+    when the warehouse is outside the service radius.
+    """
+
+    key = SERVICEABLE_KEY.format(customer_id)
+    pipe = cache.r.pipeline(transaction=False)
+    pipe.exists(key)
+    pipe.hget(key, warehouse_id)
+    loaded, value = await pipe.execute()
+
+    if not loaded:
+        await _load(db, customer_id)
+        value = await cache.r.hget(key, warehouse_id)
+
+    return float(value) if value is not None else None
@@ -1,10 +1,63 @@
-from sqlalchemy import select
-from app.models import Seller, Customer, Product
+from app.services import entity_cache, serviceability
+from app.services.rate_card import current_rate_card
 from app.services.transport_strategy import transport_factory
 from app.services.warehouse_service import get_nearest_warehouse
-from app.utils.distance import haversine
+from app.metrics import PRICING_STAGE_SECONDS
+
+VOLUMETRIC_DIVISOR = 5000
+
+_STRATEGY_SECONDS = PRICING_STAGE_SECONDS.labels("strategy")
+
+
+def chargeable_weight(product, quantity):
+    actual_weight = product.weight * quantity
+    volumetric_weight = (
+        (product.length * product.width * product.height) / VOLUMETRIC_DIVISOR
+    ) * quantity
+
+    return max(actual_weight, volumetric_weight)
+
+
+def price_shipment(distance, product, quantity, delivery_speed, rate_card=None):
+    """ Cost breakdown for shipping `quantity` units over `distance` km,
+    priced entirely from one rate card.
+    """
+
+    return price_weight(
+        distance,
+        chargeable_weight(product, quantity),
+        delivery_speed,
+        rate_card
+    )
+
+
+def price_weight(distance, final_weight, delivery_speed, rate_card=None):
+    """ Cost breakdown for one shipment of `final_weight` chargeable kg. """
+
+    rate_card = rate_card or current_rate_card()
+
+    with _STRATEGY_SECONDS.time():
+        strategy, mode = transport_factory(distance, delivery_speed, rate_card)
+        base_cost = strategy.calculate(distance, final_weight)
+
+    courier_charge = rate_card.courier_charge
+    express_charge = 0
+
+    if delivery_speed == "express":
+        express_charge = rate_card.express_charge_per_kg * final_weight
+
+    final_cost = base_cost + courier_charge + express_charge
+
+    return {
+        "distance": round(distance, 2),
+        "transportMode": mode,
+        "baseCost": round(base_cost, 2),
+        "courierCharge": courier_charge,
+        "expressCharge": round(express_charge, 2),
+        "finalCost": round(final_cost, 2),
+        "estimatedDays": strategy.eta()
+    }
 
-MAX_SERVICE_DISTANCE = 2000
 
 async def calculate_shipping(
     db,
@@ -16,35 +69,33 @@ async def calculate_shipping(
 ):
     """ Core shipping orchestration service. 
     Responsibilities: 
-    1. Validate seller, customer, and product existence. 
-    2. Identify nearest eligible warehouse. 
-    3. Compute delivery distance. 
-    4. Enforce service distance constraint. 
+    1. Validate seller, customer, and product existence (entity cache). 
+    2. Reject customers no warehouse can serve (serviceability table). 
+    3. Identify nearest eligible warehouse. 
+    4. Look up the stored delivery distance, enforcing the service radius. 
     5. Select transport strategy dynamically.
     6. Calculate final shipping cost breakdown. 
     """
 
-    seller = (await db.execute(
-        select(Seller).where(Seller.id == seller_id)
-    )).scalar_one_or_none()
+    seller = await entity_cache.sellers.get(db, seller_id)
 
     if not seller:
         raise Exception("Seller not found")
 
-    customer = (await db.execute(
-        select(Customer).where(Customer.id == customer_id)
-    )).scalar_one_or_none()
+    customer = await entity_cache.customers.get(db, customer_id)
 
     if not customer:
         raise Exception("Customer not found")
 
-    product = (await db.execute(
-        select(Product).where(Product.id == product_id)
-    )).scalar_one_or_none()
+    product = await entity_cache.products.get(db, product_id)
 
     if not product:
         raise Exception("Product not found")
 
+    # Checked before the warehouse search, which it would otherwise waste
+    if not await serviceability.warehouses_in_range(db, customer_id):
+        raise Exception("Delivery location not supported.")
+
     warehouse = await get_nearest_warehouse(
         db,
         seller,
@@ -52,34 +103,12 @@ async def calculate_shipping(
         quantity
     )
 
-    distance = haversine(
-        warehouse.latitude,
-        warehouse.longitude,
-        customer.latitude,
-        customer.longitude
-    )
+    distance = await serviceability.distance(db, customer_id, warehouse.id)
 
-    if distance > MAX_SERVICE_DISTANCE:
+    if distance is None:
         raise Exception("Delivery location not supported.")
 
-    actual_weight = product.weight * quantity
-    volumetric_weight = (
-        (product.length * product.width * product.height) / 5000
-    ) * quantity
-
-    final_weight = max(actual_weight, volumetric_weight)
-
-    strategy, mode = transport_factory(distance, delivery_speed)
-
-    base_cost = await strategy.calculate(distance, final_weight)
-
-    courier_charge = 10
-    express_charge = 0
-
-    if delivery_speed == "express":
-        express_charge = 1.2 * final_weight
-
-    final_cost = base_cost + courier_charge + express_charge
+    breakdown = price_shipment(distance, product, quantity, delivery_speed)
 
     return {
         "warehouseId": warehouse.id,
@@ -87,11 +116,5 @@ async def calculate_shipping(
             "lat": warehouse.latitude,
             "long": warehouse.longitude
         },
-        "distance": round(distance, 2),
-        "transportMode": mode,
-        "baseCost": round(base_cost, 2),
-        "courierCharge": courier_charge,
-        "expressCharge": round(express_charge, 2),
-        "finalCost": round(final_cost, 2),
-        "estimatedDays": strategy.eta()
+        **breakdown
     }
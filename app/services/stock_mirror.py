@@ -0,0 +1,657 @@
+""" Hot stock counters in Redis, with reservations and write-behind.
+
+Each product's inventory is mirrored into a hash, stock:{product_id}, of
+warehouse_id -> units not held by an open reservation. Reservations and
+releases change those counters atomically (Lua) and record the same change
+in a pending-delta hash, which a background task applies to
+warehouse_inventory in one batched transaction per interval. At any moment
+
+    mirror units == warehouse_inventory units + pending + flushing deltas
+
+which is what lets a mirror be dropped and reloaded at any time: loading
+adds the deltas that have not reached Postgres yet. A flush epoch, odd
+while a flush transaction is in progress, rejects loads whose database
+read may straddle that commit. Each flushed batch carries an id, recorded
+in the same transaction, so a flush whose outcome was lost is settled by the
+next one instead of being applied twice.
+
+The LOADED_FIELD of each mirror holds its version, taken from a global
+counter whenever the mirror is loaded or one of its counters changes, so
+anything derived from the counters can be cached under it. Reservations
+record the version they were taken at, and admin writes of absolute counts
+leave a marker with theirs, so a hold the new count already superseded
+returns nothing when it is released.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from sqlalchemy import select, update, delete, insert, bindparam
+from app import cache, database
+from app.singleflight import coalesce
+from app.models import Warehouse, WarehouseInventory, StockFlush
+from app.services import entity_cache
+from app.services.warehouse_index import warehouse_index
+from app.metrics import DB_QUERY_SECONDS
+
+STOCK_KEY = "stock:{}"
+PENDING_KEY = "stockdelta:pending"
+FLUSHING_KEY = "stockdelta:flushing"
+BATCH_KEY = "stockdelta:batch"
+EPOCH_KEY = "stockdelta:epoch"
+FLUSH_LOCK_KEY = "lock:stockdelta:flush"
+RESERVATION_KEY = "reservation:{}"
+EXPIRY_KEY = "reservations:expiry"
+VERSION_KEY = "stockmirror:version"
+FORGOTTEN_KEY = "stockforgot:{}"
+# Present in every loaded mirror, so a product with no stock is still
+# cached; its value is the mirror's version.
+LOADED_FIELD = "-"
+
+# Mirrors are dropped after this long and reloaded on the next read, which
+# picks up any write that bypassed the admin endpoints.
+STOCK_MIRROR_TTL = int(os.getenv("STOCK_MIRROR_TTL", "3600"))
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+STOCK_FLUSH_INTERVAL = float(os.getenv("STOCK_FLUSH_INTERVAL", "1"))
+FLUSH_LOCK_TTL_MS = 30000
+EXPIRY_BATCH_SIZE = 500
+LOAD_ATTEMPTS = 50
+LOAD_RETRY_DELAY = 0.01
+# Admin writes wait up to this many retries for a running flush to finish
+PAUSE_ATTEMPTS = 500
+# Must outlive every reservation open when an admin write lands; the API
+# caps holds at a day.
+FORGET_MARKER_TTL = int(os.getenv("FORGET_MARKER_TTL", str(2 * 86400)))
+
+_LOAD = """
+if redis.call("exists", KEYS[1]) == 1 then
+    return 1
+end
+if (redis.call("get", KEYS[4]) or "0") ~= ARGV[2] then
+    return 0
+end
+redis.call("hset", KEYS[1], ARGV[4], redis.call("incr", KEYS[5]))
+for i = 5, #ARGV, 2 do
+    local field = ARGV[i] .. ":" .. ARGV[1]
+    local units = tonumber(ARGV[i + 1])
+        + tonumber(redis.call("hget", KEYS[2], field) or "0")
+        + tonumber(redis.call("hget", KEYS[3], field) or "0")
+    redis.call("hset", KEYS[1], ARGV[i], units)
+end
+redis.call("expire", KEYS[1], ARGV[3])
+return 1
+"""
+
+_RESERVE = """
+if redis.call("exists", KEYS[1]) == 0 then
+    return -1
+end
+local quantity = tonumber(ARGV[2])
+for i = 6, #ARGV do
+    local warehouse = ARGV[i]
+    if tonumber(redis.call("hget", KEYS[1], warehouse) or "0") >= quantity then
+        local version = redis.call("incr", KEYS[5])
+        redis.call("hincrby", KEYS[1], warehouse, -quantity)
+        redis.call("hset", KEYS[1], ARGV[5], version)
+        redis.call("hincrby", KEYS[2], warehouse .. ":" .. ARGV[1], -quantity)
+        redis.call(
+            "hset", KEYS[3],
+            "product", ARGV[1], "warehouse", warehouse, "quantity", quantity,
+            "version", version
+        )
+        redis.call("zadd", KEYS[4], ARGV[3], ARGV[4])
+        return tonumber(warehouse)
+    end
+end
+return 0
+"""
+
+# Touches the stock hash and forget marker named by the reservation itself,
+# so this assumes a single Redis node rather than a cluster. A hold taken
+# before an admin write to its pair is already part of the new count.
+_RELEASE = """
+local held = redis.call("hmget", KEYS[1], "product", "warehouse", "quantity", "version")
+redis.call("zrem", KEYS[2], ARGV[1])
+if not held[1] then
+    return 0
+end
+local field = held[2] .. ":" .. held[1]
+local forgotten = redis.call("get", ARGV[4] .. field)
+if forgotten and tonumber(forgotten) > tonumber(held[4] or "0") then
+    redis.call("del", KEYS[1])
+    return 1
+end
+local quantity = tonumber(held[3])
+redis.call("hincrby", KEYS[3], field, quantity)
+local stock = ARGV[2] .. held[1]
+if redis.call("exists", stock) == 1 then
+    redis.call("hincrby", stock, held[2], quantity)
+    redis.call("hset", stock, ARGV[3], redis.call("incr", KEYS[4]))
+end
+redis.call("del", KEYS[1])
+return 1
+"""
+
+_CONFIRM = """
+local expires_at = redis.call("zscore", KEYS[2], ARGV[1])
+if not expires_at or tonumber(expires_at) <= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call("del", KEYS[1])
+redis.call("zrem", KEYS[2], ARGV[1])
+return 1
+"""
+
+# Drops the deltas and mirrors of the pairs in ARGV and marks each pair
+# with a new version, in one step, so every reservation is either older
+# than the marker or taken against a reloaded mirror.
+_FORGET = """
+local version = redis.call("incr", KEYS[3])
+for i = 4, #ARGV, 2 do
+    local field = ARGV[i] .. ":" .. ARGV[i + 1]
+    redis.call("hdel", KEYS[1], field)
+    redis.call("hdel", KEYS[2], field)
+    redis.call("set", ARGV[2] .. field, version, "EX", ARGV[3])
+    redis.call("del", ARGV[1] .. ARGV[i + 1])
+end
+return version
+"""
+
+_TAKE_PENDING = """
+if redis.call("exists", KEYS[2]) == 0 then
+    if redis.call("exists", KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call("rename", KEYS[1], KEYS[2])
+    redis.call("set", KEYS[3], ARGV[1])
+end
+local batch = redis.call("get", KEYS[3])
+if not batch then
+    batch = ARGV[1]
+    redis.call("set", KEYS[3], batch)
+end
+return {batch, redis.call("hgetall", KEYS[2])}
+"""
+
+_BEGIN_FLUSH = """
+if tonumber(redis.call("get", KEYS[1]) or "0") % 2 == 0 then
+    redis.call("incr", KEYS[1])
+end
+return 1
+"""
+
+# Drops the batch if ARGV[1] names it, then makes the epoch even again
+_END_FLUSH = """
+if ARGV[1] ~= "" and redis.call("get", KEYS[2]) == ARGV[1] then
+    redis.call("del", KEYS[1], KEYS[2])
+end
+if tonumber(redis.call("get", KEYS[3]) or "0") % 2 == 1 then
+    redis.call("incr", KEYS[3])
+end
+return 1
+"""
+
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_RENEW_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_APPLY_DELTAS = (
+    update(WarehouseInventory.__table__)
+    .where(
+        WarehouseInventory.__table__.c.warehouse_id == bindparam("w_id"),
+        WarehouseInventory.__table__.c.product_id == bindparam("p_id")
+    )
+    .values(
+        available_units=WarehouseInventory.__table__.c.available_units
+        + bindparam("delta")
+    )
+)
+
+_STOCK_QUERY = DB_QUERY_SECONDS.labels("product_stock")
+_FLUSH_QUERY = DB_QUERY_SECONDS.labels("stock_flush")
+
+logger = logging.getLogger(__name__)
+
+
+async def _load(db, product_id):
+    """ Builds the mirror for one product from Postgres plus pending deltas.
+    Also adds any warehouse this worker's spatial index has not seen yet.
+    """
+
+    key = STOCK_KEY.format(product_id)
+
+    for _ in range(LOAD_ATTEMPTS):
+        epoch = await cache.r.get(EPOCH_KEY) or "0"
+
+        if int(epoch) % 2:
+            await asyncio.sleep(LOAD_RETRY_DELAY)
+            continue
+
+        with _STOCK_QUERY.time():
+            rows = (await db.execute(
+                select(
+                    Warehouse.id,
+                    Warehouse.latitude,
+                    Warehouse.longitude,
+                    WarehouseInventory.available_units
+                )
+                .join(
+                    WarehouseInventory,
+                    WarehouseInventory.warehouse_id == Warehouse.id
+                )
+                .where(
+                    WarehouseInventory.product_id == product_id,
+                    WarehouseInventory.available_units.is_not(None),
+                    Warehouse.latitude.is_not(None),
+                    Warehouse.longitude.is_not(None)
+                )
+            )).all()
+
+        units = {}
+        for warehouse_id, latitude, longitude, available in rows:
+            if warehouse_id not in warehouse_index:
+                warehouse_index.add(warehouse_id, latitude, longitude)
+            # Duplicate inventory rows: the largest one decides eligibility
+            units[warehouse_id] = max(available, units.get(warehouse_id, available))
+
+        args = [product_id, epoch, STOCK_MIRROR_TTL, LOADED_FIELD]
+        for warehouse_id, available in units.items():
+            args += [warehouse_id, available]
+
+        if await cache.r.eval(
+            _LOAD, 5, key, PENDING_KEY, FLUSHING_KEY, EPOCH_KEY, VERSION_KEY, *args
+        ):
+            return
+
+        await asyncio.sleep(LOAD_RETRY_DELAY)
+
+    raise Exception("Stock counters are busy, retry shortly.")
+
+
+async def _ensure_loaded(db, product_id):
+    # Concurrent misses for one product share a single load
+    key = STOCK_KEY.format(product_id)
+    await coalesce(key, lambda: _load(db, product_id))
+
+
+async def get_version(db, product_id):
+    """ The mirror's current version, loading it on first use. """
+
+    key = STOCK_KEY.format(product_id)
+    version = await cache.r.hget(key, LOADED_FIELD)
+
+    if version is None:
+        await _ensure_loaded(db, product_id)
+        version = await cache.r.hget(key, LOADED_FIELD)
+
+    return version
+
+
+async def get_units_many(db, product_ids):
+    """ Returns {product_id: {warehouse_id: units}} from the hot counters,
+    reading every mirror in one round trip and loading those not cached.
+    """
+
+    product_ids = list(product_ids)
+
+    pipe = cache.r.pipeline(transaction=False)
+    for product_id in product_ids:
+        pipe.hgetall(STOCK_KEY.format(product_id))
+
+    units = {}
+    for product_id, data in zip(product_ids, await pipe.execute()):
+        if not data:
+            await _ensure_loaded(db, product_id)
+            data = await cache.r.hgetall(STOCK_KEY.format(product_id))
+
+        units[product_id] = {
+            int(field): int(available)
+            for field, available in data.items()
+            if field != LOADED_FIELD
+        }
+
+    return units
+
+
+async def get_units(db, product_id):
+    """ Returns {warehouse_id: units} from the hot counters, loading the
+    product's mirror on first use.
+    """
+
+    return (await get_units_many(db, [product_id]))[product_id]
+
+
+async def get_stock_many(db, product_ids):
+    """ get_stock for several products, with one round trip for the
+    counters and one entity lookup for warehouses not indexed yet.
+    """
+
+    units = {
+        product_id: {
+            warehouse_id: available
+            for warehouse_id, available in held.items()
+            if available > 0
+        }
+        for product_id, held in (await get_units_many(db, product_ids)).items()
+    }
+
+    unknown = {
+        warehouse_id
+        for held in units.values()
+        for warehouse_id in held
+        if warehouse_id not in warehouse_index
+    }
+    if unknown:
+        for record in (await entity_cache.warehouses.get_many(db, unknown)).values():
+            if record.latitude is not None and record.longitude is not None:
+                warehouse_index.add(record.id, record.latitude, record.longitude)
+
+    stock = {}
+    for product_id, held in units.items():
+        stock[product_id] = {}
+        for warehouse_id, available in held.items():
+            point = warehouse_index.get(warehouse_id)
+            if point is not None:
+                stock[product_id][warehouse_id] = (point.latitude, point.longitude, available)
+
+    return stock
+
+
+async def get_stock(db, product_id):
+    """ Same shape as a stock query, {warehouse_id: (latitude, longitude,
+    units)} for warehouses with at least one unit, but read from the hot
+    counters. Coordinates come from the spatial index.
+    """
+
+    return (await get_stock_many(db, [product_id]))[product_id]
+
+
+async def reserve(db, product_id, quantity, candidates, ttl=RESERVATION_TTL):
+    """ Atomically holds `quantity` units at the first warehouse in
+    `candidates` that still has them. Returns (reservation_id, warehouse_id,
+    expires_at), or None when every candidate has been drained meanwhile.
+    """
+
+    if not candidates:
+        return None
+
+    reservation_id = uuid.uuid4().hex
+    expires_at = time.time() + ttl
+    keys = [
+        STOCK_KEY.format(product_id),
+        PENDING_KEY,
+        RESERVATION_KEY.format(reservation_id),
+        EXPIRY_KEY,
+        VERSION_KEY,
+    ]
+    args = [product_id, quantity, expires_at, reservation_id, LOADED_FIELD, *candidates]
+
+    warehouse_id = await cache.r.eval(_RESERVE, len(keys), *keys, *args)
+
+    if warehouse_id == -1:
+        # The mirror expired or was reset since it was read
+        await _ensure_loaded(db, product_id)
+        warehouse_id = await cache.r.eval(_RESERVE, len(keys), *keys, *args)
+
+    if warehouse_id <= 0:
+        return None
+
+    return reservation_id, warehouse_id, expires_at
+
+
+async def confirm(reservation_id):
+    """ Makes a reservation permanent: the units stay deducted and reach
+    Postgres with the next flush. False if it is unknown or has expired.
+    """
+
+    return bool(await cache.r.eval(
+        _CONFIRM,
+        2,
+        RESERVATION_KEY.format(reservation_id),
+        EXPIRY_KEY,
+        reservation_id,
+        time.time()
+    ))
+
+
+async def release(reservation_id):
+    """ Returns a reservation's units to its warehouse. False if it is
+    unknown, already confirmed or already released.
+    """
+
+    return bool(await cache.r.eval(
+        _RELEASE,
+        4,
+        RESERVATION_KEY.format(reservation_id),
+        EXPIRY_KEY,
+        PENDING_KEY,
+        VERSION_KEY,
+        reservation_id,
+        STOCK_KEY.format(""),
+        LOADED_FIELD,
+        FORGOTTEN_KEY.format("")
+    ))
+
+
+async def release_expired(now=None):
+    """ Releases reservations past their expiry, a batch at a time.
+    Returns how many were released.
+    """
+
+    expired = await cache.r.zrangebyscore(
+        EXPIRY_KEY, "-inf", now or time.time(), start=0, num=EXPIRY_BATCH_SIZE
+    )
+
+    if not expired:
+        return 0
+
+    pipe = cache.r.pipeline(transaction=False)
+    for reservation_id in expired:
+        pipe.eval(
+            _RELEASE,
+            4,
+            RESERVATION_KEY.format(reservation_id),
+            EXPIRY_KEY,
+            PENDING_KEY,
+            VERSION_KEY,
+            reservation_id,
+            STOCK_KEY.format(""),
+            LOADED_FIELD,
+            FORGOTTEN_KEY.format("")
+        )
+
+    return sum(await pipe.execute())
+
+
+async def _keep_lock(token):
+    while True:
+        await asyncio.sleep(FLUSH_LOCK_TTL_MS / 3000)
+        await cache.r.eval(_RENEW_LOCK, 1, FLUSH_LOCK_KEY, token, FLUSH_LOCK_TTL_MS)
+
+
+async def _lock_flushes(attempts=1):
+    """ Takes the flush lock, retrying up to `attempts` times, and keeps
+    renewing it until _unlock_flushes. Returns a handle for that, or None
+    if another holder kept the lock throughout.
+    """
+
+    token = uuid.uuid4().hex
+
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(LOAD_RETRY_DELAY)
+
+        if await cache.r.set(FLUSH_LOCK_KEY, token, nx=True, px=FLUSH_LOCK_TTL_MS):
+            return token, asyncio.create_task(_keep_lock(token))
+
+    return None
+
+
+async def _unlock_flushes(lock):
+    token, keeper = lock
+    keeper.cancel()
+    await cache.r.eval(_RELEASE_LOCK, 1, FLUSH_LOCK_KEY, token)
+
+
+async def _landed(db, batch_id):
+    return await db.scalar(
+        select(StockFlush.batch_id).where(StockFlush.batch_id == batch_id)
+    ) is not None
+
+
+async def _apply(batch_id, rows):
+    """ Applies one batch and records its id in the same transaction.
+    False if an earlier attempt already landed it.
+    """
+
+    async with database.background_session() as db:
+        if await _landed(db, batch_id):
+            return False
+
+        with _FLUSH_QUERY.time():
+            # Only the batch in flight is ever looked up
+            await db.execute(delete(StockFlush))
+            await db.execute(insert(StockFlush).values(batch_id=batch_id))
+            if rows:
+                await db.execute(_APPLY_DELTAS, rows)
+        await db.commit()
+
+    return True
+
+
+async def flush():
+    """ Applies pending deltas to warehouse_inventory in one transaction.
+    At most one worker flushes at a time. A failed flush leaves its batch in
+    place to be retried; one that committed without hearing back is
+    recognised by its batch id and not applied again. Returns the number of
+    rows updated.
+    """
+
+    lock = await _lock_flushes()
+
+    if lock is None:
+        return 0
+
+    try:
+        taken = await cache.r.eval(
+            _TAKE_PENDING, 3, PENDING_KEY, FLUSHING_KEY, BATCH_KEY, uuid.uuid4().hex
+        )
+
+        if not taken:
+            # Clears an epoch left odd by a flush whose outcome was unknown
+            await cache.r.eval(_END_FLUSH, 3, FLUSHING_KEY, BATCH_KEY, EPOCH_KEY, "")
+            return 0
+
+        batch_id, raw = taken
+        rows = []
+        for field, delta in zip(raw[::2], raw[1::2]):
+            warehouse_id, product_id = field.split(":")
+            if int(delta):
+                rows.append({
+                    "w_id": int(warehouse_id),
+                    "p_id": int(product_id),
+                    "delta": int(delta)
+                })
+
+        # Odd while the transaction runs, so no mirror is loaded from a read
+        # that might or might not include it
+        await cache.r.eval(_BEGIN_FLUSH, 1, EPOCH_KEY)
+
+        try:
+            applied = await _apply(batch_id, rows)
+        except Exception:
+            # The commit may have landed even though it reported an error.
+            # If that cannot be checked either, the epoch stays odd and the
+            # next flush settles the batch.
+            async with database.background_session() as db:
+                if not await _landed(db, batch_id):
+                    await cache.r.eval(
+                        _END_FLUSH, 3, FLUSHING_KEY, BATCH_KEY, EPOCH_KEY, ""
+                    )
+                    raise
+            applied = True
+
+        await cache.r.eval(_END_FLUSH, 3, FLUSHING_KEY, BATCH_KEY, EPOCH_KEY, batch_id)
+
+        return len(rows) if applied else 0
+    finally:
+        await _unlock_flushes(lock)
+
+
+@asynccontextmanager
+async def flushes_paused():
+    """ Holds the flush lock around an admin write of absolute counts, so
+    no batch taken before the write can land on top of it. The write
+    commits, and forget() runs, inside the block.
+    """
+
+    lock = await _lock_flushes(PAUSE_ATTEMPTS)
+
+    if lock is None:
+        raise Exception("Stock counters are busy, retry shortly.")
+
+    try:
+        yield
+    finally:
+        await _unlock_flushes(lock)
+
+
+async def forget(pairs):
+    """ Called inside flushes_paused() after admin inventory writes, which
+    set absolute counts: drops the unflushed deltas of the (warehouse_id,
+    product_id) pairs they replaced, including those left behind by a
+    failed flush, and the mirrors of their products, which reload on next
+    read. Reservations open on those pairs are superseded by the new count;
+    releasing them returns nothing.
+    """
+
+    args = []
+    for warehouse_id, product_id in pairs:
+        args += [warehouse_id, product_id]
+
+    if not args:
+        return
+
+    await cache.r.eval(
+        _FORGET,
+        3,
+        PENDING_KEY,
+        FLUSHING_KEY,
+        VERSION_KEY,
+        STOCK_KEY.format(""),
+        FORGOTTEN_KEY.format(""),
+        FORGET_MARKER_TTL,
+        *args
+    )
+
+
+async def run_write_behind(interval=STOCK_FLUSH_INTERVAL):
+    """ Background loop: releases expired reservations, then flushes. """
+
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await release_expired()
+            await flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Stock write-behind failed: %s", e)
+
+
+def start_write_behind():
+    return asyncio.create_task(run_write_behind())
@@ -1,43 +1,19 @@
-class TransportStrategy:
-    async def calculate(self, distance, weight):
-        raise NotImplementedError()
+from app.services.rate_card import current_rate_card
 
-    def eta(self):
-        raise NotImplementedError()
 
+def transport_factory(distance, delivery_speed, rate_card=None):
+    """ Picks the transport strategy for a distance from the rate card's
+    bands and returns it with its display label.
+    """
 
-class MiniVanStrategy(TransportStrategy):
-    async def calculate(self, distance, weight):
-        return distance * weight * 3
+    strategy = (rate_card or current_rate_card()).strategy_for(distance, delivery_speed)
+    return strategy, strategy.label
 
-    def eta(self):
-        return 2
 
+def transport_rates(distances, delivery_speeds, rate_card=None):
+    """ Vectorized counterpart of transport_factory.
+    Takes an array of distances and the delivery speed of each and returns
+    the per-km/kg rate of the strategy the factory would pick for each entry.
+    """
 
-class TruckStrategy(TransportStrategy):
-    async def calculate(self, distance, weight):
-        return distance * weight * 2
-
-    def eta(self):
-        return 4
-
-
-class AirplaneStrategy(TransportStrategy):
-    async def calculate(self, distance, weight):
-        return distance * weight * 1
-
-    def eta(self):
-        return 1
-
-
-def transport_factory(distance, delivery_speed):
-
-    if delivery_speed == "express" and distance > 300:
-        return AirplaneStrategy(), "Aeroplane"
-
-    if distance <= 100:
-        return MiniVanStrategy(), "Mini Van"
-    elif distance <= 500:
-        return TruckStrategy(), "Truck"
-    else:
-        return AirplaneStrategy(), "Aeroplane"
+    return (rate_card or current_rate_card()).rates(distances, delivery_speeds)
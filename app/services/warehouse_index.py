@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import math
+from typing import NamedTuple
+from sqlalchemy import select
+from app.models import Warehouse
+from app.utils.distance import haversine
+from app.metrics import DB_QUERY_SECONDS
+
+LEAF_SIZE = 8
+# New warehouses are kept in a small unindexed buffer and folded into the
+# tree once it grows past this size.
+REBUILD_THRESHOLD = 64
+# Chord ordering and haversine ordering agree mathematically but can differ
+# in the last bits; candidates this close to the k-th hit are re-ranked by
+# haversine so the result matches a linear scan exactly.
+TIE_TOLERANCE = 1e-9
+
+
+class WarehousePoint(NamedTuple):
+    id: int
+    latitude: float
+    longitude: float
+
+
+def to_unit_vector(latitude, longitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def _squared_chord(a, b):
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    dz = a[2] - b[2]
+    return dx * dx + dy * dy + dz * dz
+
+
+class _Node:
+    __slots__ = ("lo", "hi", "left", "right", "items")
+
+    def __init__(self, items):
+        self.lo = tuple(min(vec[axis] for vec, _ in items) for axis in range(3))
+        self.hi = tuple(max(vec[axis] for vec, _ in items) for axis in range(3))
+        self.left = None
+        self.right = None
+        self.items = None
+
+        if len(items) <= LEAF_SIZE:
+            self.items = items
+            return
+
+        axis = max(range(3), key=lambda i: self.hi[i] - self.lo[i])
+        items.sort(key=lambda item: item[0][axis])
+        mid = len(items) // 2
+        self.left = _Node(items[:mid])
+        self.right = _Node(items[mid:])
+
+    def min_squared_distance(self, vec):
+        total = 0.0
+        for axis in range(3):
+            if vec[axis] < self.lo[axis]:
+                delta = self.lo[axis] - vec[axis]
+            elif vec[axis] > self.hi[axis]:
+                delta = vec[axis] - self.hi[axis]
+            else:
+                continue
+            total += delta * delta
+        return total
+
+
+class WarehouseIndex:
+    """ KD-tree over warehouse positions on the unit sphere.
+    Straight-line (chord) distance between unit vectors grows monotonically
+    with great-circle distance, so a best-first walk of the tree visits
+    warehouses nearest-first without touching most of them.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._pending = []
+        self._points = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, warehouse_id):
+        return warehouse_id in self._points
+
+    def get(self, warehouse_id):
+        return self._points.get(warehouse_id)
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def build(self, points):
+        self._points = {point.id: point for point in points}
+        self._pending = []
+        self._rebuild()
+        self._loaded = True
+
+    async def load(self, db):
+        async with self._lock:
+            with DB_QUERY_SECONDS.time("warehouse_index_load"):
+                rows = (await db.execute(
+                    select(Warehouse.id, Warehouse.latitude, Warehouse.longitude)
+                )).all()
+
+            self.build(
+                WarehousePoint(row.id, row.latitude, row.longitude)
+                for row in rows
+                if row.latitude is not None and row.longitude is not None
+            )
+
+    async def ensure_loaded(self, db):
+        if not self._loaded:
+            await self.load(db)
+
+    def add(self, warehouse_id, latitude, longitude):
+        point = WarehousePoint(warehouse_id, latitude, longitude)
+
+        if warehouse_id in self._points:
+            self._points[warehouse_id] = point
+            self._rebuild()
+            return
+
+        self._points[warehouse_id] = point
+        self._pending.append((to_unit_vector(latitude, longitude), point))
+
+        if len(self._pending) > REBUILD_THRESHOLD:
+            self._rebuild()
+
+    def _rebuild(self):
+        items = [
+            (to_unit_vector(point.latitude, point.longitude), point)
+            for point in self._points.values()
+        ]
+        self._root = _Node(items) if items else None
+        self._pending = []
+
+    def iter_nearest(self, latitude, longitude):
+        """ Yields (squared_chord, point) pairs in non-decreasing distance. """
+
+        query = to_unit_vector(latitude, longitude)
+        heap = []
+        seq = 0
+
+        for vec, point in self._pending:
+            heap.append((_squared_chord(query, vec), seq, None, point))
+            seq += 1
+
+        if self._root is not None:
+            heap.append((self._root.min_squared_distance(query), seq, self._root, None))
+            seq += 1
+
+        heapq.heapify(heap)
+
+        while heap:
+            bound, _, node, point = heapq.heappop(heap)
+
+            if node is None:
+                yield bound, point
+                continue
+
+            if node.items is not None:
+                for vec, item in node.items:
+                    heapq.heappush(heap, (_squared_chord(query, vec), seq, None, item))
+                    seq += 1
+            else:
+                for child in (node.left, node.right):
+                    heapq.heappush(heap, (child.min_squared_distance(query), seq, child, None))
+                    seq += 1
+
+    def k_nearest(self, latitude, longitude, k, predicate=None):
+        """ Returns up to k (distance_km, point) pairs ordered by haversine
+        distance and then warehouse id, skipping points rejected by predicate.
+        """
+
+        if k <= 0:
+            return []
+
+        matches = []
+        cutoff = None
+
+        for squared_chord, point in self.iter_nearest(latitude, longitude):
+            if cutoff is not None and squared_chord > cutoff:
+                break
+
+            if predicate is not None and not predicate(point):
+                continue
+
+            matches.append(point)
+
+            if cutoff is None and len(matches) == k:
+                cutoff = squared_chord * (1 + TIE_TOLERANCE) + TIE_TOLERANCE
+
+        ranked = sorted(
+            (
+                haversine(latitude, longitude, point.latitude, point.longitude),
+                point.id,
+                point
+            )
+            for point in matches
+        )
+
+        return [(distance, point) for distance, _, point in ranked[:k]]
+
+    def nearest(self, latitude, longitude, predicate=None):
+        found = self.k_nearest(latitude, longitude, 1, predicate)
+        return found[0] if found else None
+
+
+warehouse_index = WarehouseIndex()
@@ -1,46 +1,175 @@
-from sqlalchemy import select
-from app.models import Warehouse, WarehouseInventory
+import os
+from app.services import stock_mirror
+from app.services.warehouse_index import (
+    warehouse_index,
+    WarehousePoint,
+    TIE_TOLERANCE,
+)
 from app.utils.distance import haversine
+from app.singleflight import get_or_compute_stale
+from app.metrics import PRICING_STAGE_SECONDS, timed
 from fastapi import HTTPException
 
+# Below this many stocked warehouses a direct scan of the candidates is
+# cheaper than walking the spatial index.
+DIRECT_SCAN_LIMIT = 32
+# Another checkout can drain every candidate between reading the counters
+# and reserving; the read is retried this many times.
+RESERVE_ATTEMPTS = 3
 
-async def get_nearest_warehouse(db, seller, product_id, quantity):
+# Keyed on the mirror version, which every reservation, release and reload
+# changes, so a cached ladder never outlives the counters it was built from.
+STOCK_LADDER_KEY = "ladder:{}:{}:v{}"
+STOCK_LADDER_TTL = int(os.getenv("STOCK_LADDER_TTL", "1800"))
+# Past this age a ladder is still served, but rebuilt in the background, so
+# warehouse changes that leave the counters alone are picked up without a
+# request ever waiting; set equal to STOCK_LADDER_TTL to disable.
+STOCK_LADDER_SOFT_TTL = int(os.getenv("STOCK_LADDER_SOFT_TTL", "300"))
+# An empty ladder (no warehouse stocks the product) is kept only briefly;
+# any stock write for the product changes the version, which retires the
+# entry at once.
+NEGATIVE_STOCK_TTL = int(os.getenv("NEGATIVE_STOCK_TTL", "60"))
 
-    warehouses = (await db.execute(
-        select(Warehouse)
-    )).scalars().all()
 
-    eligible_warehouses = []
+def _nearest_first(latitude, longitude, stock):
+    """ Stocked warehouse ids ordered by (haversine distance, id), cut off
+    once the largest stock level has been reached; nothing farther can
+    appear on the ladder.
+    """
 
-    for warehouse in warehouses:
+    if len(stock) <= DIRECT_SCAN_LIMIT:
+        candidates = list(stock)
+    else:
+        # Warehouses added through another worker are picked up here
+        for warehouse_id, (lat, lon, _) in stock.items():
+            if warehouse_id not in warehouse_index:
+                warehouse_index.add(warehouse_id, lat, lon)
 
-        # Check inventory for this warehouse + product
-        inventory = (await db.execute(
-            select(WarehouseInventory).where(
-                WarehouseInventory.warehouse_id == warehouse.id,
-                WarehouseInventory.product_id == product_id
-            )
-        )).scalar_one_or_none()
+        top = max(units for _, _, units in stock.values())
+        candidates = []
+        cutoff = None
+
+        for squared_chord, point in warehouse_index.iter_nearest(latitude, longitude):
+            if cutoff is not None and squared_chord > cutoff:
+                break
+
+            if point.id not in stock:
+                continue
 
-        # Skip if no inventory or insufficient stock
-        if not inventory or inventory.available_units < quantity:
-            continue
+            candidates.append(point.id)
 
-        distance = haversine(
-            seller.latitude,
-            seller.longitude,
-            warehouse.latitude,
-            warehouse.longitude
+            if cutoff is None and stock[point.id][2] == top:
+                cutoff = squared_chord * (1 + TIE_TOLERANCE) + TIE_TOLERANCE
+
+    return sorted(
+        candidates,
+        key=lambda warehouse_id: (
+            haversine(latitude, longitude, stock[warehouse_id][0], stock[warehouse_id][1]),
+            warehouse_id
         )
+    )
+
+
+def build_stock_ladder(latitude, longitude, stock):
+    """ Quantity-independent answer to "nearest warehouse with enough
+    stock": the warehouses, nearest first, that hold more units than every
+    warehouse nearer to the seller. For any quantity the nearest eligible
+    warehouse is the first rung with at least that many units.
+    Rungs are [warehouse_id, latitude, longitude, available_units].
+    """
+
+    ladder = []
+    best = 0
+
+    for warehouse_id in _nearest_first(latitude, longitude, stock):
+        lat, lon, units = stock[warehouse_id]
+        if units > best:
+            ladder.append([warehouse_id, lat, lon, units])
+            best = units
+
+    return ladder
+
+
+async def get_stock_ladder(db, seller, product_id):
+    """ Ladder built from the live stock counters, so units held by open
+    reservations are never offered again. Cached per seller under the
+    mirror's version; concurrent misses share one build, and a ladder past
+    its soft TTL is served while it is rebuilt in the background.
+    """
+
+    version = await stock_mirror.get_version(db, product_id)
+
+    async def compute(session):
+        stock = await stock_mirror.get_stock(session, product_id)
 
-        eligible_warehouses.append((warehouse, distance))
+        if len(stock) > DIRECT_SCAN_LIMIT:
+            await warehouse_index.ensure_loaded(session)
 
-    if not eligible_warehouses:
-        raise HTTPException(
-            status_code=400,
-            detail="No warehouse available with sufficient stock."
+        return build_stock_ladder(seller.latitude, seller.longitude, stock)
+
+    return await get_or_compute_stale(
+        STOCK_LADDER_KEY.format(seller.id, product_id, version),
+        compute,
+        db,
+        STOCK_LADDER_SOFT_TTL,
+        STOCK_LADDER_TTL,
+        negative_ttl=NEGATIVE_STOCK_TTL
+    )
+
+
+@timed(PRICING_STAGE_SECONDS.labels("nearest_warehouse"))
+async def get_nearest_warehouse(db, seller, product_id, quantity):
+
+    for warehouse_id, latitude, longitude, units in await get_stock_ladder(
+        db, seller, product_id
+    ):
+        if units >= quantity:
+            return WarehousePoint(warehouse_id, latitude, longitude)
+
+    raise HTTPException(
+        status_code=400,
+        detail="No warehouse available with sufficient stock."
+    )
+
+
+async def reserve_nearest_warehouse(db, seller, product_id, quantity, ttl=None):
+    """ Holds `quantity` units at the nearest warehouse that has them.
+    Candidates are tried nearest-first inside one atomic Redis script, so
+    concurrent checkouts never take the same units twice. Returns
+    (reservation_id, WarehousePoint, expires_at).
+    """
+
+    for _ in range(RESERVE_ATTEMPTS):
+        stock = {
+            warehouse_id: entry
+            for warehouse_id, entry in (await stock_mirror.get_stock(db, product_id)).items()
+            if entry[2] >= quantity
+        }
+
+        if not stock:
+            break
+
+        if len(stock) > DIRECT_SCAN_LIMIT:
+            await warehouse_index.ensure_loaded(db)
+
+        reservation = await stock_mirror.reserve(
+            db,
+            product_id,
+            quantity,
+            _nearest_first(seller.latitude, seller.longitude, stock),
+            ttl or stock_mirror.RESERVATION_TTL
         )
 
-    eligible_warehouses.sort(key=lambda x: x[1])
+        if reservation is not None:
+            reservation_id, warehouse_id, expires_at = reservation
+            latitude, longitude, _ = stock[warehouse_id]
+            return (
+                reservation_id,
+                WarehousePoint(warehouse_id, latitude, longitude),
+                expires_at
+            )
 
-    return eligible_warehouses[0][0]
+    raise HTTPException(
+        status_code=400,
+        detail="No warehouse available with sufficient stock."
+    )
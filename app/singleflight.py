@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from app import cache, database
+
+# "redis" additionally coalesces misses across worker processes with a
+# short-lived Redis lock; the default only coalesces within a process.
+SINGLE_FLIGHT_MODE = os.getenv("SINGLE_FLIGHT_MODE", "local")
+LOCK_TTL_MS = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_MS", "5000"))
+LOCK_POLL_INTERVAL = 0.02
+
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_in_flight = {}
+_refreshing = {}
+
+logger = logging.getLogger(__name__)
+
+
+async def coalesce(key, compute):
+    """ Runs compute() at most once per key at a time within this process.
+    Concurrent callers for the same key await the leader's result, or its
+    exception, instead of repeating the work.
+    """
+
+    while True:
+        future = _in_flight.get(key)
+
+        if future is None:
+            break
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Only retry if the leader was cancelled, not this caller
+            if not future.cancelled():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+
+    try:
+        result = await compute()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark retrieved so an unshared failure does not log a warning
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        _in_flight.pop(key, None)
+
+
+async def _wait_for_leader(key, lock_key):
+    """ Polls for another process's result until its lock disappears or
+    expires. Returns None when the caller should compute the value itself.
+    """
+
+    deadline = time.monotonic() + LOCK_TTL_MS / 1000
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+        cached = await cache.get_cached_data(key)
+        if cached is not None:
+            return cached
+
+        if not await cache.r.exists(lock_key):
+            return None
+
+    return None
+
+
+async def _store(key, value, ttl):
+    # ttl may depend on the value, e.g. shorter for negative results
+    await cache.set_cached_data(key, value, ttl(value) if callable(ttl) else ttl)
+
+
+async def _compute_and_store(key, compute, ttl):
+    if SINGLE_FLIGHT_MODE != "redis":
+        value = await compute()
+        await _store(key, value, ttl)
+        return value
+
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+
+    if not await cache.r.set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+        cached = await _wait_for_leader(key, lock_key)
+        if cached is not None:
+            return cached
+
+        # Leader failed or is stuck past the lock TTL; compute locally
+        # without taking the lock so a wedged leader cannot block us.
+        value = await compute()
+        await _store(key, value, ttl)
+        return value
+
+    try:
+        value = await compute()
+        await _store(key, value, ttl)
+        return value
+    finally:
+        await cache.r.eval(_RELEASE_LOCK, 1, lock_key, token)
+
+
+async def get_or_compute(key, compute, ttl=1800):
+    """ Read-through cache lookup with request coalescing on misses. """
+
+    cached = await cache.get_cached_data(key)
+    if cached is not None:
+        return cached
+
+    return await coalesce(key, lambda: _compute_and_store(key, compute, ttl))
+
+
+def _envelope(value, soft_ttl):
+    return {"value": value, "fresh_until": time.time() + soft_ttl}
+
+
+def _envelope_ttls(value, soft_ttl, hard_ttl, negative_ttl):
+    # Empty results live for negative_ttl and are never served stale
+    if negative_ttl is not None and not value:
+        return negative_ttl, negative_ttl
+    return soft_ttl, hard_ttl
+
+
+async def _refresh(key, compute, soft_ttl, hard_ttl, negative_ttl):
+    """ Background recomputation with its own session. Takes the key's
+    single-flight lock, so it never runs alongside a blocking fill or
+    another worker's refresh.
+    """
+
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+
+    if not await cache.r.set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+        return
+
+    try:
+        # Another worker may have refreshed it since our local copy was read
+        current = await cache.get_remote_data(key)
+        if current is not None and current["fresh_until"] > time.time():
+            return
+
+        async with database.background_session() as db:
+            value = await compute(db)
+
+        soft, hard = _envelope_ttls(value, soft_ttl, hard_ttl, negative_ttl)
+        await cache.set_cached_data(key, _envelope(value, soft), hard)
+    except Exception as e:
+        logger.warning("Background refresh of %s failed: %s", key, e)
+    finally:
+        await cache.r.eval(_RELEASE_LOCK, 1, lock_key, token)
+
+
+def _schedule_refresh(key, compute, soft_ttl, hard_ttl, negative_ttl):
+    if key in _refreshing:
+        return
+
+    task = asyncio.create_task(_refresh(key, compute, soft_ttl, hard_ttl, negative_ttl))
+    _refreshing[key] = task
+    task.add_done_callback(lambda _: _refreshing.pop(key, None))
+
+
+async def get_or_compute_stale(key, compute, db, soft_ttl, hard_ttl, negative_ttl=None):
+    """ Stale-while-revalidate lookup. Entries are served as-is until
+    soft_ttl, then served stale while one background task recomputes them;
+    only a miss (never written, evicted, or past hard_ttl) blocks the caller.
+    compute(db) receives the request's session on a miss and a fresh one
+    for background refreshes. Empty results are cached for negative_ttl
+    instead, when given.
+    """
+
+    envelope = await cache.get_cached_data(key)
+
+    if envelope is not None:
+        if envelope["fresh_until"] <= time.time():
+            _schedule_refresh(key, compute, soft_ttl, hard_ttl, negative_ttl)
+        return envelope["value"]
+
+    def envelope_ttl(envelope):
+        return _envelope_ttls(envelope["value"], soft_ttl, hard_ttl, negative_ttl)[1]
+
+    async def fill():
+        value = await compute(db)
+        return _envelope(value, _envelope_ttls(value, soft_ttl, hard_ttl, negative_ttl)[0])
+
+    envelope = await coalesce(key, lambda: _compute_and_store(key, fill, envelope_ttl))
+    return envelope["value"]
@@ -1,7 +1,13 @@
 import math 
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+# Columns processed per block in distance_matrix; keeps the trig
+# temporaries at rows x DISTANCE_CHUNK_SIZE regardless of column count.
+DISTANCE_CHUNK_SIZE = 4096
 
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  
+    R = EARTH_RADIUS_KM
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat / 2) * math.sin(dlat / 2) + math.cos(math.radians(lat1)) \
@@ -9,3 +15,54 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     distance = R * c
     return distance
+
+
+def haversine_array(lat1, lon1, lat2, lon2):
+    """ Element-wise haversine over NumPy arrays (broadcasting applies). """
+    R = EARTH_RADIUS_KM
+    lat1 = np.asarray(lat1, dtype=np.float64)
+    lon1 = np.asarray(lon1, dtype=np.float64)
+    lat2 = np.asarray(lat2, dtype=np.float64)
+    lon2 = np.asarray(lon2, dtype=np.float64)
+    sin_dlat = np.sin(np.radians(lat2 - lat1) / 2)
+    sin_dlon = np.sin(np.radians(lon2 - lon1) / 2)
+    a = sin_dlat * sin_dlat + np.cos(np.radians(lat1)) \
+        * np.cos(np.radians(lat2)) * sin_dlon * sin_dlon
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+
+def iter_distance_blocks(lat1, lon1, lat2, lon2, chunk_size=DISTANCE_CHUNK_SIZE):
+    """ Yields (start, stop, block) where block is the rows x (stop - start)
+    distance matrix between every point in (lat1, lon1) and points
+    start:stop of (lat2, lon2). Lets callers reduce very wide matrices
+    (e.g. warehouses x all customers) without ever materialising them.
+    """
+    lat1 = np.asarray(lat1, dtype=np.float64).reshape(-1, 1)
+    lon1 = np.asarray(lon1, dtype=np.float64).reshape(-1, 1)
+    lat2 = np.asarray(lat2, dtype=np.float64).ravel()
+    lon2 = np.asarray(lon2, dtype=np.float64).ravel()
+
+    cos_lat1 = np.cos(np.radians(lat1))
+    cos_lat2 = np.cos(np.radians(lat2))
+
+    for start in range(0, lat2.shape[0], chunk_size):
+        stop = min(start + chunk_size, lat2.shape[0])
+        sin_dlat = np.sin(np.radians(lat2[start:stop] - lat1) / 2)
+        sin_dlon = np.sin(np.radians(lon2[start:stop] - lon1) / 2)
+        a = sin_dlat * sin_dlat + cos_lat1 * cos_lat2[start:stop] * sin_dlon * sin_dlon
+        yield start, stop, EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distance_matrix(lat1, lon1, lat2, lon2, chunk_size=DISTANCE_CHUNK_SIZE, dtype=np.float64):
+    """ Full len(lat1) x len(lat2) haversine distance matrix in km.
+    Computed in column blocks so peak temporary memory stays bounded;
+    pass dtype=np.float32 to halve the size of the result itself.
+    """
+    rows = np.asarray(lat1).size
+    out = np.empty((rows, np.asarray(lat2).size), dtype=dtype)
+
+    for start, stop, block in iter_distance_blocks(lat1, lon1, lat2, lon2, chunk_size):
+        out[:, start:stop] = block
+
+    return out
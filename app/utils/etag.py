@@ -0,0 +1,29 @@
+import hashlib
+
+
+def make_etag(*parts):
+    """ Strong ETag over the repr of every input that shapes a response.
+    blake2b rather than hash() so every worker derives the same tag.
+    """
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """ If-None-Match comparison (RFC 9110 weak comparison, as required
+    for GET): handles lists, W/ prefixes and "*".
+    """
+
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
@@ -0,0 +1,23 @@
+import orjson
+from fastapi import Response
+
+
+def dumps(value):
+    """ Serializes to UTF-8 JSON bytes, several times faster than json.dumps. """
+    return orjson.dumps(value)
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+def json_response(payload, status_code=200, headers=None):
+    """ Pre-serialized response. Returning a Response from a route skips
+    FastAPI's jsonable_encoder pass and its own JSON encoding.
+    """
+    return Response(
+        content=orjson.dumps(payload),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
@@ -0,0 +1,270 @@
+""" Offline load test for the pricing endpoints.
+
+Usage:
+    python -m benchmarks.pricing --warehouses 2000 --products 200 \\
+        --customers 1000 --requests 5000 --output bench.json
+
+Drives the FastAPI app in-process through httpx.ASGITransport against a
+seeded database (in-memory SQLite unless --database-url is given) with an
+in-memory Redis stand-in, replays ShippingRequest-style traffic against
+GET /shipping-charge, POST /shipping-charge/calculate and
+GET /warehouse/nearest, and reports throughput and p50/p95/p99 latency for
+a cold and a warm cache pass. Results are written as JSON for comparison
+between runs.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import fakeredis
+import numpy as np
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app import cache, database
+from app.api.deps import get_db
+from app.database import Base
+from app.main import app
+from app.models import Seller, Customer, Warehouse, Product, WarehouseInventory
+from app.services import serviceability
+
+ENDPOINTS = ("shipping-charge", "calculate", "nearest")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pricing")
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("--sellers", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--warehouses", type=int, default=500)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--stock-ratio", type=float, default=0.3,
+                        help="fraction of warehouses holding each product")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="requests replayed per endpoint per pass")
+    parser.add_argument("--unique", type=int, default=500,
+                        help="distinct requests the traffic is drawn from")
+    parser.add_argument("--traffic", default=None,
+                        help="JSONL file of ShippingRequest records to replay instead")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+async def seed(session_factory, args, rng):
+    def point():
+        return rng.uniform(8.0, 32.0), rng.uniform(70.0, 90.0)
+
+    async with session_factory() as db:
+        for model, count, extra in (
+            (Seller, args.sellers, {}),
+            (Customer, args.customers, {}),
+            (Warehouse, args.warehouses, {"capacity": 1000}),
+        ):
+            rows = []
+            for i in range(count):
+                lat, lon = point()
+                rows.append({
+                    "id": i + 1,
+                    "name": f"{model.__tablename__}-{i + 1}",
+                    "latitude": lat,
+                    "longitude": lon,
+                    **extra
+                })
+            await db.execute(insert(model), rows)
+
+        await db.execute(insert(Product), [
+            {
+                "id": i + 1,
+                "seller_id": rng.randint(1, args.sellers),
+                "name": f"product-{i + 1}",
+                "weight": round(rng.uniform(0.5, 25.0), 2),
+                "length": round(rng.uniform(5, 100), 1),
+                "width": round(rng.uniform(5, 60), 1),
+                "height": round(rng.uniform(5, 60), 1),
+            }
+            for i in range(args.products)
+        ])
+
+        inventory = [
+            {
+                "warehouse_id": warehouse_id,
+                "product_id": product_id,
+                "available_units": rng.randint(0, 200),
+            }
+            for product_id in range(1, args.products + 1)
+            for warehouse_id in range(1, args.warehouses + 1)
+            if rng.random() < args.stock_ratio
+        ]
+        for start in range(0, len(inventory), 5000):
+            await db.execute(insert(WarehouseInventory), inventory[start:start + 5000])
+
+        await db.commit()
+
+        # Raw inserts bypass /admin, which maintains serviceability row by row
+        await serviceability.rebuild(db)
+
+
+def build_traffic(args, rng):
+    if args.traffic:
+        with open(args.traffic, encoding="utf-8") as source:
+            pool = [json.loads(line) for line in source if line.strip()]
+    else:
+        pool = [
+            {
+                "sellerId": rng.randint(1, args.sellers),
+                "customerId": rng.randint(1, args.customers),
+                "productId": rng.randint(1, args.products),
+                "quantity": rng.randint(1, 20),
+                "deliverySpeed": rng.choice(("standard", "express")),
+            }
+            for _ in range(args.unique)
+        ]
+
+    for record in pool:
+        record.setdefault("warehouseId", rng.randint(1, args.warehouses))
+
+    return [rng.choice(pool) for _ in range(args.requests)]
+
+
+def send(client, endpoint, record):
+    if endpoint == "shipping-charge":
+        return client.get("/api/v1/shipping-charge", params={
+            "warehouseId": record["warehouseId"],
+            "customerId": record["customerId"],
+            "productId": record["productId"],
+            "quantity": record["quantity"],
+            "deliverySpeed": record["deliverySpeed"],
+        })
+    if endpoint == "calculate":
+        return client.post("/api/v1/shipping-charge/calculate", json={
+            key: record[key]
+            for key in ("sellerId", "customerId", "productId", "quantity", "deliverySpeed")
+        })
+    return client.get("/api/v1/warehouse/nearest", params={
+        "sellerId": record["sellerId"],
+        "productId": record["productId"],
+        "quantity": record["quantity"],
+    })
+
+
+async def replay(client, endpoint, traffic, concurrency):
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(record):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await send(client, endpoint, record)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(record) for record in traffic))
+    elapsed = time.perf_counter() - started
+
+    millis = np.array(latencies) * 1000
+    return {
+        "requests": len(traffic),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(traffic) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(millis, 50)), 3),
+        "p95_ms": round(float(np.percentile(millis, 95)), 3),
+        "p99_ms": round(float(np.percentile(millis, 99)), 3),
+        "max_ms": round(float(millis.max()), 3),
+        "status_counts": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def flush_caches():
+    await cache.r.flushall()
+    for tier in cache._local_tiers:
+        tier.clear()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+
+    cache.r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    engine = create_async_engine(args.database_url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    # Batched entity lookups and other background work open their own sessions
+    database.session_factory = session_factory
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    await seed(session_factory, args, rng)
+    traffic = build_traffic(args, rng)
+
+    results = {}
+    transport = ASGITransport(app=app)
+
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for endpoint in ENDPOINTS:
+            await flush_caches()
+            cold = await replay(client, endpoint, traffic, args.concurrency)
+            warm = await replay(client, endpoint, traffic, args.concurrency)
+            results[endpoint] = {"cold": cold, "warm": warm}
+
+    await engine.dispose()
+    app.dependency_overrides.pop(get_db, None)
+
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_revision": git_revision(),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    with open(args.output, "w", encoding="utf-8") as sink:
+        json.dump(report, sink, indent=2)
+
+    for endpoint, phases in report["results"].items():
+        for phase, stats in phases.items():
+            print(
+                f"{endpoint:16} {phase:5} {stats['throughput_rps']:>9.1f} req/s  "
+                f"p50 {stats['p50_ms']:.2f}ms  p95 {stats['p95_ms']:.2f}ms  "
+                f"p99 {stats['p99_ms']:.2f}ms",
+                file=sys.stderr
+            )
+
+
+if __name__ == "__main__":
+    main()
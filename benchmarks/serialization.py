@@ -0,0 +1,99 @@
+""" Microbenchmark for the JSON paths on cache hits and responses.
+
+Usage:
+    python -m benchmarks.serialization --number 20000
+
+Compares the stdlib json + FastAPI default encoding (jsonable_encoder and
+JSONResponse) with the orjson paths used by app.cache and the routes, on a
+quote body, a batch body and a cached stock ladder. Reports the best
+per-operation time over several repeats.
+"""
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.utils import fastjson
+from app.utils.fastjson import json_response
+
+
+def payloads(rng):
+    quote = {
+        "shippingCharge": 1234.56,
+        "nearestWarehouse": {
+            "warehouseId": 42,
+            "warehouseLocation": {"lat": 19.0760, "long": 72.8777}
+        }
+    }
+    batch = {
+        "results": [
+            {"shippingCharge": round(rng.uniform(10, 5000), 2)}
+            for _ in range(100)
+        ]
+    }
+    ladder = [
+        [i, rng.uniform(8, 35), rng.uniform(68, 97), i * 10]
+        for i in range(1, 17)
+    ]
+    return {"quote": quote, "batch (100 items)": batch, "ladder (16 rungs)": ladder}
+
+
+def cases(payload):
+    text = json.dumps(payload)
+    return {
+        "decode cache hit": (
+            lambda: json.loads(text),
+            lambda: fastjson.loads(text),
+        ),
+        "encode cache write": (
+            lambda: json.dumps(payload),
+            lambda: fastjson.dumps(payload),
+        ),
+        "render response": (
+            lambda: JSONResponse(jsonable_encoder(payload)).body,
+            lambda: json_response(payload).body,
+        ),
+    }
+
+
+def best_ns(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="also write results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+
+    for name, payload in payloads(random.Random(args.seed)).items():
+        for operation, (baseline, fast) in cases(payload).items():
+            before = best_ns(baseline, args.number, args.repeat)
+            after = best_ns(fast, args.number, args.repeat)
+            results.append({
+                "payload": name,
+                "operation": operation,
+                "stdlib_ns": round(before, 1),
+                "orjson_ns": round(after, 1),
+                "speedup": round(before / after, 2),
+            })
+            print(
+                f"{name:18} {operation:18} {before:>9.0f} ns -> {after:>7.0f} ns  "
+                f"x{before / after:.1f}",
+                file=sys.stderr
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as sink:
+            json.dump(results, sink, indent=2)
+
+
+if __name__ == "__main__":
+    main()
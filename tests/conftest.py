@@ -1,14 +1,18 @@
+import pytest
 import pytest_asyncio
+from contextlib import contextmanager
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from app.main import app
-from app.database import Base
+from app import database
+from app.database import instrument_engine, track_queries
+from app.migrations import migrate
 from app.api.deps import get_db
 
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_async_engine(TEST_DATABASE_URL)
+engine = instrument_engine(create_async_engine(TEST_DATABASE_URL))
 
 TestingSessionLocal = async_sessionmaker(
     engine,
@@ -21,12 +25,12 @@ async def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+database.session_factory = TestingSessionLocal
 
 
 @pytest_asyncio.fixture(scope="session")
 async def setup_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await migrate(engine)
     yield
 
 @pytest_asyncio.fixture
@@ -38,3 +42,26 @@ async def client(setup_db):
         base_url="http://test"
     ) as ac:
         yield ac
+
+
+@pytest_asyncio.fixture
+async def db_session(setup_db):
+    async with TestingSessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def query_budget():
+    """ Usage: `with query_budget(3): await client.get(...)` fails the test if
+    the block runs more than three SQL statements.
+    """
+
+    @contextmanager
+    def budget(max_queries):
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, (
+            f"expected at most {max_queries} queries, ran {stats.count}"
+        )
+
+    return budget
@@ -0,0 +1,60 @@
+import io
+import json
+from app.batch import Snapshot, run
+from app.services.entity_cache import (
+    SellerRecord,
+    CustomerRecord,
+    WarehouseRecord,
+    ProductRecord,
+)
+
+
+def make_snapshot():
+    return Snapshot(
+        sellers={1: SellerRecord(1, "Seller", 12.97, 77.59)},
+        customers={1: CustomerRecord(1, "Kirana", 13.03, 77.59)},
+        warehouses={
+            1: WarehouseRecord(1, "Near", 12.98, 77.60, 10),
+            2: WarehouseRecord(2, "Far", 19.07, 72.87, 10),
+        },
+        products={1: ProductRecord(1, 1, "Rice", 10, 100, 50, 40)},
+        stock={1: [(1, 3), (2, 100)]},
+    )
+
+
+def test_results_stream_in_input_order_with_inline_errors():
+    requests = [
+        {"sellerId": 1, "customerId": 1, "productId": 1, "quantity": q, "deliverySpeed": "standard"}
+        for q in (1, 5, 500)
+    ]
+    requests.append({"sellerId": 9, "customerId": 1, "productId": 1, "quantity": 1, "deliverySpeed": "standard"})
+    source = io.StringIO("\n".join(json.dumps(r) for r in requests) + "\n")
+    sink = io.StringIO()
+
+    records, errors, _ = run(source, sink, make_snapshot(), workers=2, chunk_size=1)
+
+    results = [json.loads(line) for line in sink.getvalue().splitlines()]
+
+    assert (records, errors) == (4, 2)
+    assert [r["line"] for r in results] == [1, 2, 3, 4]
+    assert results[0]["warehouseId"] == 1
+    assert results[1]["warehouseId"] == 2
+    assert results[2]["error"]["detail"] == "No warehouse available with sufficient stock."
+    assert results[3]["error"]["detail"] == "Seller not found"
+
+
+def test_unlocated_warehouses_and_unknown_counts_are_skipped():
+    snapshot = make_snapshot()
+    snapshot.warehouses[3] = WarehouseRecord(3, "Unlocated", None, None, 10)
+    snapshot.stock[1] = [(3, 50), (1, None), (2, 100)]
+
+    source = io.StringIO(json.dumps({
+        "sellerId": 1, "customerId": 1, "productId": 1, "quantity": 1,
+        "deliverySpeed": "standard"
+    }) + "\n")
+    sink = io.StringIO()
+
+    records, errors, _ = run(source, sink, snapshot, workers=1)
+
+    assert (records, errors) == (1, 0)
+    assert json.loads(sink.getvalue())["warehouseId"] == 2
@@ -0,0 +1,39 @@
+import time
+from app.cache import LocalCache, _MISSING
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is _MISSING
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_local_cache_expires_and_counts(monkeypatch):
+    cache = LocalCache(maxsize=10, ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("k", {"shippingCharge": 1.0}, ttl=1800)
+
+    assert cache.get("k") == {"shippingCharge": 1.0}
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+
+    assert cache.get("k") is _MISSING
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_local_cache_pattern_delete():
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set("shipping:1:2:7:1:standard", 1)
+    cache.set("shipping:1:2:8:1:standard", 2)
+    cache.delete_pattern("shipping:*:7:*")
+
+    assert cache.get("shipping:1:2:7:1:standard") is _MISSING
+    assert cache.get("shipping:1:2:8:1:standard") == 2
@@ -0,0 +1,95 @@
+import asyncio
+import random
+import pytest
+from collections import Counter
+from app.services import cache_warmer
+from app.services.cache_warmer import SpaceSaving
+
+
+def test_space_saving_keeps_heavy_hitters_within_error_bounds():
+    rng = random.Random(3)
+    stream = [f"hot:{i}" for i in range(5) for _ in range(400)]
+    stream += [f"cold:{rng.randrange(5000)}" for _ in range(8000)]
+    rng.shuffle(stream)
+
+    sketch = SpaceSaving(50)
+    for key in stream:
+        sketch.add(key)
+
+    exact = Counter(stream)
+    top = sketch.top(5)
+
+    assert len(sketch) == 50
+    assert {key for key, _, _ in top} == {f"hot:{i}" for i in range(5)}
+    for key, count, error in top:
+        assert count - error <= exact[key] <= count
+
+
+@pytest.mark.asyncio
+async def test_warm_respects_concurrency_and_can_be_cancelled(monkeypatch):
+    running = 0
+    peak = 0
+    warmed = []
+
+    async def fake_warm_key(key):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.01)
+            if key == "bad":
+                raise Exception("Product not found")
+            warmed.append(key)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(cache_warmer, "warm_key", fake_warm_key)
+
+    keys = [f"k{i}" for i in range(10)] + ["bad"]
+    assert await cache_warmer.warm(keys, concurrency=3, rate=0) == 10
+    assert peak == 3
+    assert sorted(warmed) == sorted(keys[:-1])
+
+    task = asyncio.create_task(cache_warmer.warm([f"slow{i}" for i in range(100)], rate=10))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert running == 0
+
+
+@pytest.mark.asyncio
+async def test_inventory_write_warms_hot_quotes_for_the_product(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Warm Seller", "latitude": 21.17, "longitude": 72.83
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Warm Kirana", "latitude": 21.20, "longitude": 72.80
+    })).json()
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Warm_WH", "latitude": 21.18, "longitude": 72.84, "capacity": 10
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Warm Item", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+    await client.post("/api/v1/admin/inventory", json={
+        "warehouse_id": warehouse["id"], "product_id": product["id"], "available_units": 5
+    })
+
+    response = await client.post("/api/v1/shipping-charge/calculate", json={
+        "sellerId": seller["id"], "customerId": customer["id"],
+        "productId": product["id"], "quantity": 1, "deliverySpeed": "standard"
+    })
+    assert response.status_code == 200
+
+    key = cache_warmer.combined_key(seller["id"], customer["id"], product["id"])
+    assert key in cache_warmer.sketch
+
+    cache_warmer._pending.clear()
+    cache_warmer.schedule([product["id"]])
+    assert await cache_warmer._next_pass() == [key]
+
+    await cache_warmer.publish()
+    assert key in await cache_warmer.hot_keys()
+    assert await cache_warmer.warm([key], rate=0) == 1
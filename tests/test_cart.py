@@ -0,0 +1,189 @@
+import random
+import pytest
+from app.services.cart_service import plan_shipments
+
+
+def test_plan_prefers_fewest_shipments_then_nearest():
+    demand = {1: 2, 2: 1, 3: 5}
+    stock = {
+        # Nearest, but can only fill one line
+        10: (12.98, 77.60, {1: 9}),
+        # Farther, fills every line
+        20: (13.50, 78.10, {1: 2, 2: 1, 3: 5}),
+        # Same lines as 20, even farther
+        30: (15.00, 79.00, {1: 2, 2: 1, 3: 5}),
+    }
+
+    shipments, unserved = plan_shipments(12.97, 77.59, demand, stock)
+
+    assert shipments == [(20, [1, 2, 3])]
+    assert unserved == []
+
+
+def test_small_carts_get_the_smallest_cover():
+    demand = {product_id: 1 for product_id in range(1, 7)}
+    stock = {
+        # Nearest and fills the most lines, so greedy would start here and
+        # still need both of the others
+        10: (12.98, 77.60, {1: 1, 2: 1, 3: 1, 4: 1}),
+        20: (13.50, 78.10, {1: 1, 3: 1, 5: 1}),
+        30: (14.00, 78.50, {2: 1, 4: 1, 6: 1}),
+    }
+
+    shipments, unserved = plan_shipments(12.97, 77.59, demand, stock)
+
+    assert shipments == [(20, [1, 3, 5]), (30, [2, 4, 6])]
+    assert unserved == []
+
+
+def test_plan_reports_lines_no_warehouse_can_fill():
+    stock = {10: (12.98, 77.60, {1: 9, 2: 1})}
+
+    shipments, unserved = plan_shipments(12.97, 77.59, {1: 2, 2: 3, 3: 1}, stock)
+
+    assert shipments == [(10, [1])]
+    assert unserved == [2, 3]
+
+
+def test_plan_covers_large_carts():
+    rng = random.Random(7)
+    demand = {product_id: rng.randint(1, 5) for product_id in range(300)}
+    stock = {
+        warehouse_id: (
+            rng.uniform(8, 35),
+            rng.uniform(68, 97),
+            {product_id: rng.randint(0, 8) for product_id in rng.sample(range(300), 60)}
+        )
+        for warehouse_id in range(200)
+    }
+
+    shipments, unserved = plan_shipments(20.0, 80.0, demand, stock)
+
+    assigned = [product_id for _, lines in shipments for product_id in lines]
+    assert len(assigned) == len(set(assigned))
+    assert set(assigned) | set(unserved) == set(demand)
+
+    for warehouse_id, lines in shipments:
+        held = stock[warehouse_id][2]
+        assert all(held.get(product_id, 0) >= demand[product_id] for product_id in lines)
+
+
+@pytest.mark.asyncio
+async def test_cart_consolidates_lines_into_one_shipment(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Cart Seller", "latitude": 12.9716, "longitude": 77.5946
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Cart Kirana", "latitude": 13.0827, "longitude": 80.2707
+    })).json()
+    near = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Cart_Near", "latitude": 12.9762, "longitude": 77.6033, "capacity": 100
+    })).json()
+    full = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Cart_Full", "latitude": 13.1, "longitude": 77.7, "capacity": 100
+    })).json()
+
+    products = []
+    for name, weight in (("Soap", 0.5), ("Oil", 2)):
+        products.append((await client.post("/api/v1/admin/product", json={
+            "seller_id": seller["id"], "name": name, "weight": weight,
+            "length": 10, "width": 10, "height": 10
+        })).json())
+
+    stock = [
+        (near, products[0], 50),
+        (full, products[0], 10),
+        (full, products[1], 10),
+    ]
+    for warehouse, product, units in stock:
+        await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"],
+            "product_id": product["id"],
+            "available_units": units
+        })
+
+    response = await client.post("/api/v1/shipping-charge/cart", json={
+        "sellerId": seller["id"],
+        "customerId": customer["id"],
+        "deliverySpeed": "standard",
+        "items": [
+            {"productId": products[0]["id"], "quantity": 2},
+            {"productId": products[1]["id"], "quantity": 3},
+            {"productId": products[0]["id"], "quantity": 1},
+        ]
+    })
+    assert response.status_code == 200
+    body = response.json()
+
+    # One shipment from the warehouse that holds both products
+    [shipment] = body["shipments"]
+    assert shipment["warehouseId"] == full["id"]
+    assert shipment["items"] == [
+        {"productId": products[0]["id"], "quantity": 3},
+        {"productId": products[1]["id"], "quantity": 3},
+    ]
+    assert shipment["chargeableWeight"] == 7.5
+    assert shipment["courierCharge"] == 10
+    assert body["shippingCharge"] == shipment["finalCost"]
+
+    # A single line still ships from the nearest warehouse that has it
+    single = await client.post("/api/v1/shipping-charge/cart", json={
+        "sellerId": seller["id"],
+        "customerId": customer["id"],
+        "deliverySpeed": "standard",
+        "items": [{"productId": products[0]["id"], "quantity": 20}]
+    })
+    assert single.json()["shipments"][0]["warehouseId"] == near["id"]
+
+    short = await client.post("/api/v1/shipping-charge/cart", json={
+        "sellerId": seller["id"],
+        "customerId": customer["id"],
+        "deliverySpeed": "standard",
+        "items": [{"productId": products[1]["id"], "quantity": 11}]
+    })
+    assert short.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_cart_skips_units_held_by_reservations(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Held Seller", "latitude": 18.52, "longitude": 73.85
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Held Kirana", "latitude": 19.07, "longitude": 72.87
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Held Item", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+
+    warehouses = []
+    for name, latitude, units in (("Held_Near", 18.53, 4), ("Held_Far", 18.90, 4)):
+        warehouse = (await client.post("/api/v1/admin/warehouse", json={
+            "name": name, "latitude": latitude, "longitude": 73.86, "capacity": 10
+        })).json()
+        await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"], "product_id": product["id"], "available_units": units
+        })
+        warehouses.append(warehouse)
+    near, far = warehouses
+
+    held = await client.post("/api/v1/reservations", json={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 3
+    })
+    assert held.json()["warehouseId"] == near["id"]
+
+    cart = {
+        "sellerId": seller["id"],
+        "customerId": customer["id"],
+        "deliverySpeed": "standard",
+        "items": [{"productId": product["id"], "quantity": 2}]
+    }
+    response = await client.post("/api/v1/shipping-charge/cart", json=cart)
+
+    # Only 1 unit is left at the near warehouse, matching /warehouse/nearest
+    assert response.json()["shipments"][0]["warehouseId"] == far["id"]
+    nearest = await client.get("/api/v1/warehouse/nearest", params={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 2
+    })
+    assert nearest.json()["warehouseId"] == far["id"]
@@ -0,0 +1,74 @@
+import os
+import pytest
+from app.database import track_queries
+from app.models import Product, Warehouse
+from app.services import catalog_snapshot, entity_cache
+
+
+@pytest.mark.asyncio
+async def test_snapshot_serves_records_and_swaps_generations(db_session, tmp_path, monkeypatch):
+    # Every row arrives in its own chunk, so columns are stitched together
+    monkeypatch.setattr(catalog_snapshot, "SNAPSHOT_FETCH_SIZE", 1)
+
+    warehouse = Warehouse(name="Snapshot Hub ✓", latitude=21.1, longitude=79.0, capacity=None)
+    product = Product(seller_id=None, name=None, weight=2.5, length=10, width=20, height=30)
+    db_session.add_all([warehouse, product])
+    await db_session.commit()
+
+    try:
+        await catalog_snapshot.write_snapshot(db_session, tmp_path)
+        snapshot = catalog_snapshot.attach(tmp_path)
+        first_generation = snapshot.generation
+
+        with track_queries() as stats:
+            hub = await entity_cache.warehouses.get(db_session, warehouse.id)
+            item = await entity_cache.products.get(db_session, product.id)
+
+        assert stats.count == 0
+        assert hub == entity_cache.WarehouseRecord(
+            warehouse.id, "Snapshot Hub ✓", 21.1, 79.0, None
+        )
+        assert item == entity_cache.ProductRecord(product.id, None, None, 2.5, 10, 20, 30)
+        assert snapshot.lookup("warehouse", 10 ** 30) is None
+
+        # Rows created after the snapshot fall through to the database
+        later = Warehouse(name="Later", latitude=1.0, longitude=2.0, capacity=5)
+        db_session.add(later)
+        await db_session.commit()
+        assert snapshot.lookup("warehouse", later.id) is None
+        assert (await entity_cache.warehouses.get(db_session, later.id)).name == "Later"
+
+        await catalog_snapshot.write_snapshot(db_session, tmp_path)
+        swapped = catalog_snapshot.attach(tmp_path)
+
+        assert swapped.generation != first_generation
+        assert swapped.lookup("warehouse", later.id)[1] == "Later"
+        assert swapped.lookup("warehouse", warehouse.id)[1] == "Snapshot Hub ✓"
+    finally:
+        catalog_snapshot.detach()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_dumps_only_the_tables_written(db_session, tmp_path):
+    db_session.add(Warehouse(name="Linked", latitude=12.9, longitude=77.6, capacity=1))
+    await db_session.commit()
+
+    try:
+        first = await catalog_snapshot.write_snapshot(db_session, tmp_path)
+
+        product = Product(seller_id=None, name="Fresh", weight=1, length=1, width=1, height=1)
+        db_session.add(product)
+        await db_session.commit()
+
+        second = await catalog_snapshot.write_snapshot(db_session, tmp_path, kinds={"product"})
+        snapshot = catalog_snapshot.attach(tmp_path)
+
+        assert snapshot.lookup("product", product.id)[2] == "Fresh"
+        # The unchanged table shares its files with the previous generation
+        for name in ("warehouse.id.npy", "warehouse.name.bin"):
+            assert os.path.samefile(tmp_path / first / name, tmp_path / second / name)
+        assert not os.path.samefile(
+            tmp_path / first / "product.id.npy", tmp_path / second / "product.id.npy"
+        )
+    finally:
+        catalog_snapshot.detach()
@@ -0,0 +1,37 @@
+import math
+import random
+import numpy as np
+from app.utils.distance import haversine, haversine_array, distance_matrix
+
+
+def random_coords(rng, n):
+    return (
+        np.array([rng.uniform(-85, 85) for _ in range(n)]),
+        np.array([rng.uniform(-180, 180) for _ in range(n)]),
+    )
+
+
+def test_haversine_array_matches_scalar():
+    rng = random.Random(3)
+    lat1, lon1 = random_coords(rng, 200)
+    lat2, lon2 = random_coords(rng, 200)
+
+    result = haversine_array(lat1, lon1, lat2, lon2)
+
+    for i in range(200):
+        expected = haversine(lat1[i], lon1[i], lat2[i], lon2[i])
+        assert math.isclose(result[i], expected, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def test_distance_matrix_chunks_agree_with_scalar():
+    rng = random.Random(5)
+    lat1, lon1 = random_coords(rng, 7)
+    lat2, lon2 = random_coords(rng, 50)
+
+    matrix = distance_matrix(lat1, lon1, lat2, lon2, chunk_size=8)
+
+    assert matrix.shape == (7, 50)
+    for i in range(7):
+        for j in range(50):
+            expected = haversine(lat1[i], lon1[i], lat2[j], lon2[j])
+            assert math.isclose(matrix[i, j], expected, rel_tol=1e-9, abs_tol=1e-9)
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from sqlalchemy import event
+from app.models import Customer
+from app.services import entity_cache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query_then_hit(db_session):
+    created = [
+        Customer(name=f"Entity Kirana {i}", latitude=12.0 + i, longitude=77.0)
+        for i in range(3)
+    ]
+    db_session.add_all(created)
+    await db_session.commit()
+
+    ids = [customer.id for customer in created]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        records = await asyncio.gather(
+            *(entity_cache.customers.get(db_session, customer_id) for customer_id in ids)
+        )
+        assert len(statements) == 1
+
+        again = await entity_cache.customers.get(db_session, ids[0])
+        assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert [record.id for record in records] == ids
+    assert again == records[0]
+    assert again.latitude == 12.0
+
+
+@pytest.mark.asyncio
+async def test_batch_does_not_borrow_the_callers_session(db_session):
+    customer = Customer(name="Own Session Kirana", latitude=13.0, longitude=77.5)
+    db_session.add(customer)
+    await db_session.commit()
+
+    # The first caller's request may be gone before the batch runs
+    record = await entity_cache.customers.get(None, customer.id)
+
+    assert record.latitude == 13.0
+
+
+@pytest.mark.asyncio
+async def test_missing_ids_are_cached_until_created(db_session, query_budget):
+    customer_id = 880001
+
+    with query_budget(1):
+        assert await entity_cache.customers.get(db_session, customer_id) is None
+        assert await entity_cache.customers.get(db_session, customer_id) is None
+        assert await entity_cache.customers.get_many(db_session, [customer_id]) == {}
+
+    db_session.add(Customer(id=customer_id, name="Late Kirana", latitude=10.0, longitude=76.0))
+    await db_session.commit()
+
+    # Still negative until the entity is created through /admin ...
+    assert await entity_cache.customers.get(db_session, customer_id) is None
+
+    # ... whose invalidation clears it precisely
+    await entity_cache.customers.invalidate(customer_id)
+    assert (await entity_cache.customers.get(db_session, customer_id)).name == "Late Kirana"
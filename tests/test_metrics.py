@@ -0,0 +1,38 @@
+import pytest
+from app.metrics import Histogram, Counter, render_prometheus
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_stage_seconds", "Test histogram.", ("stage",), buckets=(0.1, 1.0))
+    series = histogram.labels("strategy")
+    series.observe(0.05)
+    series.observe(0.5)
+    series.observe(2.0)
+
+    lines = histogram.render()
+
+    assert 'test_stage_seconds_bucket{stage="strategy",le="0.1"} 1' in lines
+    assert 'test_stage_seconds_bucket{stage="strategy",le="1.0"} 2' in lines
+    assert 'test_stage_seconds_bucket{stage="strategy",le="+Inf"} 3' in lines
+    assert 'test_stage_seconds_count{stage="strategy"} 3' in lines
+
+
+def test_counter_and_exposition_format():
+    counter = Counter("test_errors_total", "Test counter.", ("type",))
+    counter.inc("http_404")
+    counter.inc("http_404")
+
+    assert counter.value("http_404") == 2
+    assert counter.value("http_500") == 0
+    assert 'test_errors_total{type="http_404"} 2' in render_prometheus()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_exposes_pipeline_metrics(client):
+    await client.get("/api/v1/shipping-charge")
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE pricing_stage_duration_seconds histogram" in response.text
+    assert "errors_total{type=\"http_" in response.text
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import text, select, func
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.migrations import migrate, MIGRATIONS
+from app.models import WarehouseInventory
+
+
+@pytest.mark.asyncio
+async def test_migrations_dedupe_inventory_and_are_idempotent():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    # The pre-migration schema: no version table and no inventory indexes
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE warehouse_inventory ("
+            "id INTEGER PRIMARY KEY, warehouse_id INTEGER, "
+            "product_id INTEGER, available_units INTEGER)"
+        ))
+        await conn.execute(
+            text(
+                "INSERT INTO warehouse_inventory (warehouse_id, product_id, available_units) "
+                "VALUES (:w, :p, :units)"
+            ),
+            [
+                {"w": 1, "p": 1, "units": 5},
+                {"w": 1, "p": 1, "units": 40},
+                {"w": 1, "p": 1, "units": 40},
+                {"w": 2, "p": 1, "units": 7},
+            ]
+        )
+
+    assert await migrate(engine) == MIGRATIONS[-1][0]
+    assert await migrate(engine) == MIGRATIONS[-1][0]
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(
+            "SELECT id, warehouse_id, available_units FROM warehouse_inventory ORDER BY id"
+        ))).all()
+        versions = (await conn.execute(text("SELECT version FROM schema_version"))).scalars().all()
+        indexes = (await conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        ))).scalars().all()
+
+    assert rows == [(3, 1, 40), (4, 2, 7)]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+    assert {
+        "uq_inventory_warehouse_product",
+        "ix_inventory_product_units",
+        "ix_products_seller_id",
+    } <= set(indexes)
+
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_inventory_writes_upsert_a_single_row(client, db_session):
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Upsert_WH", "latitude": 23.02, "longitude": 72.57, "capacity": 10
+    })).json()
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Upsert Seller", "latitude": 23.0, "longitude": 72.5
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Upserted", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+
+    for units in (3, 9):
+        response = await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"],
+            "product_id": product["id"],
+            "available_units": units
+        })
+        assert response.status_code == 200
+        assert response.json()["available_units"] == units
+
+    count = (await db_session.execute(
+        select(func.count()).select_from(WarehouseInventory).where(
+            WarehouseInventory.warehouse_id == warehouse["id"],
+            WarehouseInventory.product_id == product["id"]
+        )
+    )).scalar_one()
+    assert count == 1
@@ -0,0 +1,114 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from app import cache
+from app.main import app
+from app.metrics import QueryStatsMiddleware
+
+
+async def _seed(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Budget Seller", "latitude": 19.07, "longitude": 72.87
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Budget Customer", "latitude": 18.52, "longitude": 73.85
+    })).json()
+    warehouses = [
+        (await client.post("/api/v1/admin/warehouse", json={
+            "name": f"Budget WH {i}",
+            "latitude": 19.0 + i * 0.01,
+            "longitude": 72.8 + i * 0.01,
+            "capacity": 1000
+        })).json()
+        for i in range(3)
+    ]
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Budget Product",
+        "weight": 1.0, "length": 10, "width": 10, "height": 10
+    })).json()
+
+    for warehouse in warehouses:
+        await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"],
+            "product_id": product["id"],
+            "available_units": 50
+        })
+
+    return seller, customer, warehouses[0], product
+
+
+async def _clear_local_tiers():
+    for tier in cache._local_tiers:
+        tier.clear()
+
+
+@pytest.mark.asyncio
+async def test_endpoints_stay_within_query_budget(client, query_budget):
+    seller, customer, warehouse, product = await _seed(client)
+    await _clear_local_tiers()
+
+    # Cold: the seller lookup plus the product's stock query
+    with query_budget(2):
+        response = await client.get("/api/v1/warehouse/nearest", params={
+            "sellerId": seller["id"], "productId": product["id"], "quantity": 1
+        })
+    assert response.status_code == 200
+
+    with query_budget(3):
+        response = await client.get("/api/v1/shipping-charge", params={
+            "warehouseId": warehouse["id"], "customerId": customer["id"],
+            "productId": product["id"], "quantity": 2, "deliverySpeed": "standard"
+        })
+    assert response.status_code == 200
+
+    # Warm: a different quantity reuses the same quantity-independent entries
+    with query_budget(0):
+        response = await client.get("/api/v1/shipping-charge", params={
+            "warehouseId": warehouse["id"], "customerId": customer["id"],
+            "productId": product["id"], "quantity": 7, "deliverySpeed": "express"
+        })
+    assert response.status_code == 200
+
+    await _clear_local_tiers()
+    await cache.delete_pattern("stock:*")
+
+    with query_budget(4):
+        response = await client.post("/api/v1/shipping-charge/calculate", json={
+            "sellerId": seller["id"], "customerId": customer["id"],
+            "productId": product["id"], "quantity": 2, "deliverySpeed": "express"
+        })
+    assert response.status_code == 200
+
+    with query_budget(0):
+        response = await client.post("/api/v1/shipping-charge/calculate", json={
+            "sellerId": seller["id"], "customerId": customer["id"],
+            "productId": product["id"], "quantity": 9, "deliverySpeed": "standard"
+        })
+    assert response.status_code == 200
+
+    await _clear_local_tiers()
+
+    # Batch: one IN (...) query per table regardless of the item count
+    with query_budget(3):
+        response = await client.post("/api/v1/shipping-charge/batch", json={"items": [
+            {
+                "warehouseId": warehouse["id"], "customerId": customer["id"],
+                "productId": product["id"], "quantity": quantity,
+                "deliverySpeed": "standard"
+            }
+            for quantity in range(1, 21)
+        ]})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_debug_middleware_reports_query_headers(setup_db):
+    transport = ASGITransport(app=QueryStatsMiddleware(app))
+
+    async with AsyncClient(transport=transport, base_url="http://test") as debug_client:
+        response = await debug_client.get("/api/v1/warehouse/nearest", params={
+            "sellerId": 987654, "productId": 1, "quantity": 1
+        })
+
+    assert response.status_code == 404
+    assert response.headers["x-db-query-count"] == "1"
+    assert float(response.headers["x-db-time-ms"]) >= 0
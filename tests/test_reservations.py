@@ -0,0 +1,263 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+import pytest
+from sqlalchemy import select
+from app import cache, database
+from app.models import WarehouseInventory
+from app.services import bulk_ingest, stock_mirror
+
+
+async def _seed(client, stock):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Reserve Seller", "latitude": 17.38, "longitude": 78.48
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Reserved Item", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+
+    warehouses = []
+    for i, units in enumerate(stock):
+        warehouse = (await client.post("/api/v1/admin/warehouse", json={
+            "name": f"Reserve_WH_{i}",
+            "latitude": 17.40 + i,
+            "longitude": 78.50,
+            "capacity": 100
+        })).json()
+        await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"],
+            "product_id": product["id"],
+            "available_units": units
+        })
+        warehouses.append(warehouse)
+
+    return seller, product, warehouses
+
+
+async def _units(db_session, warehouse, product):
+    return (await db_session.execute(
+        select(WarehouseInventory.available_units).where(
+            WarehouseInventory.warehouse_id == warehouse["id"],
+            WarehouseInventory.product_id == product["id"]
+        ).execution_options(populate_existing=True)
+    )).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reservations_never_oversell(client):
+    seller, product, (near, far) = await _seed(client, [3, 5])
+    body = {"sellerId": seller["id"], "productId": product["id"], "quantity": 1}
+
+    responses = await asyncio.gather(
+        *(client.post("/api/v1/reservations", json=body) for _ in range(10))
+    )
+
+    held = [r.json()["warehouseId"] for r in responses if r.status_code == 201]
+    assert sorted(held) == sorted([near["id"]] * 3 + [far["id"]] * 5)
+    assert sum(r.status_code == 400 for r in responses) == 2
+
+    nearest = await client.get("/api/v1/warehouse/nearest", params={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 1
+    })
+    assert nearest.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_reservations_expire_confirm_and_write_behind(client, db_session):
+    seller, product, (warehouse,) = await _seed(client, [10])
+    body = {"sellerId": seller["id"], "productId": product["id"], "quantity": 4}
+
+    confirmed = (await client.post("/api/v1/reservations", json=body)).json()
+    expiring = (await client.post("/api/v1/reservations", json=body)).json()
+    released = (await client.post("/api/v1/reservations", json={**body, "quantity": 2})).json()
+
+    response = await client.post(
+        f"/api/v1/reservations/{confirmed['reservationId']}/confirm"
+    )
+    assert response.json()["status"] == "confirmed"
+
+    response = await client.delete(f"/api/v1/reservations/{released['reservationId']}")
+    assert response.json()["status"] == "released"
+
+    # Nothing is written to Postgres until the flush
+    assert await _units(db_session, warehouse, product) == 10
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 2
+
+    assert await stock_mirror.release_expired(now=time.time() + 3600) >= 1
+    response = await client.post(
+        f"/api/v1/reservations/{expiring['reservationId']}/confirm"
+    )
+    assert response.status_code == 404
+
+    # A dropped mirror reloads from Postgres plus the unflushed deltas
+    await cache.r.delete(stock_mirror.STOCK_KEY.format(product["id"]))
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 6
+
+    assert await stock_mirror.flush() >= 1
+    assert await _units(db_session, warehouse, product) == 6
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 6
+
+
+@pytest.mark.asyncio
+async def test_cached_ladder_follows_reservations(client):
+    seller, product, (near, far) = await _seed(client, [3, 5])
+    params = {"sellerId": seller["id"], "productId": product["id"], "quantity": 3}
+
+    async def nearest():
+        response = await client.get("/api/v1/warehouse/nearest", params=params)
+        return response.json()["warehouseId"]
+
+    assert await nearest() == near["id"]
+    assert await nearest() == near["id"]
+
+    reservation = (await client.post("/api/v1/reservations", json={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 1
+    })).json()
+    assert reservation["warehouseId"] == near["id"]
+    assert await nearest() == far["id"]
+
+    await client.delete(f"/api/v1/reservations/{reservation['reservationId']}")
+    assert await nearest() == near["id"]
+
+
+@pytest.mark.asyncio
+async def test_admin_writes_replace_deltas_being_flushed(client, db_session, monkeypatch):
+    seller, product, (warehouse,) = await _seed(client, [10])
+    reserve = {"sellerId": seller["id"], "productId": product["id"], "quantity": 4}
+    inventory = {"warehouse_id": warehouse["id"], "product_id": product["id"]}
+
+    await client.post("/api/v1/reservations", json=reserve)
+
+    entered = asyncio.Event()
+    proceed = asyncio.Event()
+    open_session = database.background_session
+
+    @asynccontextmanager
+    async def held_session():
+        entered.set()
+        await proceed.wait()
+        async with open_session() as db:
+            yield db
+
+    # The flush has taken the -4 delta and is about to apply it
+    monkeypatch.setattr(database, "background_session", held_session)
+    flushing = asyncio.create_task(stock_mirror.flush())
+    await entered.wait()
+
+    writing = asyncio.create_task(client.post(
+        "/api/v1/admin/inventory", json={**inventory, "available_units": 50}
+    ))
+    await asyncio.sleep(0.05)
+    assert not writing.done()
+
+    proceed.set()
+    await flushing
+    assert (await writing).status_code == 200
+    monkeypatch.undo()
+
+    assert await _units(db_session, warehouse, product) == 50
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 50
+
+    # A failed flush leaves its batch behind; an admin write replaces it too
+    await client.post("/api/v1/reservations", json=reserve)
+
+    @asynccontextmanager
+    async def failing_session():
+        raise ConnectionError("database unavailable")
+        yield
+
+    monkeypatch.setattr(database, "background_session", failing_session)
+    with pytest.raises(ConnectionError):
+        await stock_mirror.flush()
+    monkeypatch.undo()
+
+    response = await client.post(
+        "/api/v1/admin/inventory", json={**inventory, "available_units": 30}
+    )
+    assert response.status_code == 200
+
+    await stock_mirror.flush()
+    assert await _units(db_session, warehouse, product) == 30
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 30
+
+
+@pytest.mark.asyncio
+async def test_flush_that_lost_its_outcome_is_not_applied_twice(client, db_session, monkeypatch):
+    seller, product, (warehouse,) = await _seed(client, [10])
+    await client.post("/api/v1/reservations", json={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 4
+    })
+
+    evaluate = cache.r.eval
+
+    async def lose_settlement(script, *args):
+        if script == stock_mirror._END_FLUSH and args[-1]:
+            raise ConnectionError("connection reset")
+        return await evaluate(script, *args)
+
+    # The batch commits, but Redis never hears about it
+    monkeypatch.setattr(cache.r, "eval", lose_settlement)
+    with pytest.raises(ConnectionError):
+        await stock_mirror.flush()
+    monkeypatch.undo()
+
+    assert await _units(db_session, warehouse, product) == 6
+    assert int(await cache.r.get(stock_mirror.EPOCH_KEY)) % 2 == 1
+
+    assert await stock_mirror.flush() == 0
+    assert await _units(db_session, warehouse, product) == 6
+    assert int(await cache.r.get(stock_mirror.EPOCH_KEY)) % 2 == 0
+    assert not await cache.r.exists(stock_mirror.FLUSHING_KEY)
+
+    await cache.r.delete(stock_mirror.STOCK_KEY.format(product["id"]))
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 6
+
+
+@pytest.mark.asyncio
+async def test_bulk_inventory_keeps_deltas_taken_after_a_batch(client, db_session, monkeypatch):
+    seller, product, (first, second) = await _seed(client, [10, 10])
+    monkeypatch.setattr(bulk_ingest, "BULK_BATCH_SIZE", 1)
+
+    async def body():
+        yield json.dumps({
+            "warehouse_id": first["id"], "product_id": product["id"], "available_units": 20
+        }).encode() + b"\n"
+
+        # The first batch has committed; a checkout holds 4 of its units
+        # before the second batch arrives
+        assert await stock_mirror.reserve(db_session, product["id"], 4, [first["id"]])
+
+        yield json.dumps({
+            "warehouse_id": second["id"], "product_id": product["id"], "available_units": 30
+        }).encode() + b"\n"
+
+    response = await client.post("/api/v1/admin/inventory/bulk", content=body())
+    assert response.json()["written"] == 2
+
+    units = await stock_mirror.get_units(db_session, product["id"])
+    assert (units[first["id"]], units[second["id"]]) == (16, 30)
+
+    await stock_mirror.flush()
+    assert await _units(db_session, first, product) == 16
+    assert await _units(db_session, second, product) == 30
+
+
+@pytest.mark.asyncio
+async def test_holds_superseded_by_an_admin_write_return_nothing(client, db_session):
+    seller, product, (warehouse,) = await _seed(client, [10])
+    reserve = {"sellerId": seller["id"], "productId": product["id"], "quantity": 3}
+    inventory = {"warehouse_id": warehouse["id"], "product_id": product["id"]}
+
+    before = (await client.post("/api/v1/reservations", json=reserve)).json()
+    await client.post("/api/v1/admin/inventory", json={**inventory, "available_units": 20})
+    after = (await client.post("/api/v1/reservations", json=reserve)).json()
+
+    # The new count already includes the earlier hold; the later one returns
+    await client.delete(f"/api/v1/reservations/{before['reservationId']}")
+    await client.delete(f"/api/v1/reservations/{after['reservationId']}")
+    assert (await stock_mirror.get_units(db_session, product["id"]))[warehouse["id"]] == 20
+
+    await stock_mirror.flush()
+    assert await _units(db_session, warehouse, product) == 20
@@ -0,0 +1,116 @@
+import pytest
+from sqlalchemy import select
+from app.models import Customer, CustomerServiceability
+from app.services import serviceability
+from app.utils.distance import haversine
+
+
+async def _stored_pairs(db_session, customers):
+    rows = (await db_session.execute(
+        select(
+            CustomerServiceability.customer_id,
+            CustomerServiceability.warehouse_id,
+            CustomerServiceability.distance_km
+        ).where(CustomerServiceability.customer_id.in_(customers))
+    )).all()
+    return {(c, w): d for c, w, d in rows}
+
+
+@pytest.mark.asyncio
+async def test_unserviceable_customer_is_rejected_before_the_search(client, query_budget):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Radius Seller", "latitude": 26.85, "longitude": 80.95
+    })).json()
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Radius_WH", "latitude": 26.80, "longitude": 80.90, "capacity": 10
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Far Item", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+    await client.post("/api/v1/admin/inventory", json={
+        "warehouse_id": warehouse["id"], "product_id": product["id"], "available_units": 5
+    })
+    far = (await client.post("/api/v1/admin/customer", json={
+        "name": "Sydney Kirana", "latitude": -33.87, "longitude": 151.21
+    })).json()
+    request = {
+        "sellerId": seller["id"], "customerId": far["id"], "productId": product["id"],
+        "quantity": 1, "deliverySpeed": "standard"
+    }
+
+    # Entity lookups only: no stock or distance work
+    with query_budget(3):
+        response = await client.post("/api/v1/shipping-charge/calculate", json=request)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Delivery location not supported."
+
+    # An unknown product is reported first, as the batch CLI does
+    response = await client.post(
+        "/api/v1/shipping-charge/calculate", json={**request, "productId": 10 ** 9}
+    )
+    assert response.json()["detail"] == "Product not found"
+
+    # A warehouse opening near the customer extends its cached set in place
+    local = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Sydney_WH", "latitude": -33.90, "longitude": 151.10, "capacity": 10
+    })).json()
+
+    assert await serviceability.warehouses_in_range(None, far["id"]) == 1
+    assert await serviceability.distance(None, far["id"], local["id"]) == pytest.approx(
+        haversine(-33.90, 151.10, -33.87, 151.21)
+    )
+    assert await serviceability.distance(None, far["id"], warehouse["id"]) is None
+
+
+@pytest.mark.asyncio
+async def test_bulk_backfill_matches_incremental_updates(client, db_session):
+    customers = set()
+    for i in range(3):
+        customers.add((await client.post("/api/v1/admin/customer", json={
+            "name": f"Backfill Customer {i}", "latitude": 10.0 + i * 9, "longitude": 76.0
+        })).json()["id"])
+        await client.post("/api/v1/admin/warehouse", json={
+            "name": f"Backfill_WH_{i}", "latitude": 11.0 + i * 9, "longitude": 77.0,
+            "capacity": 10
+        })
+
+    incremental = await _stored_pairs(db_session, customers)
+
+    # Loaded around /admin: no serviceability rows until a rebuild
+    raw = Customer(name="Raw Customer", latitude=10.5, longitude=76.5)
+    db_session.add(raw)
+    await db_session.commit()
+    assert await serviceability.warehouses_in_range(db_session, raw.id) == 0
+
+    response = await client.post("/api/v1/admin/serviceability/rebuild")
+    assert response.status_code == 200
+    assert response.json()["rows"] >= 8
+
+    rebuilt = await _stored_pairs(db_session, customers)
+    assert await serviceability.warehouses_in_range(db_session, raw.id) >= 1
+
+    # Neighbouring rows are ~1000 km apart, inside the radius; the ends
+    # are ~2100 km apart, outside it
+    assert len(rebuilt) >= 8
+    assert rebuilt.keys() == incremental.keys()
+    for pair, distance in rebuilt.items():
+        assert distance == pytest.approx(incremental[pair])
+
+
+@pytest.mark.asyncio
+async def test_failed_serviceability_write_rolls_back_the_entity(client, db_session, monkeypatch):
+    async def failing_insert(db, rows):
+        raise RuntimeError("serviceability insert failed")
+
+    monkeypatch.setattr(serviceability, "_insert", failing_insert)
+
+    response = await client.post("/api/v1/admin/customer", json={
+        "name": "Atomic Customer", "latitude": 12.97, "longitude": 77.59
+    })
+    assert response.status_code == 500
+
+    stored = (await db_session.execute(
+        select(Customer.id).where(Customer.name == "Atomic Customer")
+    )).all()
+    assert stored == []
@@ -1,3 +1,4 @@
+import json
 import pytest
 
 
@@ -20,3 +21,271 @@ async def test_invalid_warehouse(client):
         }
     )
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_batch_matches_single_item_route(client):
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Batch_WH", "latitude": 12.9762, "longitude": 77.6033, "capacity": 100
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Batch Kirana", "latitude": 19.0760, "longitude": 72.8777
+    })).json()
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Batch Seller", "latitude": 12.9716, "longitude": 77.5946
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Rice Bag", "weight": 10,
+        "length": 100, "width": 50, "height": 40
+    })).json()
+
+    items = [
+        {
+            "warehouseId": warehouse["id"],
+            "customerId": customer["id"],
+            "productId": product["id"],
+            "quantity": quantity,
+            "deliverySpeed": speed
+        }
+        for quantity in (1, 7)
+        for speed in ("standard", "express")
+    ]
+    items.append({**items[0], "customerId": 999999})
+
+    response = await client.post("/api/v1/shipping-charge/batch", json={"items": items})
+    assert response.status_code == 200
+    results = response.json()["results"]
+
+    for item, result in zip(items[:-1], results):
+        single = await client.get("/api/v1/shipping-charge", params=item)
+        assert result == single.json()
+
+    assert results[-1] == {"error": {"status": 404, "detail": "Customer not found"}}
+
+
+@pytest.mark.asyncio
+async def test_inventory_write_invalidates_cached_quote(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Gen Seller", "latitude": 28.61, "longitude": 77.20
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "Gen Kirana", "latitude": 28.70, "longitude": 77.10
+    })).json()
+    near = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Gen_Near", "latitude": 28.62, "longitude": 77.21, "capacity": 10
+    })).json()
+    far = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Gen_Far", "latitude": 26.91, "longitude": 75.78, "capacity": 10
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Atta", "weight": 5,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+
+    for warehouse, units in ((near, 0), (far, 50)):
+        await client.post("/api/v1/admin/inventory", json={
+            "warehouse_id": warehouse["id"],
+            "product_id": product["id"],
+            "available_units": units
+        })
+
+    request = {
+        "sellerId": seller["id"],
+        "customerId": customer["id"],
+        "productId": product["id"],
+        "quantity": 2,
+        "deliverySpeed": "standard"
+    }
+
+    first = (await client.post("/api/v1/shipping-charge/calculate", json=request)).json()
+    assert first["nearestWarehouse"]["warehouseId"] == far["id"]
+
+    await client.post("/api/v1/admin/inventory", json={
+        "warehouse_id": near["id"], "product_id": product["id"], "available_units": 10
+    })
+
+    second = (await client.post("/api/v1/shipping-charge/calculate", json=request)).json()
+    assert second["nearestWarehouse"]["warehouseId"] == near["id"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_inventory_upserts_and_reports_bad_rows(client):
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Bulk_WH", "latitude": 22.57, "longitude": 88.36, "capacity": 10
+    })).json()
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Bulk Seller", "latitude": 22.50, "longitude": 88.30
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Tea", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+
+    body = (
+        "warehouse_id,product_id,available_units\n"
+        f"{warehouse['id']},{product['id']},5\n"
+        f"{warehouse['id']},{product['id']},-1\n"
+        f"{warehouse['id']},{product['id']},40\n"
+    )
+    response = await client.post(
+        "/api/v1/admin/inventory/bulk",
+        content=body,
+        headers={"content-type": "text/csv"}
+    )
+    summary = response.json()
+
+    assert (summary["processed"], summary["written"], summary["failed"]) == (3, 2, 1)
+    assert summary["errors"][0]["line"] == 3
+
+    nearest = await client.get("/api/v1/warehouse/nearest", params={
+        "sellerId": seller["id"], "productId": product["id"], "quantity": 40
+    })
+    assert nearest.json()["warehouseId"] == warehouse["id"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_csv_reads_quoted_newlines_and_reports_bad_bytes(client):
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "CSV Seller", "latitude": 19.07, "longitude": 72.87
+    })).json()
+
+    body = (
+        "seller_id,name,weight,length,width,height\n"
+        f'{seller["id"]},"Gift Box, ""Deluxe""\nTwo lines",1,10,10,10\n'
+    ).encode("utf-8") + (
+        f"{seller['id']},Caf\xe9,1,10,10,10\n".encode("latin-1")
+    ) + f"{seller['id']},Plain,1,10,10,10\n".encode("utf-8")
+
+    response = await client.post(
+        "/api/v1/admin/product/bulk",
+        content=body,
+        headers={"content-type": "text/csv"}
+    )
+    summary = response.json()
+
+    assert (summary["processed"], summary["written"], summary["failed"]) == (3, 2, 1)
+    assert summary["errors"][0]["line"] == 4
+    assert "UTF-8" in summary["errors"][0]["error"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_lines_are_joined_across_chunks():
+    from app.services.bulk_ingest import iter_lines
+
+    async def chunks():
+        for chunk in (b"ab", b"c", b"d\nef\n", b"\ng", b"h"):
+            yield chunk
+
+    assert [line async for line in iter_lines(chunks())] == [b"abcd", b"ef", b"", b"gh"]
+
+
+@pytest.mark.asyncio
+async def test_shipping_charge_revalidates_with_etag(client, tmp_path):
+    from app.services import rate_card
+
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "ETag_WH", "latitude": 28.61, "longitude": 77.20, "capacity": 100
+    })).json()
+    customer = (await client.post("/api/v1/admin/customer", json={
+        "name": "ETag Kirana", "latitude": 26.91, "longitude": 75.78
+    })).json()
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "ETag Seller", "latitude": 28.70, "longitude": 77.10
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Tea Box", "weight": 2,
+        "length": 20, "width": 20, "height": 20
+    })).json()
+    params = {
+        "warehouseId": warehouse["id"],
+        "customerId": customer["id"],
+        "productId": product["id"],
+        "quantity": 3,
+        "deliverySpeed": "standard"
+    }
+
+    first = await client.get("/api/v1/shipping-charge", params=params)
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert first.headers["cache-control"].startswith("max-age=")
+
+    cached = await client.get(
+        "/api/v1/shipping-charge", params=params, headers={"If-None-Match": etag}
+    )
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    other = await client.get(
+        "/api/v1/shipping-charge",
+        params={**params, "quantity": 4},
+        headers={"If-None-Match": etag}
+    )
+    assert other.status_code == 200
+    assert other.headers["etag"] != etag
+
+    # A reload that changes a rate but keeps the version still changes the tag
+    original = rate_card.current_rate_card()
+    spec = json.loads(open(rate_card.RATE_CARD_PATH, encoding="utf-8").read())
+    for mode in spec["modes"].values():
+        mode["rate"] *= 2
+    path = tmp_path / "rate_card.json"
+    path.write_text(json.dumps(spec))
+
+    try:
+        assert rate_card.reload_rate_card(path).version == original.version
+        repriced = await client.get(
+            "/api/v1/shipping-charge", params=params, headers={"If-None-Match": etag}
+        )
+    finally:
+        rate_card._current = original
+
+    assert repriced.status_code == 200
+    assert repriced.headers["etag"] != etag
+    assert repriced.json()["shippingCharge"] > first.json()["shippingCharge"]
+
+
+@pytest.mark.asyncio
+async def test_no_stock_is_cached_until_inventory_is_added(client, query_budget, monkeypatch):
+    from app.services import warehouse_service
+
+    builds = []
+    build_stock_ladder = warehouse_service.build_stock_ladder
+    monkeypatch.setattr(
+        warehouse_service,
+        "build_stock_ladder",
+        lambda *args: builds.append(args) or build_stock_ladder(*args)
+    )
+
+    seller = (await client.post("/api/v1/admin/seller", json={
+        "name": "Empty Seller", "latitude": 22.57, "longitude": 88.36
+    })).json()
+    warehouse = (await client.post("/api/v1/admin/warehouse", json={
+        "name": "Empty_WH", "latitude": 22.60, "longitude": 88.40, "capacity": 10
+    })).json()
+    product = (await client.post("/api/v1/admin/product", json={
+        "seller_id": seller["id"], "name": "Out Of Stock", "weight": 1,
+        "length": 10, "width": 10, "height": 10
+    })).json()
+    params = {"sellerId": seller["id"], "productId": product["id"], "quantity": 1}
+
+    first = await client.get("/api/v1/warehouse/nearest", params=params)
+    assert first.status_code == 400
+
+    with query_budget(0):
+        again = await client.get("/api/v1/warehouse/nearest", params=params)
+    assert again.status_code == 400
+    # The empty ladder was served from the cache, not rebuilt, and lives
+    # only briefly
+    assert len(builds) == 1
+    from app.cache import r
+    [key] = await r.keys(f"ladder:{seller['id']}:{product['id']}:*")
+    assert 0 < await r.ttl(key) <= warehouse_service.NEGATIVE_STOCK_TTL
+
+    await client.post("/api/v1/admin/inventory", json={
+        "warehouse_id": warehouse["id"], "product_id": product["id"], "available_units": 5
+    })
+
+    restocked = await client.get("/api/v1/warehouse/nearest", params=params)
+    assert restocked.status_code == 200
+    assert restocked.json()["warehouseId"] == warehouse["id"]
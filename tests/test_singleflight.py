@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app import cache, singleflight
+from app.singleflight import coalesce, get_or_compute, get_or_compute_stale
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_computation():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"shippingCharge": 42.0}
+
+    results = await asyncio.gather(*(coalesce("k", compute) for _ in range(20)))
+
+    assert calls == 1
+    assert all(result == {"shippingCharge": 42.0} for result in results)
+
+
+@pytest.mark.asyncio
+async def test_followers_receive_leader_error_and_key_is_released():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    results = await asyncio.gather(
+        *(coalesce("missing", failing) for _ in range(5)),
+        return_exceptions=True
+    )
+
+    assert all(isinstance(r, HTTPException) and r.status_code == 404 for r in results)
+
+    async def succeeding():
+        return 1
+
+    assert await coalesce("missing", succeeding) == 1
+
+
+@pytest.mark.asyncio
+async def test_empty_results_are_cache_hits():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return []
+
+    key = "ladder:empty-test"
+    await cache.r.delete(key)
+    for tier in cache._local_tiers:
+        tier.delete(key)
+
+    assert await get_or_compute(key, compute, 60) == []
+    assert await get_or_compute(key, compute, 60) == []
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_one_refresh_runs(setup_db):
+    calls = 0
+
+    async def compute(db):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    key = "ladder:swr-test"
+    await cache.r.delete(key)
+    for tier in cache._local_tiers:
+        tier.delete(key)
+
+    assert await get_or_compute_stale(key, compute, None, 0, 60) == 1
+
+    # Past the soft TTL: concurrent callers all get the stale value at once
+    stale = await asyncio.gather(
+        *(get_or_compute_stale(key, compute, None, 0, 60) for _ in range(10))
+    )
+    assert stale == [1] * 10
+
+    await asyncio.gather(*singleflight._refreshing.values())
+    assert calls == 2
+    assert (await cache.get_cached_data(key))["value"] == 2
@@ -0,0 +1,45 @@
+import random
+import pytest
+from app.services import warehouse_service
+from app.services.warehouse_index import WarehouseIndex
+from app.services.warehouse_service import build_stock_ladder
+from app.utils.distance import haversine
+
+
+def nearest_with_stock(stock, lat, lon, quantity):
+    eligible = [
+        (haversine(lat, lon, w_lat, w_lon), warehouse_id)
+        for warehouse_id, (w_lat, w_lon, units) in stock.items()
+        if units >= quantity
+    ]
+    return min(eligible)[1] if eligible else None
+
+
+def first_rung(ladder, quantity):
+    for warehouse_id, _, _, units in ladder:
+        if units >= quantity:
+            return warehouse_id
+    return None
+
+
+@pytest.mark.parametrize("warehouses", [20, 400])
+def test_ladder_answers_every_quantity_like_a_scan(monkeypatch, warehouses):
+    rng = random.Random(warehouses)
+    stock = {
+        i + 1: (rng.uniform(8, 35), rng.uniform(68, 97), rng.randint(1, 100))
+        for i in range(warehouses)
+    }
+
+    # Large candidate sets walk the spatial index instead of scanning
+    index = WarehouseIndex()
+    index.build([])
+    monkeypatch.setattr(warehouse_service, "warehouse_index", index)
+
+    for _ in range(20):
+        lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+        ladder = build_stock_ladder(lat, lon, stock)
+
+        assert [rung[3] for rung in ladder] == sorted({rung[3] for rung in ladder})
+
+        for quantity in (1, 5, 30, 60, 99, 100, 101):
+            assert first_rung(ladder, quantity) == nearest_with_stock(stock, lat, lon, quantity)
@@ -1,5 +1,8 @@
+import json
+import numpy as np
 import pytest
-from app.services.transport_strategy import transport_factory
+from app.services import rate_card
+from app.services.transport_strategy import transport_factory, transport_rates
 
 
 @pytest.mark.asyncio
@@ -18,3 +21,56 @@ async def test_truck_selection():
 async def test_airplane_override_express():
     strategy, mode = transport_factory(400, "express")
     assert mode == "Aeroplane"
+
+
+def test_band_bounds_are_inclusive():
+    assert transport_factory(100, "standard")[1] == "Mini Van"
+    assert transport_factory(100.001, "standard")[1] == "Truck"
+    assert transport_factory(500, "standard")[1] == "Truck"
+    assert transport_factory(300, "express")[1] == "Truck"
+    assert transport_factory(300.001, "express")[1] == "Aeroplane"
+
+
+def test_vectorized_rates_match_scalar_lookup():
+    spec = json.loads(open(rate_card.RATE_CARD_PATH, encoding="utf-8").read())
+    spec["bands"]["sameday"] = [
+        {"upToKm": 50, "mode": "truck"},
+        {"upToKm": None, "mode": "minivan"}
+    ]
+    card = rate_card.compile_rate_card(spec)
+
+    rng = np.random.default_rng(3)
+    distances = rng.uniform(0, 1500, 2000)
+    distances[:4] = (100, 300, 500, 0)
+    # "economy" has no bands of its own and falls back to standard
+    speeds = rng.choice(["standard", "express", "sameday", "economy"], 2000)
+
+    expected = [
+        transport_factory(d, speed, card)[0].rate
+        for d, speed in zip(distances.tolist(), speeds.tolist())
+    ]
+
+    assert transport_rates(distances, speeds, card).tolist() == expected
+
+
+def test_reload_swaps_card_and_rejects_invalid_files(tmp_path):
+    spec = json.loads(open(rate_card.RATE_CARD_PATH, encoding="utf-8").read())
+    original = rate_card.current_rate_card()
+
+    try:
+        spec["version"] = 2
+        spec["modes"]["truck"]["rate"] = 2.5
+        path = tmp_path / "rate_card.json"
+        path.write_text(json.dumps(spec))
+
+        assert rate_card.reload_rate_card(path).version == 2
+        assert transport_factory(200, "standard")[0].calculate(200, 2) == 1000
+
+        spec["bands"]["standard"][0]["upToKm"] = 900
+        path.write_text(json.dumps(spec))
+
+        with pytest.raises(ValueError):
+            rate_card.reload_rate_card(path)
+        assert rate_card.current_rate_card().version == 2
+    finally:
+        rate_card._current = original
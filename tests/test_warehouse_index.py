@@ -0,0 +1,65 @@
+import random
+from app.services.warehouse_index import WarehouseIndex, WarehousePoint
+from app.utils.distance import haversine
+
+
+def linear_scan(points, lat, lon, predicate=lambda p: True):
+    eligible = [
+        (haversine(lat, lon, p.latitude, p.longitude), p)
+        for p in points
+        if predicate(p)
+    ]
+    eligible.sort(key=lambda x: x[0])
+    return eligible
+
+
+def random_points(rng, n):
+    return [
+        WarehousePoint(i + 1, rng.uniform(8, 35), rng.uniform(68, 97))
+        for i in range(n)
+    ]
+
+
+def test_nearest_matches_linear_scan():
+    rng = random.Random(7)
+    points = random_points(rng, 500)
+    index = WarehouseIndex()
+    index.build(points)
+
+    for _ in range(200):
+        lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+        predicate = lambda p: p.id % 3 == 0
+
+        distance, point = index.nearest(lat, lon, predicate)
+        expected_distance, expected = linear_scan(points, lat, lon, predicate)[0]
+
+        assert point.id == expected.id
+        assert distance == expected_distance
+
+
+def test_k_nearest_includes_pending_inserts():
+    rng = random.Random(11)
+    points = random_points(rng, 100)
+    index = WarehouseIndex()
+    index.build(points[:50])
+
+    for point in points[50:]:
+        index.add(point.id, point.latitude, point.longitude)
+
+    found = index.k_nearest(20.0, 80.0, 10)
+    expected = linear_scan(points, 20.0, 80.0)[:10]
+
+    assert [p.id for _, p in found] == [p.id for _, p in expected]
+
+
+def test_ties_resolve_to_lowest_id():
+    index = WarehouseIndex()
+    index.build([
+        WarehousePoint(5, 12.9, 77.6),
+        WarehousePoint(2, 12.9, 77.6),
+        WarehousePoint(9, 13.5, 77.6),
+    ])
+
+    _, point = index.nearest(12.0, 77.0)
+
+    assert point.id == 2